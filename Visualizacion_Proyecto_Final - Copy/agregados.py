@@ -0,0 +1,402 @@
+"""Cubo de agregados compartido por todas las páginas del dashboard.
+
+Se construye una vez por versión de los datos y las páginas leen de aquí
+tablas pequeñas ya agregadas en lugar de agrupar la tabla completa en cada
+recarga de Streamlit. Las tablas de detalle por tienda o estado se guardan
+ordenadas por esa clave junto con un índice de particiones, de forma que
+seleccionar una tienda o un estado es un corte de filas y no un filtro.
+
+Todas las medidas son sumas, así que el cubo también se puede construir
+plegando bloques de filas uno a uno (construir_cubo_por_bloques) cuando el
+dataset no cabe en memoria, o sumando los niveles base de cada parte CSV por
+separado para que al llegar una parte nueva solo haya que agregar esa.
+
+La estacionalidad (medias por semana, día de la semana y mes) sale de
+agregados diarios: sumas y conteos por fecha, y por fecha x estado y fecha x
+familia. Como la media es suma / conteo, cualquier media se obtiene de ellos
+exactamente en un recorrido del orden de los días y no de las filas, también
+con los filtros de la barra lateral (estacionalidad_filtrada).
+
+El efecto de las promociones (promociones.py) sale de otro nivel base con
+conteos, sumas y sumas de cuadrados de las ventas por tienda x familia x día
+de la semana, con y sin promoción.
+"""
+import logging
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from datos import (
+    FILAS_BLOQUE, PROCESOS, concatenar, en_paralelo, ficheros_csv,
+    leer_trozo_por_bloques, rss_max_mb, trozos_csv
+)
+from promociones import CLAVES_CELDA, CLAVES_PROMO, MEDIDAS_PROMO, tablas_uplift
+from ranking import top_k_por_grupo
+
+# Medidas que se suman en todos los niveles del cubo
+MEDIDAS = ["sales", "transactions", "n_filas", "n_ventas", "n_promo", "sales_promo"]
+
+# Claves del nivel base: un registro por tienda y día. La familia se resume
+# aparte porque multiplica por ~33 el tamaño del nivel base.
+CLAVES_DIA_TIENDA = [
+    "date", "year", "month", "month_name", "week", "day_of_week",
+    "store_nbr", "state", "store_type", "holiday_type", "es_festivo"
+]
+
+# Campos de calendario de una fecha (los de festivo dependen de la tienda)
+CLAVES_DIA = ["date", "year", "month", "month_name", "week", "day_of_week"]
+
+# Medidas de los agregados diarios por familia: bastan para las medias
+MEDIDAS_DIA = ["sales", "n_ventas"]
+
+# Tablas de estacionalidad: clave de calendario de cada una
+ESTACIONALIDAD = {"semana": "week", "dia_semana": "day_of_week", "mes": "month_name"}
+
+# Cada cuántos bloques se combinan los agregados parciales en la carga por bloques
+COMBINAR_CADA = 16
+
+logger = logging.getLogger(__name__)
+
+# Tablas del cubo que se parten por entidad para las páginas de detalle
+PARTICIONES = {
+    "tiendas": "store_nbr",
+    "tienda_year": "store_nbr",
+    "tienda_familia": "store_nbr",
+    "tiendas_estado": "state",
+    "estado_year": "state",
+    "estado_familia": "state",
+    "dia_estado": "state",
+    "dia_familia": "family",
+    "ranking_tiendas_estado": "state",
+    "ranking_familias_estado": "state",
+    "uplift_tiendas": "state",
+    "uplift_estado_familia": "state",
+    "uplift_tienda_familia": "store_nbr",
+}
+
+
+def _agrupar(tabla, claves, medidas=MEDIDAS):
+    return tabla.groupby(claves, observed=True, dropna=False, sort=True)[medidas].sum()
+
+
+def construir_cubo(df):
+    """Recorre una vez el DataFrame de ventas y devuelve un dict de agregados.
+
+    - "dia_tienda": nivel base (día x tienda) con todas las medidas.
+    - "tienda_familia": ventas por tienda y familia.
+    - "dias", "dia_estado", "dia_familia": agregados diarios.
+    - "promo_celdas" y las tablas "uplift_*": efecto de las promociones.
+    - El resto son los resúmenes que usa cada página.
+    """
+    return completar_cubo(*agregar_base(df))
+
+
+def construir_cubo_por_bloques(rutas=None, filas_bloque=FILAS_BLOQUE, procesos=PROCESOS):
+    """Construye el cubo leyendo los CSV por bloques, sin cargarlos enteros.
+
+    La memoria máxima depende del tamaño de bloque y del tamaño de los
+    agregados, no del número de filas. En cubo["carga"] quedan las filas
+    leídas, las filas por segundo y el pico de memoria.
+    """
+    rutas = ficheros_csv() if rutas is None else rutas
+    inicio = time.perf_counter()
+    trozos = [trozo for ruta in rutas for trozo in trozos_csv(ruta)]
+    bases = en_paralelo(partial(_base_de_trozo, filas_bloque=filas_bloque), trozos, procesos)
+    cubo = completar_cubo(*combinar_bases(bases))
+    filas = int(cubo["dia_tienda"]["n_filas"].sum())
+    cubo["carga"] = _estadisticas_carga("todas las partes", filas, inicio)
+    return cubo
+
+
+def base_por_bloques(ruta, filas_bloque=FILAS_BLOQUE, procesos=PROCESOS):
+    """Niveles base de una parte CSV leída por bloques (None si está vacía).
+
+    Cada trozo de la parte se pliega en un proceso del pool y aquí solo se
+    suman sus niveles base, que son pequeños.
+    """
+    inicio = time.perf_counter()
+    bases = en_paralelo(
+        partial(_base_de_trozo, filas_bloque=filas_bloque), trozos_csv(ruta), procesos
+    )
+    bases = [base for base in bases if base is not None]
+    if not bases:
+        return None
+    base = combinar_bases(bases)
+    _estadisticas_carga(ruta, int(base[0]["n_filas"].sum()), inicio)
+    return base
+
+
+def _base_de_trozo(trozo, filas_bloque):
+    """Trabajo de cada proceso: pliega un trozo de CSV bloque a bloque."""
+    parciales = []
+    for bloque in leer_trozo_por_bloques(trozo, filas_bloque):
+        parciales.append(agregar_base(bloque))
+        del bloque
+        if len(parciales) >= COMBINAR_CADA:
+            parciales = [combinar_bases(parciales)]
+    return combinar_bases(parciales) if parciales else None
+
+
+def _estadisticas_carga(origen, filas, inicio):
+    segundos = time.perf_counter() - inicio
+    carga = {
+        "filas": filas,
+        "segundos": segundos,
+        "filas_por_segundo": filas / segundos if segundos else None,
+        "rss_max_mb": rss_max_mb(),
+    }
+    rss = carga["rss_max_mb"]
+    logger.info(
+        "Carga por bloques de %s: %d filas en %.1f s (%.0f filas/s), RSS máximo %s",
+        origen, filas, segundos, carga["filas_por_segundo"] or 0,
+        f"{rss:.0f} MB" if rss is not None else "no disponible"
+    )
+    return carga
+
+
+def agregar_base(df):
+    """Niveles base del cubo de un bloque.
+
+    Día x tienda, tienda x familia, día x familia y celdas de promoción
+    (tienda x familia x día de la semana x en promoción).
+    """
+    promo = df["onpromotion"] > 0
+    # Las sumas se acumulan en float64 aunque los datos vengan en float32
+    sales = df["sales"].astype("float64")
+    base = pd.DataFrame({
+        **{col: df[col] for col in CLAVES_DIA_TIENDA},
+        "sales": sales,
+        "transactions": df["transactions"].astype("float64"),
+        "n_filas": 1,
+        "n_ventas": sales.notna().astype("int64"),
+        "n_promo": promo.astype("int64"),
+        "sales_promo": sales.where(promo, 0.0),
+    })
+    dia_tienda = _agrupar(base, CLAVES_DIA_TIENDA).reset_index()
+    del base
+
+    tienda_familia = (
+        sales.groupby([df["store_nbr"], df["family"]], observed=True)
+        .sum()
+        .reset_index()
+    )
+    dia_familia = (
+        pd.DataFrame({"sales": sales, "n_ventas": sales.notna().astype("int64")})
+        .groupby([df["date"], df["family"]], observed=True)
+        .sum()
+        .reset_index()
+    )
+    promo_celdas = (
+        pd.DataFrame({
+            "n_ventas": sales.notna().astype("int64"),
+            "sales": sales,
+            "sales2": sales * sales,
+        })
+        .groupby([df[col] for col in CLAVES_CELDA] + [promo.rename("en_promo")], observed=True)
+        .sum()
+        .reset_index()
+    )
+    return dia_tienda, tienda_familia, dia_familia, promo_celdas
+
+
+def combinar_bases(bases):
+    """Suma en un solo nivel base los niveles parciales de varios bloques."""
+    bases = [base for base in bases if base is not None]
+    if not bases:
+        raise FileNotFoundError("No hay ficheros de ventas que cargar")
+    dia_tienda = concatenar([base[0] for base in bases])
+    tienda_familia = concatenar([base[1] for base in bases])
+    dia_familia = concatenar([base[2] for base in bases])
+    promo_celdas = concatenar([base[3] for base in bases])
+    return (
+        _agrupar(dia_tienda, CLAVES_DIA_TIENDA).reset_index(),
+        tienda_familia.groupby(["store_nbr", "family"], observed=True)["sales"]
+        .sum()
+        .reset_index(),
+        _agrupar(dia_familia, ["date", "family"], MEDIDAS_DIA).reset_index(),
+        _agrupar(promo_celdas, CLAVES_PROMO, MEDIDAS_PROMO).reset_index(),
+    )
+
+
+def completar_cubo(dia_tienda, tienda_familia, dia_familia, promo_celdas):
+    """Resúmenes de cada página y particiones a partir de los niveles base."""
+    dias = _agrupar(dia_tienda, CLAVES_DIA).reset_index()
+    # Calendario de cada fecha para los agregados diarios por estado y familia
+    calendario = dias[CLAVES_DIA]
+    dia_estado = (
+        _agrupar(dia_tienda, ["state", "date"]).reset_index().merge(calendario, on="date")
+    )
+    dia_familia = dia_familia.merge(calendario, on="date")
+    tiendas = _agrupar(dia_tienda, ["store_nbr", "state", "store_type"]).reset_index()
+    # Etiquetas de los gráficos, formateadas una vez por tienda
+    tiendas["store_label"] = etiquetas(tiendas["store_nbr"], "T. {}")
+    tiendas["store_nombre"] = etiquetas(tiendas["store_nbr"], "Tienda {}")
+    estado_familia = (
+        tienda_familia.merge(tiendas[["store_nbr", "state"]], on="store_nbr")
+        .groupby(["state", "family"], observed=True)["sales"]
+        .sum()
+        .reset_index()
+    )
+
+    cubo = {
+        "dia_tienda": dia_tienda,
+        "tienda_familia": tienda_familia,
+        "dias": dias,
+        "dia_estado": dia_estado,
+        "dia_familia": dia_familia,
+        "tiendas": tiendas,
+        "tiendas_estado": tiendas,
+        "familias": tienda_familia.groupby("family", observed=True)["sales"].sum(),
+        "estado_familia": estado_familia,
+        "tienda_year": _agrupar(dia_tienda, ["store_nbr", "year"]).reset_index(),
+        "estado_year": _agrupar(dia_tienda, ["state", "year"]).reset_index(),
+        "estados": _agrupar(dia_tienda, "state"),
+        "tipo_tienda": _agrupar(dia_tienda, "store_type"),
+        "year": _agrupar(dias, "year"),
+        **estacionalidad(dias),
+        "festivo": _agrupar(dia_tienda, "es_festivo"),
+        "festivo_dia": _agrupar(dia_tienda, ["holiday_type", "day_of_week"]).reset_index(),
+        # Rankings de la página de estado, de todos los estados a la vez
+        "ranking_tiendas_estado": top_k_por_grupo(tiendas, "state", "sales"),
+        "ranking_familias_estado": top_k_por_grupo(estado_familia, "state", "sales"),
+        # Uplift de las promociones de todos los estados, tiendas y familias
+        "promo_celdas": promo_celdas,
+        **tablas_uplift(promo_celdas, tiendas),
+    }
+
+    cubo["particiones"] = {}
+    for nombre, clave in PARTICIONES.items():
+        cubo[nombre], cubo["particiones"][nombre] = particionar(cubo[nombre], clave)
+    return cubo
+
+
+def estacionalidad(dias):
+    """Sumas y conteos por semana, día de la semana y mes de un agregado diario.
+
+    Sirve igual para cubo["dias"] que para el corte de un estado o una
+    familia (particion(cubo, "dia_estado", estado)); media() da las medias.
+    """
+    medidas = [col for col in MEDIDAS if col in dias]
+    return {
+        nombre: _agrupar(dias, clave, medidas) for nombre, clave in ESTACIONALIDAD.items()
+    }
+
+
+def estacionalidad_filtrada(cubo, filtro):
+    """Tablas de estacionalidad con un filtro, sin volver a leer las filas.
+
+    Salen de los agregados diarios del cubo completo: dia_familia si se
+    filtran familias, dia_tienda si se filtran tiendas, dia_estado si se
+    filtran estados y dias si solo se filtran fechas. Familias junto con
+    tiendas o estados no se pueden separar en ellos: entonces devuelve None.
+    """
+    if filtro.familias and (filtro.tiendas or filtro.estados):
+        return None
+    if filtro.familias:
+        dias = pd.concat([particion(cubo, "dia_familia", familia) for familia in filtro.familias])
+    elif filtro.tiendas:
+        dias = cubo["dia_tienda"]
+        dentro = dias["store_nbr"].isin(filtro.tiendas)
+        if filtro.estados:
+            dentro &= dias["state"].isin(filtro.estados)
+        dias = dias[dentro]
+    elif filtro.estados:
+        dias = pd.concat([particion(cubo, "dia_estado", estado) for estado in filtro.estados])
+    else:
+        dias = cubo["dias"]
+    dias = dias[dias["date"].between(pd.Timestamp(filtro.desde), pd.Timestamp(filtro.hasta))]
+    return estacionalidad(dias)
+
+
+def etiquetas(valores, plantilla):
+    """Categórica con plantilla.format(valor): cada valor distinto se formatea una vez."""
+    codigos, unicos = pd.factorize(valores, sort=True)
+    return pd.Categorical.from_codes(codigos, [plantilla.format(valor) for valor in unicos])
+
+
+def particionar(tabla, clave):
+    """Ordena la tabla por clave y devuelve (tabla ordenada, {valor: slice de filas})."""
+    tabla = tabla.sort_values(clave, kind="stable").reset_index(drop=True)
+    valores = tabla[clave].to_numpy()
+    cortes = np.flatnonzero(valores[1:] != valores[:-1]) + 1
+    inicios = np.r_[0, cortes]
+    fines = np.r_[cortes, len(tabla)]
+    return tabla, {valores[i]: slice(i, f) for i, f in zip(inicios, fines) if i < f}
+
+
+def particion(cubo, nombre, valor):
+    """Filas de la tabla nombre del cubo con clave == valor, sin recorrer la tabla."""
+    if not isinstance(cubo, dict):
+        # Cubo de servicio.py: el corte lo hace el servicio
+        return cubo.particion(nombre, valor)
+    corte = cubo["particiones"][nombre].get(valor, slice(0, 0))
+    return cubo[nombre].iloc[corte]
+
+
+def media(tabla):
+    """Venta media por fila de la tabla original a partir de sumas y conteos."""
+    return tabla["sales"] / tabla["n_ventas"]
+
+
+def metricas_temporales(cubo):
+    """Todos los números de la página de evolución temporal de una vez.
+
+    Solo lee tablas del cubo (que salen de una única pasada por las filas) y
+    usa operaciones por columnas: los porcentajes de promoción son cocientes
+    de sumas y conteos en lugar de lambdas dentro del groupby.
+    """
+    ventas_year = cubo["year"]["sales"].sort_index()
+    # Con un solo año (p. ej. al filtrar por fechas) no hay crecimiento: NaN
+    crecimiento_pct = np.nan
+    if len(ventas_year) > 1:
+        crecimiento_pct = (ventas_year.iloc[-1] - ventas_year.iloc[-2]) / ventas_year.iloc[-2] * 100
+    pct_promo = cubo["year"]["sales_promo"].sum() / ventas_year.sum() * 100
+
+    # Ventas de cada estado en los dos últimos años y su crecimiento
+    crecimiento_estado = (
+        cubo["estado_year"]
+        .pivot(index="state", columns="year", values="sales")
+        .dropna()
+    )
+    if crecimiento_estado.shape[1] > 1:
+        crecimiento_estado["crecimiento"] = (
+            crecimiento_estado.iloc[:, -1] - crecimiento_estado.iloc[:, -2]
+        ) / crecimiento_estado.iloc[:, -2] * 100
+    else:
+        crecimiento_estado["crecimiento"] = np.nan
+    crecimiento = crecimiento_estado["crecimiento"].dropna()
+
+    estados = cubo["estados"]
+    promo_estado = pd.DataFrame({
+        "ventas": estados["sales"],
+        "promo": estados["n_promo"] / estados["n_filas"] * 100,
+        "transacciones": estados["transactions"],
+    }).reset_index()
+
+    eficiencia = pd.DataFrame({
+        "ventas_totales": cubo["tipo_tienda"]["sales"],
+        "tiendas": cubo["tiendas"].groupby("store_type", observed=True)["store_nbr"].nunique(),
+    })
+    eficiencia["ventas_por_tienda"] = eficiencia["ventas_totales"] / eficiencia["tiendas"]
+
+    festivo_dia = cubo["festivo_dia"]
+    festivo_dia = festivo_dia[festivo_dia["holiday_type"].notna()]
+
+    return {
+        "ventas_year": ventas_year,
+        "crecimiento_pct": crecimiento_pct,
+        "pct_promo": pct_promo,
+        "crecimiento_estado": crecimiento_estado,
+        "estado_top": crecimiento.idxmax() if len(crecimiento) else "—",
+        "estado_peor": crecimiento.idxmin() if len(crecimiento) else "—",
+        "promo_estado": promo_estado,
+        "uplift_estados": cubo["uplift_estados"].sort_values("uplift", ignore_index=True),
+        "eficiencia": eficiencia,
+        "festivos": media(cubo["festivo"]),
+        "festivos_dia_semana": media(
+            festivo_dia.groupby("day_of_week", observed=True)[MEDIDAS].sum()
+        ),
+        "festivo_dia": festivo_dia,
+    }
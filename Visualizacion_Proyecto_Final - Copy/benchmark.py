@@ -0,0 +1,542 @@
+"""Benchmarks del dashboard.
+
+    python benchmark.py temporal [repeticiones]
+
+Compara la secuencia de recorridos que hacía la página de evolución temporal
+(un groupby o filtro sobre todas las filas para cada número, con una lambda
+por estado) con la pasada única que construye el cubo más metricas_temporales,
+sobre los CSV del directorio actual.
+
+    python benchmark.py suite [--filas 1000000 10000000 50000000]
+                              [--dir bench_datos] [--salida bench.json]
+
+Genera datasets sintéticos con las mismas columnas que los CSV reales (una
+vez por tamaño; se reutilizan en las siguientes ejecuciones) y mide por
+separado, para cada tamaño:
+- la carga: ingesta al almacén Parquet y construcción del cubo con cada motor;
+- la fase de agregación de cada página (lo que calcula a partir del cubo);
+- la construcción de figuras, con AppTest: cada página se ejecuta con la
+  caché de figuras vacía y otra vez con la caché llena, y la diferencia es lo
+  que cuesta construirlas.
+Los resultados se escriben en JSON para poder comparar ejecuciones.
+
+    python benchmark.py carga [--sesiones 32] [--procesos 1 2 4 8]
+                              [--dir .] [--modos local servicio] [--salida carga.json]
+
+Prueba de carga: N sesiones simuladas (cada una recorre todas las páginas con
+AppTest) repartidas entre P procesos, que hacen de procesos de Streamlit, para
+cada P. En modo "local" cada proceso construye su propio cubo; en modo
+"servicio" se arranca servicio.py y los procesos solo le piden tablas. Da las
+sesiones por segundo, que deberían crecer con P hasta el número de núcleos.
+
+    python benchmark.py paridad [--filas 200000] [--dir bench_paridad]
+
+Comprueba que los motores DuckDB y Polars (los que estén instalados) dan los
+mismos niveles base que agregar_base sobre datos sintéticos.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.error
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from agregados import (
+    CLAVES_DIA_TIENDA, agregar_base, combinar_bases, construir_cubo, construir_cubo_por_bloques,
+    completar_cubo, media, metricas_temporales, particion
+)
+from consultas import base_duckdb, base_polars, duckdb, pl
+from datos import (
+    DIAS_SEMANA, actualizar_almacen, cargar_parte, cargar_ventas, ficheros_csv, rss_max_mb
+)
+from figuras import top_n_otros
+from promociones import CLAVES_PROMO
+from ranking import top_k
+from servicio import PUERTO, consultar_version
+
+DIAS = DIAS_SEMANA
+
+# Forma de los datos sintéticos: la de los CSV reales
+ESTADOS = [
+    "Azuay", "Bolivar", "Chimborazo", "Cotopaxi", "El Oro", "Esmeraldas", "Guayas",
+    "Imbabura", "Loja", "Los Rios", "Manabi", "Pastaza", "Pichincha", "Santa Elena",
+    "Santo Domingo de los Tsachilas", "Tungurahua"
+]
+FAMILIAS = [
+    "AUTOMOTIVE", "BABY CARE", "BEAUTY", "BEVERAGES", "BOOKS", "BREAD/BAKERY",
+    "CELEBRATION", "CLEANING", "DAIRY", "DELI", "EGGS", "FROZEN FOODS", "GROCERY I",
+    "GROCERY II", "HARDWARE", "HOME AND KITCHEN I", "HOME AND KITCHEN II",
+    "HOME APPLIANCES", "HOME CARE", "LADIESWEAR", "LAWN AND GARDEN", "LINGERIE",
+    "LIQUOR,WINE,BEER", "MAGAZINES", "MEATS", "PERSONAL CARE", "PET SUPPLIES",
+    "PLAYERS AND ELECTRONICS", "POULTRY", "PREPARED FOODS", "PRODUCE",
+    "SCHOOL AND OFFICE SUPPLIES", "SEAFOOD"
+]
+TIPOS_TIENDA = ["A", "B", "C", "D", "E"]
+TIPOS_FESTIVO = ["Holiday", "Event", "Additional", "Transfer", "Bridge", "Work Day"]
+DIAS_SINTETICOS = pd.date_range("2013-01-01", "2016-12-31", freq="D")
+FILAS_SUITE = [1_000_000, 10_000_000, 50_000_000]
+
+PAGINAS = [
+    "📈 Visualización Global", "📋​ Análisis por tienda", "🌐​ Análisis por Estado",
+    "📇​ Evolución Temporal"
+]
+
+
+def temporal_por_recorridos(df):
+    """Los números de la página tal y como se calculaban, recorriendo df cada vez."""
+    ventas_year = df.groupby("year")["sales"].sum().sort_index()
+    crecimiento_pct = (ventas_year.iloc[-1] - ventas_year.iloc[-2]) / ventas_year.iloc[-2] * 100
+    pct_promo = df[df["onpromotion"] > 0]["sales"].sum() / df["sales"].sum() * 100
+
+    crecimiento_estado = (
+        df.groupby(["state", "year"], observed=True)["sales"].sum()
+        .unstack()
+        .dropna()
+    )
+    crecimiento_estado["crecimiento"] = (
+        crecimiento_estado.iloc[:, -1] - crecimiento_estado.iloc[:, -2]
+    ) / crecimiento_estado.iloc[:, -2] * 100
+
+    promo_estado = (
+        df.groupby("state", observed=True)
+        .agg(
+            ventas=("sales", "sum"),
+            promo=("onpromotion", lambda x: (x > 0).mean() * 100),
+            transacciones=("transactions", "sum")
+        )
+        .reset_index()
+    )
+
+    eficiencia = (
+        df.groupby("store_type", observed=True)
+        .agg(ventas_totales=("sales", "sum"), tiendas=("store_nbr", "nunique"))
+    )
+    eficiencia["ventas_por_tienda"] = eficiencia["ventas_totales"] / eficiencia["tiendas"]
+
+    festivos = df.copy()
+    festivos["es_festivo"] = festivos["holiday_type"].notna()
+    ventas_festivos = festivos.groupby("es_festivo")["sales"].mean()
+
+    df_holiday = df[df["holiday_type"].notnull()]
+    festivos_dia_semana = (
+        df_holiday.groupby("day_of_week", observed=True)["sales"].mean().reindex(DIAS)
+    )
+    festivo_dia = (
+        df.groupby(["day_of_week", "holiday_type"], observed=True)
+        .agg(ventas=("sales", "sum"))
+        .reset_index()
+    )
+
+    return {
+        "crecimiento_pct": crecimiento_pct,
+        "pct_promo": pct_promo,
+        "estado_top": crecimiento_estado["crecimiento"].idxmax(),
+        "estado_peor": crecimiento_estado["crecimiento"].idxmin(),
+        "promo_estado": promo_estado,
+        "eficiencia": eficiencia,
+        "festivos": ventas_festivos,
+        "festivos_dia_semana": festivos_dia_semana,
+        "festivo_dia": festivo_dia,
+    }
+
+
+def temporal_en_una_pasada(df):
+    """Los mismos números a partir del cubo (una pasada por las filas)."""
+    return metricas_temporales(construir_cubo(df))
+
+
+def medir(funcion, *args, repeticiones=3):
+    """Mejor tiempo en segundos de varias ejecuciones y el último resultado."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def comprobar(antes, despues):
+    """Comprueba que las dos versiones dan los mismos KPI."""
+    for clave in ["crecimiento_pct", "pct_promo"]:
+        assert abs(antes[clave] - despues[clave]) <= 1e-6 * max(1, abs(antes[clave])), clave
+    for clave in ["estado_top", "estado_peor"]:
+        assert antes[clave] == despues[clave], clave
+    pd.testing.assert_series_equal(
+        antes["promo_estado"].set_index("state")["promo"],
+        despues["promo_estado"].set_index("state")["promo"],
+        check_names=False, check_index_type=False, check_categorical=False, rtol=1e-6
+    )
+
+
+def benchmark_temporal(df, repeticiones=3):
+    t_antes, antes = medir(temporal_por_recorridos, df, repeticiones=repeticiones)
+    t_despues, despues = medir(temporal_en_una_pasada, df, repeticiones=repeticiones)
+    # Lo que cuesta la página cuando el cubo ya está en caché
+    t_metricas, _ = medir(metricas_temporales, construir_cubo(df), repeticiones=repeticiones)
+    comprobar(antes, despues)
+    return {
+        "filas": len(df),
+        "recorridos_s": t_antes,
+        "cubo_y_metricas_s": t_despues,
+        "solo_metricas_s": t_metricas,
+    }
+
+
+# -------------------------------
+# SUITE
+# -------------------------------
+def generar_datos(filas, directorio, partes=2, semilla=0):
+    """Escribe parte_1.csv ... parte_N.csv con filas filas sintéticas (si no existen ya).
+
+    Cada día tiene una fila por tienda y familia, como los datos reales; el
+    número de tiendas crece con el tamaño pedido para cubrir 2013-2016.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    rutas = [os.path.join(directorio, f"parte_{i}.csv") for i in range(1, partes + 1)]
+    if all(os.path.exists(ruta) for ruta in rutas):
+        return rutas
+
+    rng = np.random.default_rng(semilla)
+    n_tiendas = -(-filas // (len(DIAS_SINTETICOS) * len(FAMILIAS)))
+    tiendas = np.arange(1, n_tiendas + 1)
+    estado_tienda = np.array(ESTADOS)[(tiendas * 7) % len(ESTADOS)]
+    tipo_tienda = np.array(TIPOS_TIENDA)[tiendas % len(TIPOS_TIENDA)]
+    festivos = pd.Series(
+        rng.choice(TIPOS_FESTIVO, len(DIAS_SINTETICOS)), index=DIAS_SINTETICOS
+    ).where(rng.random(len(DIAS_SINTETICOS)) < 0.08)
+
+    filas_dia = n_tiendas * len(FAMILIAS)
+    dias_parte = -(-filas // filas_dia // partes) or 1
+    dias_bloque = max(1, 1_000_000 // filas_dia)
+    pendientes = filas
+    for n, ruta in enumerate(rutas):
+        dias = DIAS_SINTETICOS[n * dias_parte:(n + 1) * dias_parte]
+        with open(ruta + ".tmp", "w", newline="") as f:
+            for i in range(0, len(dias), dias_bloque):
+                bloque = dias[i:i + dias_bloque]
+                n_filas = min(len(bloque) * filas_dia, pendientes)
+                if n_filas <= 0:
+                    break
+                fecha = np.repeat(bloque, filas_dia)[:n_filas]
+                tienda = np.tile(np.repeat(tiendas, len(FAMILIAS)), len(bloque))[:n_filas]
+                fechas = pd.DatetimeIndex(fecha)
+                df = pd.DataFrame({
+                    "date": fechas.strftime("%Y-%m-%d"),
+                    "store_nbr": tienda,
+                    "family": np.tile(FAMILIAS, len(bloque) * n_tiendas)[:n_filas],
+                    "sales": np.round(rng.gamma(2, 100, n_filas) * (tienda % 4 + 1), 3),
+                    "onpromotion": rng.poisson(0.5, n_filas),
+                    "state": estado_tienda[tienda - 1],
+                    "store_type": tipo_tienda[tienda - 1],
+                    "transactions": rng.integers(500, 3000, n_filas).astype("float64"),
+                    "holiday_type": festivos.reindex(fechas).to_numpy(),
+                    "year": fechas.year,
+                    "month": fechas.month,
+                    "week": fechas.isocalendar().week.to_numpy(),
+                    "day_of_week": fechas.day_name(),
+                })
+                df.to_csv(f, header=(i == 0), index=False)
+                pendientes -= n_filas
+        os.replace(ruta + ".tmp", ruta)
+    return rutas
+
+
+def agregaciones_paginas(cubo):
+    """Lo que calcula cada página a partir del cubo, sin construir figuras.
+
+    Las páginas de tienda y estado se miden para todas las selecciones y se
+    da el tiempo medio por selección.
+    """
+    def global_():
+        top_k(cubo["familias"])
+        top_k(cubo["tiendas"].set_index("store_label")["sales_promo"])
+        top_n_otros(cubo["tiendas"].set_index("store_label")["sales"])
+        media(cubo["semana"]), media(cubo["dia_semana"]), media(cubo["mes"])
+
+    def tienda(store):
+        particion(cubo, "tiendas", store).iloc[0]
+        particion(cubo, "tienda_year", store)[["year", "sales"]]
+
+    def estado(state):
+        particion(cubo, "estado_year", state)
+        particion(cubo, "ranking_tiendas_estado", state)[["store_nombre", "sales"]]
+        particion(cubo, "ranking_familias_estado", state).iloc[0]
+
+    def temporal():
+        metricas_temporales(cubo)
+
+    tiendas = list(cubo["tiendas"]["store_nbr"])
+    estados = list(cubo["estados"].index)
+    return {
+        PAGINAS[0]: medir(global_)[0],
+        PAGINAS[1]: medir(lambda: [tienda(t) for t in tiendas])[0] / len(tiendas),
+        PAGINAS[2]: medir(lambda: [estado(e) for e in estados])[0] / len(estados),
+        PAGINAS[3]: medir(temporal)[0],
+    }
+
+
+def medir_carga(rutas):
+    """Ingesta y construcción del cubo con cada motor disponible (segundos)."""
+    carga = {}
+    inicio = time.perf_counter()
+    actualizar_almacen(rutas)
+    carga["ingesta_parquet"] = time.perf_counter() - inicio
+
+    motores = {
+        "memoria": lambda: completar_cubo(*combinar_bases(
+            [agregar_base(cargar_parte(ruta)) for ruta in rutas]
+        )),
+        "bloques": lambda: construir_cubo_por_bloques(rutas),
+    }
+    if duckdb is not None:
+        motores["duckdb"] = lambda: completar_cubo(*base_duckdb(rutas))
+    if pl is not None:
+        motores["polars"] = lambda: completar_cubo(*base_polars(rutas))
+    cubo = None
+    for nombre, construir in motores.items():
+        carga[nombre], cubo = medir(construir, repeticiones=1)
+    return carga, cubo
+
+
+# Claves de cada nivel base, en el orden en que los devuelven los motores
+CLAVES_BASES = [CLAVES_DIA_TIENDA, ["store_nbr", "family"], ["date", "family"], CLAVES_PROMO]
+
+
+def _normalizar(tabla, claves):
+    """Tabla con las categorías como texto y ordenada por claves, para comparar."""
+    tabla = tabla.copy()
+    for col in tabla.select_dtypes("category"):
+        tabla[col] = tabla[col].astype(str)
+    return tabla.sort_values(claves, kind="stable").reset_index(drop=True)
+
+
+def paridad_motores(rutas):
+    """Compara los niveles base de cada motor instalado con los de agregar_base.
+
+    Devuelve {motor: "ok" o el primer error}.
+    """
+    actualizar_almacen(rutas)
+    referencia = combinar_bases([agregar_base(cargar_parte(ruta)) for ruta in rutas])
+    motores = {}
+    if duckdb is not None:
+        motores["duckdb"] = base_duckdb
+    if pl is not None:
+        motores["polars"] = base_polars
+    resultado = {}
+    for nombre, motor in motores.items():
+        try:
+            for claves, esperado, obtenido in zip(CLAVES_BASES, referencia, motor(rutas)):
+                assert list(obtenido.columns) == list(esperado.columns), list(obtenido.columns)
+                pd.testing.assert_frame_equal(
+                    _normalizar(obtenido, claves), _normalizar(esperado, claves),
+                    check_dtype=False, rtol=1e-9
+                )
+            resultado[nombre] = "ok"
+        except AssertionError as e:
+            resultado[nombre] = str(e)
+    return resultado
+
+
+def medir_paginas(directorio, motor="memoria", timeout=3600):
+    """Tiempo de cada página en AppTest con la caché de figuras vacía y llena."""
+    from streamlit.testing.v1 import AppTest
+
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fichero.py")
+    os.environ["VENTAS_MODO_CARGA"] = motor
+    # Todas las secciones se calculan, también las que por defecto esperan a abrirse
+    os.environ["VENTAS_MODO_SECCIONES"] = "marcadores"
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    try:
+        at = AppTest.from_file(app, default_timeout=timeout)
+        inicio = time.perf_counter()
+        at.run()
+        paginas = {"arranque": {"segundos": time.perf_counter() - inicio}}
+        for pagina in PAGINAS:
+            selector = [s for s in at.sidebar.selectbox if s.label == "Selecciona una sección"][0]
+            selector.set_value(pagina)
+            tiempos = []
+            for _ in range(2):  # la primera construye las figuras, la segunda las reutiliza
+                inicio = time.perf_counter()
+                at.run()
+                tiempos.append(time.perf_counter() - inicio)
+            paginas[pagina] = {
+                "con_figuras_s": tiempos[0],
+                "figuras_en_cache_s": tiempos[1],
+                "construccion_figuras_s": max(tiempos[0] - tiempos[1], 0.0),
+                "graficos": len(at.get("plotly_chart")),
+                "errores": [str(e.message) for e in at.exception],
+            }
+    finally:
+        os.chdir(anterior)
+    return paginas
+
+
+def _sesion(app, timeout):
+    """Trabajo de cada proceso: una sesión que visita todas las páginas (segundos por página)."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app, default_timeout=timeout)
+    inicio = time.perf_counter()
+    at.run()
+    tiempos = [time.perf_counter() - inicio]
+    for pagina in PAGINAS:
+        selector = [s for s in at.sidebar.selectbox if s.label == "Selecciona una sección"][0]
+        selector.set_value(pagina)
+        inicio = time.perf_counter()
+        at.run()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def _arrancar_servicio(puerto, espera=600):
+    """Lanza servicio.py en el directorio actual y espera a que responda."""
+    servicio = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servicio.py")
+    proceso = subprocess.Popen([sys.executable, servicio, "--puerto", str(puerto)])
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.perf_counter() + espera
+    while True:
+        try:
+            consultar_version(url)
+            return proceso, url
+        except (urllib.error.URLError, ConnectionError):
+            if proceso.poll() is not None or time.perf_counter() > limite:
+                proceso.terminate()
+                raise RuntimeError("El servicio de agregados no ha arrancado")
+            time.sleep(0.5)
+
+
+def prueba_carga(sesiones=32, procesos=(1, 2, 4, 8), directorio=".",
+                 modos=("local", "servicio"), timeout=3600):
+    """Sesiones por segundo con cada número de procesos y cada modo."""
+    # AppTest sustituye __main__ en los procesos, así que la tarea se envía
+    # como benchmark._sesion y no como __main__._sesion
+    from benchmark import _sesion as sesion
+
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fichero.py")
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "cpus": os.cpu_count(),
+        "sesiones": sesiones,
+        "modos": {},
+    }
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    os.environ["VENTAS_MODO_SECCIONES"] = "marcadores"
+    try:
+        for modo in modos:
+            servicio = None
+            if modo == "servicio":
+                servicio, os.environ["VENTAS_SERVICIO"] = _arrancar_servicio(PUERTO)
+            try:
+                filas = []
+                for n in procesos:
+                    # Procesos nuevos para cada n: cada uno empieza sin cachés
+                    inicio = time.perf_counter()
+                    with ProcessPoolExecutor(n) as pool:
+                        tiempos = list(pool.map(sesion, [app] * sesiones, [timeout] * sesiones))
+                    segundos = time.perf_counter() - inicio
+                    paginas = np.array([t[1:] for t in tiempos])
+                    filas.append({
+                        "procesos": n,
+                        "segundos": segundos,
+                        "sesiones_por_segundo": sesiones / segundos,
+                        "pagina_media_s": float(paginas.mean()),
+                        "pagina_p95_s": float(np.percentile(paginas, 95)),
+                    })
+                    print(json.dumps({"modo": modo, **filas[-1]}, ensure_ascii=False))
+                resultado["modos"][modo] = filas
+            finally:
+                os.environ.pop("VENTAS_SERVICIO", None)
+                if servicio is not None:
+                    servicio.terminate()
+                    servicio.wait()
+    finally:
+        os.chdir(anterior)
+    return resultado
+
+
+def suite(tamanos=FILAS_SUITE, directorio="bench_datos", motor="memoria"):
+    """Ejecuta la suite para cada tamaño y devuelve un dict listo para JSON."""
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+        "motor_app": motor,
+        "tamanos": [],
+    }
+    for filas in tamanos:
+        carpeta = os.path.join(directorio, str(filas))
+        inicio = time.perf_counter()
+        rutas = generar_datos(filas, carpeta)
+        generacion = time.perf_counter() - inicio
+        anterior = os.getcwd()
+        os.chdir(carpeta)
+        try:
+            carga, cubo = medir_carga(ficheros_csv())
+        finally:
+            os.chdir(anterior)
+        resultado["tamanos"].append({
+            "filas": filas,
+            "ficheros": [os.path.basename(ruta) for ruta in rutas],
+            "generacion_s": generacion,
+            "carga_s": carga,
+            "agregacion_s": agregaciones_paginas(cubo),
+            "paginas": medir_paginas(carpeta, motor),
+            "rss_max_mb": rss_max_mb(),
+        })
+        print(json.dumps(resultado["tamanos"][-1], ensure_ascii=False, indent=2))
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del dashboard")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    temporal = comandos.add_parser("temporal", help="recorridos sobre df frente al cubo")
+    temporal.add_argument("repeticiones", type=int, nargs="?", default=3)
+    completa = comandos.add_parser("suite", help="carga, agregación y figuras por tamaño")
+    completa.add_argument("--filas", type=int, nargs="+", default=FILAS_SUITE)
+    completa.add_argument("--dir", default="bench_datos")
+    completa.add_argument("--motor", default="memoria", help="VENTAS_MODO_CARGA de la app")
+    completa.add_argument("--salida", default="bench.json")
+    carga = comandos.add_parser("carga", help="sesiones simuladas con varios procesos")
+    carga.add_argument("--sesiones", type=int, default=32)
+    carga.add_argument("--procesos", type=int, nargs="+", default=[1, 2, 4, 8])
+    carga.add_argument("--dir", default=".", help="directorio con los CSV")
+    carga.add_argument("--modos", nargs="+", default=["local", "servicio"],
+                       choices=["local", "servicio"])
+    carga.add_argument("--salida", default="carga.json")
+    paridad = comandos.add_parser("paridad", help="mismos niveles base con cada motor")
+    paridad.add_argument("--filas", type=int, default=200_000)
+    paridad.add_argument("--dir", default="bench_paridad")
+    args = parser.parse_args()
+
+    if args.comando == "temporal":
+        resultado = benchmark_temporal(cargar_ventas(), args.repeticiones)
+        print(f"Filas: {resultado['filas']:,}")
+        print(f"Recorridos sobre df (antes):        {resultado['recorridos_s']:.3f} s")
+        print(f"Cubo + metricas_temporales:         {resultado['cubo_y_metricas_s']:.3f} s")
+        print(f"metricas_temporales con cubo hecho: {resultado['solo_metricas_s']:.4f} s")
+    elif args.comando == "paridad":
+        resultado = paridad_motores(generar_datos(args.filas, args.dir))
+        if not resultado:
+            print("No hay motores instalados que comparar (pip install duckdb polars)")
+        for motor, estado in resultado.items():
+            print(f"{motor}: {estado}")
+        sys.exit(any(estado != "ok" for estado in resultado.values()))
+    else:
+        if args.comando == "suite":
+            resultado = suite(args.filas, args.dir, args.motor)
+        else:
+            resultado = prueba_carga(args.sesiones, args.procesos, args.dir, args.modos)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.salida}")
@@ -0,0 +1,215 @@
+"""Motores DuckDB y Polars para los niveles base del cubo.
+
+Todo lo que muestran las páginas sale del cubo, y el cubo sale de cuatro
+consultas sobre las filas: día x tienda (CLAVES_DIA_TIENDA con MEDIDAS),
+tienda x familia, día x familia y las celdas de promoción (tienda x familia x
+día de la semana x en promoción). Aquí esas consultas se ejecutan directamente sobre los
+Parquet del almacén (o sobre los CSV si no hay pyarrow), sin cargar las filas
+en pandas:
+
+- base_duckdb: las consultas declaradas como SQL. DuckDB agrega en paralelo
+  con todos los núcleos y desborda a disco si no le cabe en memoria.
+- base_polars: las mismas consultas sobre un LazyFrame de Polars, cuyo plan
+  lee solo las columnas que usa (projection pushdown) y se ejecuta en
+  paralelo.
+
+El resultado tiene las mismas columnas y tipos que agregar_base, así que el
+resto del cubo se completa igual con cualquier motor.
+"""
+import logging
+import time
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # el motor duckdb es opcional
+    duckdb = None
+
+try:
+    import polars as pl
+except ImportError:  # el motor polars es opcional
+    pl = None
+
+from agregados import CLAVES_DIA_TIENDA, MEDIDAS
+from datos import (
+    COLUMNAS_CATEGORICAS, COLUMNAS_ENTERAS, DIAS_SEMANA, DIR_ALMACEN, calcular_calendario, pq,
+    ruta_parquet
+)
+from promociones import CLAVES_PROMO, MEDIDAS_PROMO
+
+logger = logging.getLogger(__name__)
+
+# Claves que se leen de las filas; los campos de calendario se derivan de la
+# fecha sobre el resultado, que ya es pequeño (un registro por tienda y día)
+CLAVES_SQL = ["date", "year", "month", "store_nbr", "state", "store_type", "holiday_type"]
+
+# Medidas del nivel base. Las sumas de grupos sin valores son 0, como en pandas
+MEDIDAS_SQL = {
+    "sales": "COALESCE(SUM(sales), 0)",
+    "transactions": "COALESCE(SUM(transactions), 0)",
+    "n_filas": "COUNT(*)",
+    "n_ventas": "COUNT(sales)",
+    "n_promo": "COUNT(*) FILTER (WHERE onpromotion > 0)",
+    "sales_promo": "COALESCE(SUM(sales) FILTER (WHERE onpromotion > 0), 0)",
+}
+
+SQL_DIA_TIENDA = """
+    SELECT {claves}, {medidas}
+    FROM {origen}
+    GROUP BY ALL
+"""
+
+SQL_TIENDA_FAMILIA = """
+    SELECT store_nbr, family, COALESCE(SUM(sales), 0) AS sales
+    FROM {origen}
+    WHERE store_nbr IS NOT NULL AND family IS NOT NULL
+    GROUP BY ALL
+    ORDER BY store_nbr, family
+"""
+
+SQL_DIA_FAMILIA = """
+    SELECT date, family, COALESCE(SUM(sales), 0) AS sales, COUNT(sales) AS n_ventas
+    FROM {origen}
+    WHERE date IS NOT NULL AND family IS NOT NULL
+    GROUP BY ALL
+    ORDER BY date, family
+"""
+
+# El día de la semana sale como número (0 = lunes) y se pasa a categoría al final
+SQL_PROMO_CELDAS = """
+    SELECT store_nbr, family, isodow(CAST(date AS DATE)) - 1 AS day_of_week,
+        COALESCE(onpromotion, 0) > 0 AS en_promo,
+        COUNT(sales) AS n_ventas, COALESCE(SUM(sales), 0) AS sales,
+        COALESCE(SUM(CAST(sales AS DOUBLE) * CAST(sales AS DOUBLE)), 0) AS sales2
+    FROM {origen}
+    WHERE store_nbr IS NOT NULL AND family IS NOT NULL AND date IS NOT NULL
+    GROUP BY ALL
+"""
+
+
+def _ficheros(rutas, directorio):
+    """Ficheros con las filas de las partes: sus Parquet o, sin pyarrow, los CSV."""
+    if pq is not None:
+        return [ruta_parquet(ruta, directorio) for ruta in rutas], "parquet"
+    return list(rutas), "csv"
+
+
+def _origen(rutas, directorio):
+    """Tabla de DuckDB con las filas de las partes."""
+    ficheros, formato = _ficheros(rutas, directorio)
+    lista = ", ".join("'" + fichero.replace("'", "''") + "'" for fichero in ficheros)
+    return f"read_{formato}([{lista}])"
+
+
+def _tipar(df):
+    """Mismos tipos que el nivel base de pandas (categorías, enteros compactos)."""
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df:
+            df[col] = df[col].astype("category")
+            if len(df[col].cat.categories) == 0:
+                df[col] = df[col].cat.set_categories(df[col].cat.categories.astype(str))
+    for col in COLUMNAS_ENTERAS:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+
+def base_duckdb(rutas, directorio=DIR_ALMACEN):
+    """Niveles base de las partes (los mismos que agregar_base), calculados en DuckDB.
+
+    Con pyarrow el almacén debe estar al día (actualizar_almacen).
+    """
+    if duckdb is None:
+        raise ImportError("El motor duckdb necesita el paquete duckdb (pip install duckdb)")
+    inicio = time.perf_counter()
+    origen = _origen(rutas, directorio)
+    medidas = ", ".join(f"{expr} AS {nombre}" for nombre, expr in MEDIDAS_SQL.items())
+    with duckdb.connect() as con:
+        dia_tienda = con.sql(
+            SQL_DIA_TIENDA.format(claves=", ".join(CLAVES_SQL), medidas=medidas, origen=origen)
+        ).df()
+        tienda_familia = con.sql(SQL_TIENDA_FAMILIA.format(origen=origen)).df()
+        dia_familia = con.sql(SQL_DIA_FAMILIA.format(origen=origen)).df()
+        promo_celdas = con.sql(SQL_PROMO_CELDAS.format(origen=origen)).df()
+    return _completar(
+        dia_tienda, tienda_familia, dia_familia, promo_celdas, "DuckDB", rutas, inicio
+    )
+
+
+def base_polars(rutas, directorio=DIR_ALMACEN):
+    """Niveles base de las partes (los mismos que agregar_base), calculados en Polars.
+
+    Con pyarrow el almacén debe estar al día (actualizar_almacen).
+    """
+    if pl is None:
+        raise ImportError("El motor polars necesita el paquete polars (pip install polars)")
+    inicio = time.perf_counter()
+    ficheros, formato = _ficheros(rutas, directorio)
+    filas = pl.scan_parquet(ficheros) if formato == "parquet" else pl.scan_csv(ficheros)
+    # Textos como String para agrupar igual venga la parte de Parquet o de CSV
+    filas = filas.with_columns(pl.col(COLUMNAS_CATEGORICAS).cast(pl.String))
+    fecha = pl.col("date").str.to_date() if formato == "csv" else pl.col("date").dt.date()
+
+    sales = pl.col("sales").cast(pl.Float64)
+    promo = pl.col("onpromotion").cast(pl.Float64).fill_null(0) > 0
+    dia_tienda = filas.group_by(CLAVES_SQL).agg(
+        sales.sum().alias("sales"),
+        pl.col("transactions").cast(pl.Float64).sum().alias("transactions"),
+        pl.len().cast(pl.Int64).alias("n_filas"),
+        sales.count().cast(pl.Int64).alias("n_ventas"),
+        promo.sum().cast(pl.Int64).alias("n_promo"),
+        sales.filter(promo).sum().alias("sales_promo"),
+    )
+    tienda_familia = (
+        filas.drop_nulls(["store_nbr", "family"])
+        .group_by(["store_nbr", "family"])
+        .agg(sales.sum().alias("sales"))
+        .sort(["store_nbr", "family"])
+    )
+    dia_familia = (
+        filas.drop_nulls(["date", "family"])
+        .group_by(["date", "family"])
+        .agg(sales.sum().alias("sales"), sales.count().cast(pl.Int64).alias("n_ventas"))
+        .sort(["date", "family"])
+    )
+    promo_celdas = (
+        filas.drop_nulls(["store_nbr", "family", "date"])
+        .group_by(
+            pl.col("store_nbr"), pl.col("family"),
+            (fecha.dt.weekday() - 1).alias("day_of_week"), promo.alias("en_promo")
+        )
+        .agg(
+            sales.count().cast(pl.Int64).alias("n_ventas"),
+            sales.sum().alias("sales"),
+            (sales * sales).sum().alias("sales2"),
+        )
+    )
+    # Los cuatro planes se ejecutan a la vez y comparten la lectura
+    resultados = pl.collect_all([dia_tienda, tienda_familia, dia_familia, promo_celdas])
+    return _completar(*(tabla.to_pandas() for tabla in resultados), "Polars", rutas, inicio)
+
+
+def _completar(dia_tienda, tienda_familia, dia_familia, promo_celdas, motor, rutas, inicio):
+    """Tipos, calendario y orden de agregar_base sobre el resultado de un motor."""
+    dia_tienda["date"] = pd.to_datetime(dia_tienda["date"])
+    dia_tienda = calcular_calendario(_tipar(dia_tienda))
+    dia_tienda = (
+        dia_tienda[CLAVES_DIA_TIENDA + MEDIDAS]
+        .sort_values(CLAVES_DIA_TIENDA, na_position="last", kind="stable")
+        .reset_index(drop=True)
+    )
+    logger.info(
+        "Consulta %s de %d partes: %d filas en %.1f s",
+        motor, len(rutas), int(dia_tienda["n_filas"].sum()), time.perf_counter() - inicio
+    )
+    dia_familia["date"] = pd.to_datetime(dia_familia["date"])
+    promo_celdas["day_of_week"] = pd.Categorical.from_codes(
+        promo_celdas["day_of_week"].astype("int8"), categories=DIAS_SEMANA, ordered=True
+    )
+    promo_celdas = (
+        _tipar(promo_celdas)[CLAVES_PROMO + MEDIDAS_PROMO]
+        .sort_values(CLAVES_PROMO, kind="stable")
+        .reset_index(drop=True)
+    )
+    return dia_tienda, _tipar(tienda_familia), _tipar(dia_familia), promo_celdas
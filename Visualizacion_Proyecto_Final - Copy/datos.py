@@ -0,0 +1,662 @@
+"""Ingesta de los ficheros de ventas del dashboard.
+
+Cada parte CSV se convierte una sola vez en su propio Parquet tipado
+(fechas como timestamp, textos como categorías codificadas con diccionario)
+que en los siguientes arranques se lee con memory-map en lugar de volver a
+parsear texto. Un manifiesto guarda qué partes se han ingerido, con su firma
+y su rango de fechas: al llegar una parte nueva (o cambiar una existente)
+solo se convierte esa.
+
+Al cargar se aplica un esquema compacto (categorías, enteros del menor ancho
+posible, float32 cuando no se pierde precisión y onpromotion booleano) y se
+informa en el log de la memoria antes y después. Los campos de calendario
+derivados de la fecha también se calculan aquí, una sola vez; el DataFrame
+resultante es de solo lectura para las páginas.
+
+Cada parte se divide en trozos de bytes que empiezan a principio de línea
+y los trozos se parsean en paralelo en un pool de procesos, con el esquema y
+las fechas ya aplicados dentro de cada proceso. Al ingerir, cada trozo se
+escribe en el Parquet de su parte en cuanto llega y se suelta, así que solo
+hay unos pocos trozos en memoria a la vez. Para datasets mayores que la
+RAM, leer_trozo_por_bloques() recorre un trozo en bloques de tamaño acotado
+para ir plegándolos en los agregados.
+
+Las filas completas (para los filtros) se comparten entre sesiones y procesos
+con tabla_compartida(): un fichero Arrow sin comprimir por versión de los
+datos, mapeado en memoria. Se escribe parte a parte desde el almacén Parquet,
+así que nunca están todas las filas en memoria a la vez.
+"""
+import glob
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow se lee directamente de los CSV
+    pa = None
+    pc = None
+    pq = None
+
+try:
+    import resource
+except ImportError:  # Windows no tiene el módulo resource
+    resource = None
+
+
+PATRON_CSV = "parte_*.csv"
+
+# Almacén columnar: un Parquet por parte CSV y el manifiesto de lo ingerido
+DIR_ALMACEN = "ventas_parquet"
+MANIFIESTO = "manifiesto.json"
+# Filas de todas las partes ordenadas por fecha, una por versión de los datos
+PATRON_COMPARTIDA = "ventas_{version}.arrow"
+
+# Filas por bloque en la lectura por bloques
+FILAS_BLOQUE = 1_000_000
+
+# Tamaño máximo del trozo de CSV que parsea cada proceso y número de procesos
+BYTES_TROZO = 128 * 1024 ** 2
+PROCESOS = os.cpu_count() or 1
+
+# Columnas de texto con pocos valores distintos
+COLUMNAS_CATEGORICAS = ["family", "state", "store_type", "holiday_type"]
+
+# Columnas enteras que se reducen al menor ancho que admiten sus valores
+COLUMNAS_ENTERAS = ["store_nbr", "year", "month"]
+
+# Columnas reales que pasan a float32 si el error máximo no supera este valor
+COLUMNAS_REALES = {"sales": 0.01, "transactions": 0.0}
+
+logger = logging.getLogger(__name__)
+
+MESES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+DIAS_SEMANA = [
+    "Monday", "Tuesday", "Wednesday",
+    "Thursday", "Friday", "Saturday", "Sunday"
+]
+
+# Se incrementa al cambiar el esquema para que se regeneren los Parquet viejos
+VERSION_ESQUEMA = 3
+
+
+def ficheros_csv(patron=PATRON_CSV):
+    """Partes CSV presentes, en orden numérico (parte_2 antes que parte_10)."""
+    def numero(ruta):
+        encontrado = re.search(r"(\d+)\D*$", os.path.basename(ruta))
+        return (int(encontrado.group(1)) if encontrado else -1, ruta)
+    return sorted(glob.glob(patron), key=numero)
+
+
+def firma_fichero(ruta):
+    """(ruta, tamaño, mtime) de un fichero; cambia si cambia el fichero."""
+    info = os.stat(ruta)
+    return (ruta, info.st_size, info.st_mtime_ns)
+
+
+def firma_fuentes(rutas=None):
+    """Firma de todas las partes CSV; cambia si se añade o cambia alguna."""
+    rutas = ficheros_csv() if rutas is None else rutas
+    return tuple(firma_fichero(ruta) for ruta in rutas)
+
+
+def version_datos(firma):
+    """Token corto que identifica una versión de los datos (para claves de caché)."""
+    return hashlib.sha1(repr(firma).encode()).hexdigest()[:12]
+
+
+def concatenar(partes):
+    """Concatena partes ya tipadas sin perder las categorías por el camino."""
+    for col in COLUMNAS_CATEGORICAS:
+        if col not in partes[0]:
+            continue
+        if all(p[col].dtype == partes[0][col].dtype for p in partes):
+            continue
+        if all(isinstance(p[col].dtype, pd.CategoricalDtype) for p in partes):
+            # Una parte sin valores (p. ej. sin festivos) tiene categorías vacías
+            # de otro tipo, así que unimos por valores y no con union_categoricals
+            categorias = sorted(set().union(*(p[col].cat.categories for p in partes)))
+            for p in partes:
+                p[col] = p[col].cat.set_categories(categorias)
+    return pd.concat(partes, ignore_index=True)
+
+
+def memoria_mb(df):
+    """Memoria real del DataFrame (incluidas las cadenas) en MB."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def rss_max_mb():
+    """Pico de memoria residente en MB del proceso o de cualquiera de sus
+    procesos hijos (None si no se puede medir)."""
+    if resource is None:
+        return None
+    pico = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Linux lo da en KB y macOS en bytes
+    return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+
+
+def _real_compacto(serie, error_max):
+    """La serie en float32 si el redondeo no supera error_max; si no, tal cual."""
+    compacta = serie.astype("float32")
+    error = np.abs(compacta.to_numpy(dtype="float64") - serie.to_numpy(dtype="float64"))
+    if np.nanmax(error, initial=0.0) <= error_max:
+        return compacta
+    return serie
+
+
+def aplicar_esquema(df):
+    """Convierte cada columna al tipo más compacto que conserva sus valores."""
+    df["date"] = pd.to_datetime(df["date"])
+    for col in COLUMNAS_CATEGORICAS:
+        df[col] = df[col].astype("category")
+        # Un trozo sin valores (p. ej. sin festivos) daría categorías numéricas
+        if len(df[col].cat.categories) == 0:
+            df[col] = df[col].cat.set_categories(df[col].cat.categories.astype(str))
+    for col in COLUMNAS_ENTERAS:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col, error_max in COLUMNAS_REALES.items():
+        df[col] = _real_compacto(df[col], error_max)
+    # Todas las páginas solo miran si hay promoción, no cuántos productos
+    df["onpromotion"] = df["onpromotion"].fillna(0) > 0
+    return calcular_calendario(df)
+
+
+def calcular_calendario(df):
+    """Añade los campos derivados de la fecha como columnas compactas.
+
+    month_name y day_of_week son categorías ordenadas (enero..diciembre,
+    lunes..domingo), week es la semana ISO y es_festivo indica si el día
+    tiene algún tipo de festivo.
+    """
+    fechas = df["date"].dt
+    df["month_name"] = pd.Categorical.from_codes(
+        fechas.month - 1, categories=MESES, ordered=True
+    )
+    df["day_of_week"] = pd.Categorical.from_codes(
+        fechas.dayofweek, categories=DIAS_SEMANA, ordered=True
+    )
+    df["week"] = fechas.isocalendar().week.astype("int8")
+    df["es_festivo"] = df["holiday_type"].notna()
+    return df
+
+
+def leer_csv(rutas=None):
+    """Lee y concatena las partes CSV aplicando el esquema compacto."""
+    rutas = ficheros_csv() if rutas is None else rutas
+    partes = []
+    antes = 0.0
+    for ruta in rutas:
+        parte = pd.read_csv(ruta)
+        antes += memoria_mb(parte)
+        partes.append(aplicar_esquema(parte))
+    df = concatenar(partes)
+    logger.info("Memoria ventas: %.1f MB -> %.1f MB", antes, memoria_mb(df))
+    return df
+
+
+def trozos_csv(ruta, bytes_trozo=BYTES_TROZO):
+    """Divide un CSV en trozos (ruta, inicio, fin) de bytes alineados a líneas.
+
+    El primer trozo empieza después de la cabecera; un CSV pequeño es un
+    único trozo y uno vacío no tiene ninguno.
+    """
+    tamano = os.path.getsize(ruta)
+    with open(ruta, "rb") as f:
+        f.readline()
+        cortes = [f.tell()]
+        while cortes[-1] + bytes_trozo < tamano:
+            f.seek(cortes[-1] + bytes_trozo)
+            f.readline()  # avanzamos hasta el principio de la línea siguiente
+            if f.tell() >= tamano:
+                break
+            cortes.append(f.tell())
+    return [
+        (ruta, inicio, fin)
+        for inicio, fin in zip(cortes, cortes[1:] + [tamano])
+        if inicio < fin
+    ]
+
+
+def _abrir_trozo(trozo):
+    """Nombres de columna del CSV y bytes del trozo."""
+    ruta, inicio, fin = trozo
+    with open(ruta, "rb") as f:
+        columnas = list(pd.read_csv(io.BytesIO(f.readline()), nrows=0).columns)
+        f.seek(inicio)
+        return columnas, io.BytesIO(f.read(fin - inicio))
+
+
+def leer_trozo(trozo):
+    """Trozo de CSV como DataFrame con el esquema compacto aplicado."""
+    columnas, contenido = _abrir_trozo(trozo)
+    return aplicar_esquema(pd.read_csv(contenido, names=columnas, header=None))
+
+
+def leer_trozo_por_bloques(trozo, filas_bloque=FILAS_BLOQUE):
+    """Recorre un trozo de CSV en bloques de como mucho filas_bloque filas.
+
+    Cada bloque sale ya con el esquema compacto aplicado; nunca hay más de un
+    bloque parseado en memoria a la vez.
+    """
+    columnas, contenido = _abrir_trozo(trozo)
+    for bloque in pd.read_csv(contenido, names=columnas, header=None, chunksize=filas_bloque):
+        yield aplicar_esquema(bloque)
+
+
+def en_paralelo(funcion, trozos, procesos=PROCESOS):
+    """Aplica funcion a cada trozo, en un pool de procesos si hay más de uno.
+
+    Los resultados salen en el mismo orden que los trozos. Se usa "spawn"
+    para no heredar por fork los hilos del servidor de Streamlit.
+    """
+    procesos = min(procesos, len(trozos))
+    if procesos <= 1:
+        return [funcion(trozo) for trozo in trozos]
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(procesos, mp_context=contexto) as pool:
+        return list(pool.map(funcion, trozos))
+
+
+def en_orden(funcion, trozos, procesos=PROCESOS):
+    """Como en_paralelo, pero entrega cada resultado en cuanto le toca.
+
+    Solo hay 2 x procesos trozos encargados a la vez: los resultados que
+    esperan a ser consumidos son como mucho esos, no los de todos los trozos.
+    """
+    procesos = min(procesos, len(trozos))
+    if procesos <= 1:
+        for trozo in trozos:
+            yield funcion(trozo)
+        return
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(procesos, mp_context=contexto) as pool:
+        encargados = deque()
+        for trozo in trozos:
+            if len(encargados) >= 2 * procesos:
+                yield encargados.popleft().result()
+            encargados.append(pool.submit(funcion, trozo))
+        while encargados:
+            yield encargados.popleft().result()
+
+
+def ruta_parquet(ruta_csv, directorio=DIR_ALMACEN):
+    """Parquet del almacén que corresponde a una parte CSV."""
+    nombre = os.path.splitext(os.path.basename(ruta_csv))[0]
+    return os.path.join(directorio, nombre + ".parquet")
+
+
+def leer_manifiesto(directorio=DIR_ALMACEN):
+    """Partes ya ingeridas: {nombre CSV: {firma, esquema, filas, desde, hasta}}."""
+    ruta = os.path.join(directorio, MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _temporal(ruta):
+    """Temporal de este proceso para escribir ruta y reemplazarla al final.
+
+    Lleva el pid: dos procesos del dashboard que ingieren a la vez no
+    escriben en el mismo temporal ni se reemplazan un fichero a medias.
+    """
+    return f"{ruta}.{os.getpid()}.tmp"
+
+
+def _guardar_manifiesto(manifiesto, directorio):
+    ruta = os.path.join(directorio, MANIFIESTO)
+    temporal = _temporal(ruta)
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _tabla_de_trozo(trozo):
+    """Trabajo de cada proceso: parsea un trozo y lo devuelve como tabla Arrow.
+
+    Devuelve también la memoria antes y después del esquema y el rango de
+    fechas, para el log y el manifiesto.
+    """
+    columnas, contenido = _abrir_trozo(trozo)
+    df = pd.read_csv(contenido, names=columnas, header=None)
+    antes = memoria_mb(df)
+    df = aplicar_esquema(df)
+    resumen = (antes, memoria_mb(df), len(df), df["date"].min(), df["date"].max())
+    return pa.Table.from_pandas(df, preserve_index=False), resumen
+
+
+def _tabla_vacia(ruta):
+    """Tabla sin filas con el esquema de una parte que solo tiene cabecera."""
+    df = aplicar_esquema(pd.read_csv(ruta, nrows=0))
+    return pa.Table.from_pandas(df, preserve_index=False), (0.0, 0.0, 0, pd.NaT, pd.NaT)
+
+
+def _ampliar(temporal, esquema):
+    """Copia el Parquet a medias temporal con un esquema más ancho.
+
+    Se copia row group a row group y devuelve el escritor abierto de la
+    copia, que sigue recibiendo trozos.
+    """
+    ampliado = temporal + ".ampliado"
+    escritor = pq.ParquetWriter(ampliado, esquema)
+    lector = pq.ParquetFile(temporal)
+    for i in range(lector.num_row_groups):
+        escritor.write_table(lector.read_row_group(i).cast(esquema))
+    lector.close()
+    os.remove(temporal)
+    return ampliado, escritor
+
+
+def _escribir_parte(ruta_csv, resultados, destino):
+    """Escribe los trozos de una parte como row groups de un Parquet.
+
+    Cada trozo se escribe en cuanto llega y se suelta, sin esperar a los
+    demás. Si un trozo necesita un tipo más ancho que los anteriores (p. ej.
+    float64 tras float32) lo ya escrito se copia con el esquema ampliado.
+    Devuelve la entrada del manifiesto.
+    """
+    # Escribimos en un temporal para no dejar un Parquet a medias
+    temporal = _temporal(destino)
+    escritor = None
+    resumenes = []
+    try:
+        for tabla, resumen in resultados:
+            resumenes.append(resumen)
+            if escritor is None:
+                escritor = pq.ParquetWriter(temporal, tabla.schema)
+            esquema = pa.unify_schemas(
+                [escritor.schema, tabla.schema], promote_options="permissive"
+            )
+            if not esquema.equals(escritor.schema):
+                escritor.close()
+                temporal, escritor = _ampliar(temporal, esquema)
+            escritor.write_table(tabla.cast(escritor.schema))
+            del tabla
+    finally:
+        if escritor is not None:
+            escritor.close()
+    os.replace(temporal, destino)
+
+    antes = sum(r[0] for r in resumenes)
+    despues = sum(r[1] for r in resumenes)
+    logger.info("Memoria ventas %s: %.1f MB -> %.1f MB", ruta_csv, antes, despues)
+    filas = sum(r[2] for r in resumenes)
+    _, tamano, mtime = firma_fichero(ruta_csv)
+    return {
+        "firma": [tamano, mtime],
+        "esquema": VERSION_ESQUEMA,
+        "filas": filas,
+        "desde": str(min(r[3] for r in resumenes).date()) if filas else None,
+        "hasta": str(max(r[4] for r in resumenes).date()) if filas else None,
+    }
+
+
+def _avisar_solapes(nombre, manifiesto):
+    """Avisa si el rango de fechas de una parte pisa el de otra ya ingerida."""
+    nueva = manifiesto[nombre]
+    if nueva["desde"] is None:
+        return
+    for otro, entrada in manifiesto.items():
+        if otro == nombre or entrada["desde"] is None:
+            continue
+        if nueva["desde"] <= entrada["hasta"] and entrada["desde"] <= nueva["hasta"]:
+            logger.warning(
+                "%s (%s a %s) se solapa con %s (%s a %s)",
+                nombre, nueva["desde"], nueva["hasta"],
+                otro, entrada["desde"], entrada["hasta"]
+            )
+
+
+def actualizar_almacen(rutas=None, directorio=DIR_ALMACEN, procesos=PROCESOS):
+    """Convierte a Parquet solo las partes nuevas o modificadas.
+
+    Los trozos de todas las partes pendientes se parsean a la vez en el pool
+    de procesos y se escriben según llegan (en_orden), parte a parte. Las
+    partes cuyo CSV ya no existe se eliminan del almacén.
+    Devuelve los nombres de las partes que se han convertido en esta llamada.
+    """
+    rutas = ficheros_csv() if rutas is None else rutas
+    if pq is None:
+        return []
+    os.makedirs(directorio, exist_ok=True)
+    manifiesto = leer_manifiesto(directorio)
+
+    pendientes = []
+    for ruta in rutas:
+        entrada = manifiesto.get(os.path.basename(ruta))
+        _, tamano, mtime = firma_fichero(ruta)
+        if (
+            entrada is None
+            or entrada["firma"] != [tamano, mtime]
+            or entrada["esquema"] != VERSION_ESQUEMA
+            or not os.path.exists(ruta_parquet(ruta, directorio))
+        ):
+            pendientes.append(ruta)
+
+    trozos = [trozo for ruta in pendientes for trozo in trozos_csv(ruta)]
+    # Los trozos van parte a parte, así que cada parte toma los siguientes n
+    resultados = en_orden(_tabla_de_trozo, trozos, procesos)
+    convertidas = []
+    for ruta in pendientes:
+        nombre = os.path.basename(ruta)
+        n_trozos = sum(1 for trozo in trozos if trozo[0] == ruta)
+        de_la_parte = islice(resultados, n_trozos)
+        if not n_trozos:
+            # CSV sin filas: Parquet vacío, para que cargar_parte lo encuentre
+            de_la_parte = [_tabla_vacia(ruta)]
+        manifiesto[nombre] = _escribir_parte(ruta, de_la_parte, ruta_parquet(ruta, directorio))
+        _avisar_solapes(nombre, manifiesto)
+        convertidas.append(nombre)
+
+    vigentes = {os.path.basename(ruta) for ruta in rutas}
+    for nombre in set(manifiesto) - vigentes:
+        destino = ruta_parquet(nombre, directorio)
+        if os.path.exists(destino):
+            os.remove(destino)
+        del manifiesto[nombre]
+
+    _guardar_manifiesto(manifiesto, directorio)
+    if convertidas:
+        logger.info("Partes ingeridas: %s", ", ".join(convertidas))
+    return convertidas
+
+
+def cargar_parte(ruta_csv, directorio=DIR_ALMACEN):
+    """DataFrame de una parte, desde su Parquet si pyarrow está disponible.
+
+    Con pyarrow el almacén debe estar al día (actualizar_almacen).
+    """
+    if pq is None:
+        return leer_csv([ruta_csv])
+    tabla = pq.read_table(ruta_parquet(ruta_csv, directorio), memory_map=True)
+    return tabla.to_pandas(split_blocks=True)
+
+
+def cargar_ventas(rutas=None, directorio=DIR_ALMACEN):
+    """Devuelve el DataFrame de ventas completo, convirtiendo antes lo nuevo."""
+    rutas = ficheros_csv() if rutas is None else rutas
+    if pq is None:
+        return leer_csv(rutas)
+    actualizar_almacen(rutas, directorio)
+    return concatenar([cargar_parte(ruta, directorio) for ruta in rutas])
+
+
+def ruta_compartida(version, directorio=DIR_ALMACEN):
+    """Fichero Arrow con las filas de una versión de los datos."""
+    return os.path.join(directorio, PATRON_COMPARTIDA.format(version=version))
+
+
+def tabla_compartida(rutas=None, directorio=DIR_ALMACEN):
+    """Filas de todas las partes ordenadas por fecha, sin una copia por proceso.
+
+    Devuelve una tabla Arrow mapeada en memoria desde un fichero IPC sin
+    comprimir: sus columnas apuntan a las páginas del fichero, así que todas
+    las sesiones y todos los procesos del servidor leen la misma copia física
+    (la caché de páginas del sistema operativo). El nombre del fichero lleva
+    la versión de los datos (version_datos de la firma de las partes y de
+    VERSION_ESQUEMA): si cambia una parte o el esquema se escribe un fichero
+    nuevo y se borran los anteriores.
+
+    Sin pyarrow devuelve el DataFrame de cargar_ventas ordenado por fecha.
+    """
+    rutas = ficheros_csv() if rutas is None else rutas
+    if pa is None:
+        return cargar_ventas(rutas, directorio).sort_values(
+            "date", kind="stable", ignore_index=True
+        )
+    ruta = ruta_compartida(
+        version_datos((VERSION_ESQUEMA, firma_fuentes(rutas))), directorio
+    )
+    if not os.path.exists(ruta):
+        _escribir_compartida(rutas, ruta, directorio)
+    return pa.ipc.open_file(pa.memory_map(ruta, "r")).read_all()
+
+
+def _grupos_por_fecha(rutas, directorio):
+    """Partes con filas en orden de fecha; las que se solapan van en el mismo grupo."""
+    manifiesto = leer_manifiesto(directorio)
+    rangos = sorted(
+        (entrada["desde"], entrada["hasta"], ruta)
+        for ruta in rutas
+        for entrada in [manifiesto[os.path.basename(ruta)]]
+        if entrada["filas"]
+    )
+    grupos = []
+    hasta = None
+    for desde_parte, hasta_parte, ruta in rangos:
+        # Compartir solo el día del borde no rompe el orden: no hace falta juntarlas
+        if grupos and desde_parte < hasta:
+            grupos[-1].append(ruta)
+            hasta = max(hasta, hasta_parte)
+        else:
+            grupos.append([ruta])
+            hasta = hasta_parte
+    return grupos
+
+
+def _tipo_indices(n):
+    """Entero más pequeño para los índices de un diccionario de n valores."""
+    for tipo in (pa.int8(), pa.int16()):
+        if n <= np.iinfo(tipo.to_pandas_dtype()).max:
+            return tipo
+    return pa.int32()
+
+
+def _esquema_compartida(partes):
+    """Esquema común de los Parquet y categorías de cada columna de diccionario.
+
+    El formato IPC exige el mismo diccionario en todos los lotes, así que
+    cada columna categórica usa la unión de las categorías de todas las
+    partes: ordenada como en concatenar, o en su orden si es ordenada
+    (meses, días de la semana).
+    """
+    esquema = pa.unify_schemas(
+        [pq.read_schema(parte).remove_metadata() for parte in partes],
+        promote_options="permissive",
+    )
+    campos = []
+    categorias = {}
+    for campo in esquema:
+        if not pa.types.is_dictionary(campo.type):
+            campos.append(campo)
+            continue
+        valores = []
+        for parte in partes:
+            for trozo in pq.read_table(parte, columns=[campo.name]).column(0).chunks:
+                valores.extend(v for v in trozo.dictionary.to_pylist() if v not in valores)
+        if not campo.type.ordered:
+            valores = sorted(valores)
+        tipo = pa.dictionary(_tipo_indices(len(valores)), campo.type.value_type, campo.type.ordered)
+        categorias[campo.name] = pa.array(valores, type=campo.type.value_type)
+        campos.append(pa.field(campo.name, tipo))
+    return pa.schema(campos), categorias
+
+
+def _recodificar(columna, categorias, tipo):
+    """Columna de diccionario pasada al diccionario común categorias."""
+    trozos = []
+    for trozo in columna.chunks:
+        posiciones = pc.index_in(trozo.dictionary.cast(categorias.type), value_set=categorias)
+        indices = pc.take(posiciones, trozo.indices).cast(tipo.index_type)
+        trozos.append(
+            pa.DictionaryArray.from_arrays(indices, categorias, ordered=tipo.ordered)
+        )
+    return pa.chunked_array(trozos, type=tipo)
+
+
+def _tabla_grupo(grupo, esquema, categorias, directorio):
+    """Filas de un grupo de partes con el esquema común, ordenadas por fecha."""
+    tablas = []
+    for ruta in grupo:
+        tabla = pq.read_table(ruta_parquet(ruta, directorio), memory_map=True)
+        columnas = [
+            _recodificar(tabla.column(campo.name), categorias[campo.name], campo.type)
+            if campo.name in categorias
+            else tabla.column(campo.name).cast(campo.type)
+            for campo in esquema
+        ]
+        tablas.append(pa.Table.from_arrays(columnas, schema=esquema))
+    return pa.concat_tables(tablas).sort_by("date")
+
+
+def _escribir_compartida(rutas, ruta, directorio):
+    """Escribe el fichero compartido parte a parte desde el almacén Parquet.
+
+    Las partes van en orden de fecha y cada una se ordena por separado (solo
+    se ordenan juntas las que se solapan), así que la memoria necesaria es la
+    de la parte (o grupo) más grande, no la del dataset.
+    """
+    actualizar_almacen(rutas, directorio)
+    grupos = _grupos_por_fecha(rutas, directorio)
+    partes = [ruta_parquet(r, directorio) for r in rutas]
+    esquema, categorias = _esquema_compartida(partes)
+
+    # Varios procesos pueden escribirlo a la vez: cada uno en su temporal
+    temporal = _temporal(ruta)
+    filas = 0
+    with pa.OSFile(temporal, "wb") as destino:
+        with pa.ipc.new_file(destino, esquema) as escritor:
+            for grupo in grupos:
+                tabla = _tabla_grupo(grupo, esquema, categorias, directorio)
+                escritor.write_table(tabla)
+                filas += tabla.num_rows
+                del tabla
+    os.replace(temporal, ruta)
+    logger.info(
+        "Filas compartidas: %d filas, %.1f MB en %s",
+        filas, os.path.getsize(ruta) / 1024 ** 2, ruta
+    )
+
+    for vieja in glob.glob(ruta_compartida("*", directorio)):
+        if vieja != ruta:
+            try:
+                os.remove(vieja)
+            except OSError:  # en Windows no se puede borrar mientras esté mapeada
+                pass
+
+
+if __name__ == "__main__":
+    # python datos.py: ingiere las partes nuevas e informa del ahorro de memoria
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    df = cargar_ventas()
+    logger.info("Memoria al cargar desde Parquet: %.1f MB", memoria_mb(df))
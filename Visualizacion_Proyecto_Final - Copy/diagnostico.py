@@ -0,0 +1,191 @@
+"""Instrumentación del dashboard: tiempo, filas y memoria de cada sección.
+
+Cada página marca sus secciones (cada figura, la carga del cubo, los KPI)
+con Diagnostico.seccion(). Con el panel "Diagnóstico" de la barra lateral
+activado se mide además el pico de memoria de Python de cada sección
+(tracemalloc), y con VENTAS_LOG_DIAGNOSTICO=1 cada sección se escribe en el
+log como una línea JSON, para localizar en producción qué gráfico es lento
+sin un profiler.
+
+Las funciones cacheadas con st.cache_data/st.cache_resource se decoran con
+cacheada() para contar llamadas y fallos (el cuerpo solo se ejecuta en los
+fallos); los contadores son por proceso.
+
+tracemalloc y los contadores son globales al proceso: el pico de memoria y
+los fallos de caché de una sección incluyen lo que hagan a la vez otras
+sesiones o los hilos del precálculo. tracemalloc solo está activo mientras
+alguna sección lo está midiendo, y no se para mientras quede otra midiendo.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Escribir cada sección como una línea JSON en el log
+LOG_DIAGNOSTICO = os.environ.get("VENTAS_LOG_DIAGNOSTICO", "0") == "1"
+if LOG_DIAGNOSTICO and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# Llamadas y fallos de cada función cacheada (por proceso)
+CACHES = defaultdict(lambda: {"llamadas": 0, "fallos": 0})
+_lock = threading.Lock()
+
+# Secciones que están midiendo memoria ahora, de todas las sesiones, y si el
+# tracemalloc activo lo arrancamos nosotros (si no, nunca lo paramos)
+_midiendo = 0
+_tracemalloc_propio = False
+_lock_memoria = threading.Lock()
+
+
+def _empezar_memoria():
+    """Registra una sección midiendo memoria; devuelve las que hay en el proceso."""
+    global _midiendo, _tracemalloc_propio
+    with _lock_memoria:
+        if _midiendo == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_propio = True
+        _midiendo += 1
+        return _midiendo
+
+
+def _terminar_memoria():
+    """Da de baja una sección; devuelve las que seguían midiendo antes de la baja."""
+    global _midiendo, _tracemalloc_propio
+    with _lock_memoria:
+        activas = _midiendo
+        _midiendo -= 1
+        if _midiendo == 0 and _tracemalloc_propio:
+            tracemalloc.stop()
+            _tracemalloc_propio = False
+        return activas
+
+
+def _contar(nombre, campo):
+    with _lock:
+        CACHES[nombre][campo] += 1
+
+
+def cacheada(nombre, decorador):
+    """Aplica un decorador de caché de Streamlit contando llamadas y fallos."""
+    def envolver(funcion):
+        @functools.wraps(funcion)
+        def cuerpo(*args, **kwargs):
+            _contar(nombre, "fallos")
+            return funcion(*args, **kwargs)
+
+        con_cache = decorador(cuerpo)
+
+        @functools.wraps(funcion)
+        def llamada(*args, **kwargs):
+            _contar(nombre, "llamadas")
+            return con_cache(*args, **kwargs)
+
+        llamada.clear = con_cache.clear
+        return llamada
+    return envolver
+
+
+def fallos_cache(nombre):
+    """Fallos acumulados de una función cacheada (para saber si una llamada calculó)."""
+    with _lock:
+        return CACHES[nombre]["fallos"]
+
+
+def estadisticas_caches():
+    """Tabla con llamadas, aciertos y fallos de cada función cacheada."""
+    with _lock:
+        filas = [
+            {
+                "función": nombre,
+                "llamadas": c["llamadas"],
+                "aciertos": c["llamadas"] - c["fallos"],
+                "fallos": c["fallos"],
+            }
+            for nombre, c in CACHES.items()
+        ]
+    return pd.DataFrame(filas, columns=["función", "llamadas", "aciertos", "fallos"])
+
+
+class Diagnostico:
+    """Registro de las secciones de una ejecución de la página.
+
+    Si no está activo (ni panel ni log) seccion() no mide nada.
+    """
+
+    def __init__(self, pagina, memoria=False, log=LOG_DIAGNOSTICO):
+        self.pagina = pagina
+        self.memoria = memoria
+        self.log = log
+        self.activo = memoria or log
+        self.secciones = []
+        self._pila = []
+
+    @contextmanager
+    def seccion(self, nombre, filas=None):
+        """Mide el bloque; el dict que devuelve admite "filas" y "cache"."""
+        registro = {"seccion": nombre, "filas": filas}
+        if not self.activo:
+            yield registro
+            return
+
+        marco = None
+        if self.memoria:
+            activas = _empezar_memoria()
+            # Cada sección mide su propio pico; el de la sección que la
+            # contiene se conserva en su marco antes de reiniciarlo. El pico
+            # solo se reinicia si todas las secciones midiendo son de esta
+            # ejecución: si no, se estropearía la medida de otra sesión
+            actual, pico = tracemalloc.get_traced_memory()
+            if self._pila:
+                self._pila[-1]["pico"] = max(self._pila[-1]["pico"], pico)
+            marco = {"base": actual, "pico": actual}
+            self._pila.append(marco)
+            if activas == len(self._pila):
+                tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro["segundos"] = time.perf_counter() - inicio
+            if marco is not None:
+                pico = max(marco["pico"], tracemalloc.get_traced_memory()[1])
+                if _terminar_memoria() == len(self._pila) and len(self._pila) > 1:
+                    tracemalloc.reset_peak()
+                self._pila.pop()
+                if self._pila:
+                    self._pila[-1]["pico"] = max(self._pila[-1]["pico"], pico)
+                registro["pico_mb"] = (pico - marco["base"]) / 1024 ** 2
+            self.secciones.append(registro)
+            if self.log:
+                logger.info(json.dumps(
+                    {"pagina": self.pagina, **registro}, ensure_ascii=False, default=str
+                ))
+
+    def tabla(self):
+        """Secciones en el orden en que terminaron."""
+        columnas = ["seccion", "segundos", "filas", "pico_mb", "cache"]
+        return pd.DataFrame(self.secciones).reindex(columns=columnas)
+
+
+def filas_figura(fig):
+    """Número de puntos que recibe una figura Plotly (suma de todas las trazas)."""
+    total = 0
+    for traza in fig.data:
+        for eje in ("x", "y", "lat"):
+            valores = getattr(traza, eje, None)
+            if valores is not None:
+                total += len(valores)
+                break
+    return total
@@ -1,10 +1,30 @@
 
+import os
+from functools import partial
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import plotly.express as px
 
+from agregados import (
+    ESTACIONALIDAD, agregar_base, base_por_bloques, combinar_bases, completar_cubo,
+    estacionalidad_filtrada, media, metricas_temporales, particion
+)
+from consultas import base_duckdb, base_polars
+from datos import (
+    DIAS_SEMANA, actualizar_almacen, cargar_parte, firma_fuentes, tabla_compartida,
+    version_datos
+)
+from diagnostico import Diagnostico, cacheada, estadisticas_caches, fallos_cache, filas_figura
+from filtros import Filtro, IndiceVentas, filtro_activo
+from figuras import CacheFiguras, MAX_BARRAS, reducir_serie, render_mode, top_n_otros
+from precalculo import Calentador, vista_estado, vista_tienda
+from pronostico import SEMANAS, backtest, pronosticar, semanales, series_diarias
+from ranking import top_k
+from servicio import CuboRemoto, consultar_series, consultar_version
+
 
 #########################
 ## CONFIGURACIÓN DE PÁGINA
@@ -36,10 +56,9 @@ def kpi_card(title, value, bg_color="#FAD4C0"):
         unsafe_allow_html=True
     )
 
-def kpi_card_months(title, value, bg_color="#9EDAF6"):
-    """Versión más pequeña de kpi_card para múltiples tarjetas."""
-    st.markdown(
-        f"""
+def card_months_html(title, value, bg_color="#9EDAF6"):
+    """Versión más pequeña de kpi_card para múltiples tarjetas (solo el HTML)."""
+    return f"""
         <div style="
             background-color: {bg_color};
             padding: 2px 10px;
@@ -54,14 +73,11 @@ def kpi_card_months(title, value, bg_color="#9EDAF6"):
             <h5 style="margin: 0; color: #4A2C2A;">{title}</h5>
             <h3 style="margin: 0px 0 0 0; color: #4A2C2A;">{value}</h3>
         </div>
-        """,
-        unsafe_allow_html=True
-    )
+        """
 
-def kpi_card_states(title, value, bg_color="#FFB98A"):
-    """Versión más pequeña de kpi_card para múltiples tarjetas."""
-    st.markdown(
-        f"""
+def card_states_html(title, value, bg_color="#FFB98A"):
+    """Versión más pequeña de kpi_card para múltiples tarjetas (solo el HTML)."""
+    return f"""
         <div style="
             background-color: {bg_color};
             padding: 2px 10px;
@@ -77,10 +93,22 @@ def kpi_card_states(title, value, bg_color="#FFB98A"):
             <h5 style="margin: 0; color: #000000; font-size: 18px">{title}</h5>
             <h3 style="margin: 0px 0 0 0; color: #000000;font-size: 18px">{value}</h3>
         </div>
-        """,
+        """
+
+def grid_cards(cards, num_cols):
+    """Rejilla de tarjetas en un único st.markdown en lugar de uno por tarjeta."""
+    # Cada tarjeta en una sola línea para que markdown no la tome por código
+    celdas = "".join(" ".join(card.split()) for card in cards)
+    st.markdown(
+        f'<div style="display: grid; grid-template-columns: repeat({num_cols}, max-content); '
+        f'column-gap: 10px;">{celdas}</div>',
         unsafe_allow_html=True
     )
 
+def miles(valor):
+    """Número entero con espacio como separador de miles."""
+    return f"{valor:,}".replace(",", " ")
+
 def kpi_card_shop(title, value, bg_color="#1CB960"):
     st.markdown(
         f"""
@@ -145,15 +173,22 @@ with st.sidebar:
     # Selector de página/sección
     pagina = st.selectbox(
         "Selecciona una sección",
-        ["🦞 HomePage", "📈 Visualización Global", "📋​ Análisis por tienda", "🌐​ Análisis por Estado", "📇​ Evolución Temporal"]
+        ["🦞 HomePage", "📈 Visualización Global", "📋​ Análisis por tienda", "🌐​ Análisis por Estado", "📇​ Evolución Temporal", "🔮​ Pronóstico"]
     )
 
     st.divider()
 
     # Filtros o controles adicionales
     st.subheader("Filtros")
-    filtro_1 = st.checkbox("Activar filtro 1", value=True)
-    filtro_2 = st.slider("Ajuste", 0, 100, 50)
+    # Se rellena tras cargar los datos, con sus fechas, tiendas, estados y familias
+    contenedor_filtros = st.container()
+    # Progreso del precálculo de las vistas de tiendas y estados
+    contenedor_precalculo = st.container()
+
+    # Panel de instrumentación, plegado por defecto
+    with st.expander("Avanzado"):
+        mostrar_diagnostico = st.toggle("🩺 Diagnóstico", value=False)
+    panel_diagnostico = st.empty()
 
     st.divider()
     st.caption("© 2025 - Mi Aplicación")
@@ -193,19 +228,251 @@ st.divider()
 # -------------------------------
 # CARGA DE DATOS
 # -------------------------------
-@st.cache_data
-def load_data():
-    df1 = pd.read_csv("parte_1.csv")
-    df2 = pd.read_csv("parte_2.csv")
-
-    df = pd.concat([df1, df2], ignore_index=True)
-
-    # Convertir fecha
-    df["date"] = pd.to_datetime(df["date"])
+# "memoria": carga cada parte entera (desde su Parquet) y agrega
+# "bloques": lee los CSV por bloques y solo guarda los agregados (datasets
+#            mayores que la RAM)
+# "duckdb": agrega con DuckDB directamente sobre los Parquet/CSV, sin pasar
+#           las filas a pandas (necesita el paquete duckdb)
+# "polars": igual, con un plan lazy de Polars (necesita el paquete polars)
+MODO_CARGA = os.environ.get("VENTAS_MODO_CARGA", "memoria")
+
+# URL del servicio de agregados (servicio.py). Con ella el cubo vive en el
+# servicio y este proceso solo le pide las tablas que dibujan sus páginas,
+# así que se pueden lanzar varios procesos del dashboard detrás del mismo
+SERVICIO = os.environ.get("VENTAS_SERVICIO")
+
+# Tiempos de cada sección de esta ejecución (panel Diagnóstico y/o log)
+diag = Diagnostico(pagina, memoria=mostrar_diagnostico)
+
+@cacheada("load_base", st.cache_data)
+def load_base(parte):
+    # Agregados de una sola parte CSV. La parte incluye su tamaño y fecha de
+    # modificación, así que al llegar un fichero nuevo solo se calcula el suyo
+    ruta = parte[0]
+    if MODO_CARGA == "bloques":
+        return base_por_bloques(ruta)
+    if MODO_CARGA == "duckdb":
+        return base_duckdb([ruta])
+    if MODO_CARGA == "polars":
+        return base_polars([ruta])
+    return agregar_base(cargar_parte(ruta))
+
+@cacheada("load_cubo", st.cache_resource(max_entries=1))
+def load_cubo(firma):
+    # Agregados compartidos por todas las páginas: se calculan una vez por
+    # versión de los datos y las páginas solo los leen (no modificarlos)
+    if MODO_CARGA in ("memoria", "duckdb", "polars"):
+        actualizar_almacen([ruta for ruta, _, _ in firma])
+    return completar_cubo(*combinar_bases([load_base(parte) for parte in firma]))
+
+@cacheada("load_cubo_remoto", st.cache_resource(max_entries=8))
+def load_cubo_remoto(firma, filtro=None):
+    # Tablas del cubo del servicio, pedidas una vez por proceso (None si el
+    # filtro no deja filas)
+    if filtro is not None and consultar_version(SERVICIO, filtro)[1] == 0:
+        return None
+    return CuboRemoto(SERVICIO, firma, filtro)
+
+with diag.seccion("cubo") as registro:
+    if SERVICIO:
+        # La versión de los datos la da el servicio, que es quien los lee
+        firma = consultar_version(SERVICIO)[0]
+        cubo = load_cubo_remoto(firma)
+        registro.update(cache="servicio", filas=0)
+    else:
+        firma = firma_fuentes()
+        fallos = fallos_cache("load_cubo")
+        cubo = load_cubo(firma)
+        # Filas recorridas: todas si el cubo se ha construido ahora, ninguna si venía de caché
+        if fallos_cache("load_cubo") > fallos:
+            registro.update(cache="fallo", filas=int(cubo["year"]["n_filas"].sum()))
+        else:
+            registro.update(cache="acierto", filas=0)
+
+@cacheada("load_indice", st.cache_resource(max_entries=1))
+def load_indice(firma):
+    # Filas ordenadas por fecha; solo se cargan la primera vez que se filtra.
+    # Están mapeadas en memoria: todos los procesos comparten la misma copia
+    return IndiceVentas(tabla_compartida([ruta for ruta, _, _ in firma]))
+
+@cacheada("load_cubo_filtrado", st.cache_resource(max_entries=8))
+def load_cubo_filtrado(firma, filtro):
+    # Mismo cubo que load_cubo, pero solo con las filas que pasan el filtro
+    filas = load_indice(firma).filtrar(filtro)
+    if filas.empty:
+        return None
+    return completar_cubo(*agregar_base(filas))
+
+fecha_min, fecha_max = (f.date() for f in cubo["dias"]["date"].agg(["min", "max"]))
+with contenedor_filtros:
+    rango = st.date_input(
+        "Fechas",
+        value=(fecha_min, fecha_max),
+        min_value=fecha_min,
+        max_value=fecha_max,
+        format="DD/MM/YYYY"
+    )
+    estados_filtro = st.multiselect("Estados", list(cubo["estados"].index), placeholder="Todos")
+    tiendas_filtro = st.multiselect("Tiendas", list(cubo["tiendas"]["store_nbr"]), placeholder="Todas")
+    familias_filtro = st.multiselect("Familias", list(cubo["familias"].index), placeholder="Todas")
+
+# Cubo sin filtrar: sus agregados diarios dan la estacionalidad con cualquier filtro
+cubo_completo = cubo
+
+# Mientras se elige el rango, date_input devuelve solo la fecha inicial
+desde = rango[0] if len(rango) > 0 else fecha_min
+hasta = rango[1] if len(rango) > 1 else desde
+filtro = Filtro(
+    desde, hasta, tuple(sorted(tiendas_filtro)), tuple(sorted(estados_filtro)),
+    tuple(sorted(familias_filtro))
+)
 
-    return df
+if filtro_activo(filtro, fecha_min, fecha_max):
+    with diag.seccion("filtro") as registro:
+        if SERVICIO:
+            cubo = load_cubo_remoto(firma, filtro)
+        else:
+            cubo = load_cubo_filtrado(firma, filtro)
+        registro["filas"] = 0 if cubo is None else int(cubo["year"]["n_filas"].sum())
+    if cubo is None:
+        st.warning("No hay ventas que cumplan los filtros seleccionados.")
+        st.stop()
+    # Las figuras y métricas cacheadas dependen también del filtro
+    version = version_datos((firma, filtro))
+else:
+    version = version_datos(firma)
+
+# Precalcular en segundo plano las vistas de todas las tiendas y estados
+PRECALCULO = os.environ.get("VENTAS_PRECALCULO", "1") == "1"
+
+# El cubo va con "_" para que Streamlit no lo use como clave: la versión ya lo identifica
+@cacheada("load_vista_tienda", st.cache_resource(max_entries=1024))
+def load_vista_tienda(version, store, _cubo):
+    return vista_tienda(_cubo, store)
+
+@cacheada("load_vista_estado", st.cache_resource(max_entries=256))
+def load_vista_estado(version, state, _cubo):
+    return vista_estado(_cubo, state)
+
+# Varias entradas para que sesiones con filtros distintos no se echen una a
+# otra; el calentador que sale de la caché cancela lo que le quede
+@st.cache_resource(max_entries=8, on_release=Calentador.cancelar)
+def load_calentador(version, _cubo):
+    # Una vez por versión (y filtro): calcula todas las vistas de detalle en
+    # hilos; las páginas las encuentran luego en caché
+    tareas = [
+        partial(load_vista_tienda, version, store, _cubo)
+        for store in _cubo["tiendas"]["store_nbr"]
+    ] + [
+        partial(load_vista_estado, version, state, _cubo)
+        for state in _cubo["estados"].index
+    ]
+    return Calentador(tareas)
+
+if PRECALCULO:
+    calentador = load_calentador(version, cubo)
+
+    with contenedor_precalculo:
+        # Se refresca sola cada segundo mientras quedan vistas por calcular
+        refrescando = not calentador.terminado
+
+        @st.fragment(run_every=1 if refrescando else None)
+        def progreso_precalculo():
+            if calentador.terminado and refrescando:
+                # Al terminar se vuelve a ejecutar la app entera: así el
+                # fragmento se declara sin run_every y deja de refrescarse
+                st.rerun()
+            if calentador.terminado:
+                st.caption(
+                    f"✅ Vistas de tiendas y estados listas ({calentador.total} en "
+                    f"{calentador.segundos:.1f} s)"
+                )
+            else:
+                st.progress(
+                    calentador.progreso(),
+                    text=f"Precalculando tiendas y estados: {calentador.hechas}/{calentador.total}"
+                )
+
+        progreso_precalculo()
+
+@st.cache_resource
+def load_cache_figuras():
+    # Una sola caché de figuras por proceso, compartida por todas las sesiones
+    return CacheFiguras()
+
+@cacheada("load_metricas_temporales", st.cache_resource(max_entries=8))
+def load_metricas_temporales(version):
+    # KPI y tablas de la página de evolución temporal, una vez por versión
+    return metricas_temporales(cubo)
+
+@cacheada("load_estacionalidad", st.cache_resource(max_entries=8))
+def load_estacionalidad(version):
+    # Medias por semana, día y mes con el filtro actual, a partir de los
+    # agregados diarios del cubo completo. Con el servicio (que ya filtra) o
+    # con familias junto con tiendas/estados se usan las del cubo filtrado
+    tablas = None
+    if not SERVICIO and filtro_activo(filtro, fecha_min, fecha_max):
+        tablas = estacionalidad_filtrada(cubo_completo, filtro)
+    return tablas or {nombre: cubo[nombre] for nombre in ESTACIONALIDAD}
+
+# El pronóstico usa siempre todo el histórico, sin los filtros de la barra lateral
+@cacheada("load_series", st.cache_resource(max_entries=1))
+def load_series(version_base):
+    # Matriz (tienda x familia) x día, una vez por versión de los datos. Con
+    # el servicio la calcula él (firma es su versión) y aquí solo se recibe
+    if SERVICIO:
+        return consultar_series(SERVICIO, firma)
+    return series_diarias(tabla_compartida([ruta for ruta, _, _ in firma]))
+
+@cacheada("load_pronostico", st.cache_resource(max_entries=16))
+def load_pronostico(version_base, semanas, modo):
+    series = load_series(version_base)
+    if modo == "backtest":
+        return backtest(series, semanas)
+    return pronosticar(series, semanas)
+
+def mostrar_figura(nombre, construir, seleccion=None):
+    # La figura solo se construye si cambia la página, la tienda/estado
+    # seleccionado o la versión de los datos
+    figuras = load_cache_figuras()
+    with diag.seccion(nombre) as registro:
+        fallos = figuras.fallos
+        fig = figuras.obtener((pagina, nombre, seleccion, version), construir)
+        registro["cache"] = "fallo" if figuras.fallos > fallos else "acierto"
+        registro["filas"] = filas_figura(fig)
+        st.plotly_chart(fig, use_container_width=True)
 
-df = load_data()
+# "perezoso": cada sección pesada va en un desplegable y solo se calcula al abrirlo
+# "marcadores": se pinta todo, pero primero los huecos de cada sección y
+#               después su contenido, de arriba a abajo
+MODO_SECCIONES = os.environ.get("VENTAS_MODO_SECCIONES", "perezoso")
+
+@st.fragment
+def seccion_perezosa(etiqueta, clave, dibujar):
+    # Al abrir o cerrar el desplegable solo se vuelve a ejecutar este fragmento
+    with st.expander(etiqueta, key=clave, on_change="rerun") as seccion:
+        if seccion.open:
+            dibujar()
+
+def mostrar_secciones(secciones):
+    # secciones: lista de (cabecera, etiqueta, clave, dibujar); la cabecera
+    # es barata y se pinta siempre, dibujar solo cuando toca
+    if MODO_SECCIONES == "marcadores":
+        huecos = []
+        for cabecera, etiqueta, _, dibujar in secciones:
+            if cabecera:
+                cabecera()
+            hueco = st.empty()
+            hueco.info(f"⏳ Cargando {etiqueta.lower()}...")
+            huecos.append((hueco, dibujar))
+        for hueco, dibujar in huecos:
+            with hueco.container():
+                dibujar()
+    else:
+        for cabecera, etiqueta, clave, dibujar in secciones:
+            if cabecera:
+                cabecera()
+            seccion_perezosa(etiqueta, clave, dibujar)
 
 #########################
 ## PÁGINA: INICIO
@@ -286,371 +553,362 @@ elif pagina == "📈 Visualización Global":
     with col1:
         kpi_card(
             "Nº tiendas",
-            df["store_nbr"].nunique()
+            len(cubo["tiendas"])
         )
 
     with col2:
         kpi_card(
             "Nº productos",
-            df["family"].nunique()
-        )
-
-    st.markdown(" ")
-    st.subheader("Estados")
-    states = sorted(df["state"].unique())
-
-    num_cols = 8
-    rows = [states[i:i+num_cols] for i in range(0, len(states), num_cols)]
-    for row in rows:
-        cols = st.columns(len(row))
-        for i, state in enumerate(row):
-            with cols[i]:
-                kpi_card_states(state, "")  # valor vacío, solo para mostrar el nombre
-
-    st.divider()
-
-
-    st.subheader("Meses")
-    df["month_name"] = df["date"].dt.month_name()
-    months = (
-        df[["month", "month_name"]]
-        .drop_duplicates()
-        .sort_values("month")["month_name"]
-    )
-    for month in months:
-        kpi_card_months(month, "")
-
-
-    st.divider()
-
-    st.markdown(
-    """
-    <h2 style="
-        color: #C21807;        /* burdeos */
-        font-family: 'Arial', sans-serif;  /* puedes cambiar por 'Georgia', 'Verdana', etc. */
-        font-weight: bold;      /* negrita */
-        text-align: left;       /* izquierda, center, right */
-        margin-bottom: 10px;
-        font-size: 30px;
-    ">
-        🎯​Ranking y Distribución
-    </h2>
-    """,
-    unsafe_allow_html=True
-    )
-
-    st.markdown(" ")
-
-    colA, colB = st.columns(2)
-
-    # i. Top 10 productos más vendidos
-
-    with colA:
-
-        top_families = (
-            df.groupby("family")["sales"]
-            .sum()
-            .sort_values(ascending=False)
-            .head(10)
-        ).reset_index()
-
-        # Crear gráfico de barras interactivo
-        fig = px.bar(
-            top_families,
-            x='family',
-            y='sales',
-            text='sales',  # esto pone los valores encima de las barras
-            color_discrete_sequence=["#F88379"]  # mismo color naranja
-        )
-
-        # Personalizar el texto de los valores
-        fig.update_traces(
-            texttemplate='%{y:,}',  # separador de miles
-            textposition='outside',  # colocar encima de la barra
-            textfont_size=16
-        )
-
-        # Layout del gráfico
-        fig.update_layout(
-            title={
-                'text': "Top 10 Productos más vendidos",
-                'x':0.5,  # centrar título
-                'xanchor': 'center',
-                'font': {'size':16, 'color':"#000000", 'family':'Arial'}
-            },
-            xaxis_title="Producto",
-            yaxis_title="Ventas",
-            xaxis_tickangle=-45,
-            yaxis=dict(tickformat=','),
-            margin=dict(t=80, b=100),
-            height=525    # márgenes para que no se solape texto
-        )
-
-        # Mostrar en Streamlit
-        st.plotly_chart(fig, use_container_width=True)
-
-            # iii. Top 10 tiendas con ventas en productos en promoción
-
-        promo_df = df[df["onpromotion"] == True]
-
-        top_tiendas_promo = (
-            promo_df.groupby("store_nbr")["sales"]
-            .sum()
-            .sort_values(ascending=False)
-            .head(10)
-            .reset_index()
-        )
-
-        # Crear columna para etiquetas de eje X
-        top_tiendas_promo['store_label'] = top_tiendas_promo['store_nbr'].apply(lambda x: f"T. {x}")
-
-        # Gráfico vertical interactivo
-        fig2 = px.bar(
-            top_tiendas_promo,
-            x='store_label',  # eje horizontal = tiendas
-            y='sales',        # eje vertical = ventas
-            text='sales',     # valores encima de barras
-            color_discrete_sequence=['#9B59B6']  # color naranja atractivo
-        )
-
-        fig2.update_traces(
-            texttemplate='%{y:,}',
-            textposition='outside',
-            textfont_size=14
-        )
-
-        fig2.update_layout(
-            title={
-                'text': "Top 10 Tiendas con ventas en promoción",
-                'x':0.5,
-                'xanchor': 'center',
-                'font': {'size':16, 'color':"#000000", 'family':'Arial'}
-            },
-            xaxis_title="Tienda",
-            yaxis_title="Ventas",
-            xaxis_tickangle=-45,  # rotar etiquetas para que no se solapen
-            yaxis=dict(tickformat=','),
-            margin=dict(t=80, b=150, l=80),  # margen inferior mayor para etiquetas
-            height=525 
-        )
-
-        st.plotly_chart(fig2, use_container_width=True)
-
-    with colB:
-        # Agrupar y ordenar
-        ventas_tienda = (
-            df.groupby("store_nbr")["sales"]
-            .sum()
-            .sort_values(ascending=False)
-            .reset_index()
-        )
-
-        # Crear columna para etiquetas del eje Y
-        ventas_tienda['store_label'] = ventas_tienda['store_nbr'].apply(lambda x: f"T. {x}")
-
-        # Gráfico de barras horizontal interactivo
-        fig = px.bar(
-            ventas_tienda,
-            y='store_label',  # eje vertical con etiquetas personalizadas
-            x='sales',
-            text='sales',     # valores sobre las barras
-            orientation='h',
-            color_discrete_sequence=["#1CB960"]
-        )
-
-        # Personalizar valores sobre las barras
-        fig.update_traces(
-            texttemplate='%{x:,}',  # separador de miles
-            textposition='outside',
-            textfont_size=14
+            len(cubo["familias"])
         )
 
-        # Layout del gráfico
-        fig.update_layout(
-            title={
-                'text': "Ventas por Tienda",
-                'x':0.5,
-                'xanchor': 'center',
-                'font': {'size':16, 'color':"#000000", 'family':'Arial'}
-            },
-            xaxis_title="Ventas",
-            yaxis_title="Tienda",
-            yaxis=dict(autorange="reversed"),  # la tienda con más ventas arriba
-            margin=dict(t=80, b=50, l=100),    # margen izquierdo mayor
-            height=1000
-        )
-
-        # Mostrar en Streamlit
-        st.plotly_chart(fig, use_container_width=True)
-
-
-    st.divider()
-    st.markdown(
-    """
-    <h2 style="
-        color: #C21807;        /* burdeos */
-        font-family: 'Arial', sans-serif;  /* puedes cambiar por 'Georgia', 'Verdana', etc. */
-        font-weight: bold;      /* negrita */
-        text-align: left;       /* izquierda, center, right */
-        margin-bottom: 10px;
-        font-size: 30px;
-    ">
-        ​📉​Estacionalidad de las ventas
-    </h2>
-    """,
-    unsafe_allow_html=True
-    )
-
     st.markdown(" ")
 
-    coll,colr = st.columns(2)
+    # Secciones pesadas: se calculan al abrirlas (o tras pintar los KPI)
+    def dibujar_estados_meses():
+        st.subheader("Estados")
+        states = cubo["estados"].index
 
-    with colr:
+        # Valor vacío, solo para mostrar el nombre
+        grid_cards([card_states_html(state, "") for state in states], num_cols=8)
 
-        week_sales = (
-            df.groupby("week")["sales"]
-            .mean()
-            .reset_index()
-        )
+        st.divider()
 
-        fig = px.line(
-            week_sales,
-            x="week",
-            y="sales",
-            markers=True,
-            color_discrete_sequence=["#C0392B"]  
-        )
-
-        fig.update_traces(
-            marker=dict(size=6),
-            line=dict(width=3)
-        )
-
-        fig.update_layout(
-            title={
-                'text': "Ventas medias semanales",
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size':16, 'family':'Arial'}
-            },
-            xaxis=dict(
-            title="Semana del año",
-            tickmode='array',
-            tickvals=list(week_sales["week"]),
-            ticktext=[f"S.{int(w)}" for w in week_sales["week"]],
-            range=[week_sales["week"].min(), week_sales["week"].max()],
-            showgrid=True,
-            tickfont=dict(size=9)
-            ),
-            yaxis=dict(
-                title="Ventas medias",
-                range=[0, None],              
-                tickformat=',',
-                showgrid=True,
-                gridwidth=1,
-                gridcolor='rgba(0,0,0,0.1)'
-            ),
-            margin=dict(t=80, b=60),
-            height=500
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
-
-    with coll:
-
-        orden_dias = [
-            "Monday", "Tuesday", "Wednesday",
-            "Thursday", "Friday", "Saturday", "Sunday"
-        ]
 
-        weekday_sales = (
-            df.groupby("day_of_week")["sales"]
-            .mean()
-            .reindex(orden_dias)
-            .reset_index()
-        )
-
-        # Gráfico de barras interactivo
-        fig = px.bar(
-            weekday_sales,
-            x="day_of_week",
-            y="sales",
-            text="sales",
-            color_discrete_sequence=["#F4A6C1"] 
-        )
+        st.subheader("Meses")
+        months = cubo["mes"].index
+        grid_cards([card_months_html(month, "") for month in months], num_cols=1)
 
-        # Personalizar valores
-        fig.update_traces(
-            texttemplate='%{y:,.0f}',  # media sin decimales + separador miles
-            textposition='outside',
-            textfont_size=14
+    def cabecera_ranking():
+        st.divider()
+        st.markdown(
+        """
+        <h2 style="
+            color: #C21807;        /* burdeos */
+            font-family: 'Arial', sans-serif;  /* puedes cambiar por 'Georgia', 'Verdana', etc. */
+            font-weight: bold;      /* negrita */
+            text-align: left;       /* izquierda, center, right */
+            margin-bottom: 10px;
+            font-size: 30px;
+        ">
+            🎯​Ranking y Distribución
+        </h2>
+        """,
+        unsafe_allow_html=True
         )
-
-        # Layout
-        fig.update_layout(
-            title={
-                'text': "Ventas medias por día de la semana",
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size':16, 'color':"#000000", 'family':'Arial'}
-            },
-            xaxis_title="Día de la semana",
-            yaxis_title="Ventas medias",
-            yaxis=dict(tickformat=','),
-            margin=dict(t=80, b=80),
-            height=500
+        st.markdown(" ")
+
+    def dibujar_ranking():
+        colA, colB = st.columns(2)
+
+        # i. Top 10 productos más vendidos
+
+        with colA:
+
+            def figura_top_familias():
+                top_families = top_k(cubo["familias"]).reset_index()
+
+                # Crear gráfico de barras interactivo
+                fig = px.bar(
+                    top_families,
+                    x='family',
+                    y='sales',
+                    text='sales',  # esto pone los valores encima de las barras
+                    color_discrete_sequence=["#F88379"]  # mismo color naranja
+                )
+
+                # Personalizar el texto de los valores
+                fig.update_traces(
+                    texttemplate='%{y:,}',  # separador de miles
+                    textposition='outside',  # colocar encima de la barra
+                    textfont_size=16
+                )
+
+                # Layout del gráfico
+                fig.update_layout(
+                    title={
+                        'text': "Top 10 Productos más vendidos",
+                        'x':0.5,  # centrar título
+                        'xanchor': 'center',
+                        'font': {'size':16, 'color':"#000000", 'family':'Arial'}
+                    },
+                    xaxis_title="Producto",
+                    yaxis_title="Ventas",
+                    xaxis_tickangle=-45,
+                    yaxis=dict(tickformat=','),
+                    margin=dict(t=80, b=100),
+                    height=525    # márgenes para que no se solape texto
+                )
+
+                return fig
+
+            mostrar_figura("top_familias", figura_top_familias)
+
+                # iii. Top 10 tiendas con ventas en productos en promoción
+
+            def figura_top_tiendas_promo():
+                # store_label ya viene del cubo (etiqueta para el eje X)
+                top_tiendas_promo = (
+                    top_k(cubo["tiendas"].set_index("store_label")["sales_promo"])
+                    .rename("sales")
+                    .reset_index()
+                )
+
+                # Gráfico vertical interactivo
+                fig2 = px.bar(
+                    top_tiendas_promo,
+                    x='store_label',  # eje horizontal = tiendas
+                    y='sales',        # eje vertical = ventas
+                    text='sales',     # valores encima de barras
+                    color_discrete_sequence=['#9B59B6']  # color naranja atractivo
+                )
+
+                fig2.update_traces(
+                    texttemplate='%{y:,}',
+                    textposition='outside',
+                    textfont_size=14
+                )
+
+                fig2.update_layout(
+                    title={
+                        'text': "Top 10 Tiendas con ventas en promoción",
+                        'x':0.5,
+                        'xanchor': 'center',
+                        'font': {'size':16, 'color':"#000000", 'family':'Arial'}
+                    },
+                    xaxis_title="Tienda",
+                    yaxis_title="Ventas",
+                    xaxis_tickangle=-45,  # rotar etiquetas para que no se solapen
+                    yaxis=dict(tickformat=','),
+                    margin=dict(t=80, b=150, l=80),  # margen inferior mayor para etiquetas
+                    height=525 
+                )
+                return fig2
+
+            mostrar_figura("top_tiendas_promo", figura_top_tiendas_promo)
+
+        with colB:
+            # Agrupar y ordenar
+            def figura_ventas_tienda():
+                # store_label ya viene del cubo (etiqueta para el eje Y). Con
+                # muchas tiendas se dibujan las primeras y el resto en "Otras"
+                ventas_tienda = top_n_otros(
+                    cubo["tiendas"].set_index("store_label")["sales"],
+                    etiqueta="Otras tiendas"
+                ).reset_index()
+
+                # Gráfico de barras horizontal interactivo
+                fig = px.bar(
+                    ventas_tienda,
+                    y='store_label',  # eje vertical con etiquetas personalizadas
+                    x='sales',
+                    text='sales',     # valores sobre las barras
+                    orientation='h',
+                    color_discrete_sequence=["#1CB960"]
+                )
+
+                # Personalizar valores sobre las barras
+                fig.update_traces(
+                    texttemplate='%{x:,}',  # separador de miles
+                    textposition='outside',
+                    textfont_size=14
+                )
+
+                # Layout del gráfico
+                fig.update_layout(
+                    title={
+                        'text': "Ventas por Tienda",
+                        'x':0.5,
+                        'xanchor': 'center',
+                        'font': {'size':16, 'color':"#000000", 'family':'Arial'}
+                    },
+                    xaxis_title="Ventas",
+                    yaxis_title="Tienda",
+                    yaxis=dict(autorange="reversed"),  # la tienda con más ventas arriba
+                    margin=dict(t=80, b=50, l=100),    # margen izquierdo mayor
+                    height=1000
+                )
+
+                return fig
+
+            mostrar_figura("ventas_tienda", figura_ventas_tienda)
+
+            if len(cubo["tiendas"]) > MAX_BARRAS:
+                # El gráfico está resumido: los datos completos se generan al pulsar
+                st.download_button(
+                    "⬇️ Ventas de todas las tiendas (CSV)",
+                    data=lambda: (
+                        cubo["tiendas"][["store_nbr", "state", "store_type", "sales"]]
+                        .sort_values("sales", ascending=False)
+                        .to_csv(index=False)
+                    ),
+                    file_name="ventas_por_tienda.csv",
+                    mime="text/csv",
+                    on_click="ignore"
+                )
+
+    def cabecera_estacionalidad():
+        st.divider()
+        st.markdown(
+        """
+        <h2 style="
+            color: #C21807;        /* burdeos */
+            font-family: 'Arial', sans-serif;  /* puedes cambiar por 'Georgia', 'Verdana', etc. */
+            font-weight: bold;      /* negrita */
+            text-align: left;       /* izquierda, center, right */
+            margin-bottom: 10px;
+            font-size: 30px;
+        ">
+            ​📉​Estacionalidad de las ventas
+        </h2>
+        """,
+        unsafe_allow_html=True
         )
-
-        st.plotly_chart(fig, use_container_width=True)
-
-    orden_meses = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-    ]
-
-    month_sales = (
-        df.groupby("month_name")["sales"]
-        .mean()
-        .reindex(orden_meses)
-        .reset_index()
-    )
-
-    fig = px.line(
-        month_sales,
-        x="month_name",
-        y="sales",
-        markers=True,                # puntitos sobre la línea
-        color_discrete_sequence=["#2471A3"]  # color arena
-    )
-
-    fig.update_traces(
-        marker=dict(size=8),
-        line=dict(width=3)
-    )
-
-    fig.update_layout(
-        title={
-            'text': "Ventas medias por mes",
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size':16, 'family':'Arial'}
-        },
-        xaxis_title="Mes",
-        yaxis_title="Ventas medias",
-        xaxis=dict(
-            showgrid=True
-        ),
-        yaxis=dict(
-            range=[0, None],
-            tickformat=',',
-            showgrid=True,
-            gridcolor='rgba(0,0,0,0.1)'
-        ),
-        margin=dict(t=80, b=80, l=175, r=175),
-        height=500
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
+        st.markdown(" ")
+
+    def dibujar_estacionalidad():
+        estacional = load_estacionalidad(version)
+        coll,colr = st.columns(2)
+
+        with colr:
+
+            def figura_ventas_semana():
+                week_sales = reducir_serie(
+                    media(estacional["semana"]).rename("sales").reset_index(), "week", "sales"
+                )
+
+                fig = px.line(
+                    week_sales,
+                    x="week",
+                    y="sales",
+                    markers=True,
+                    render_mode=render_mode(len(week_sales)),
+                    color_discrete_sequence=["#C0392B"]  
+                )
+
+                fig.update_traces(
+                    marker=dict(size=6),
+                    line=dict(width=3)
+                )
+
+                fig.update_layout(
+                    title={
+                        'text': "Ventas medias semanales",
+                        'x': 0.5,
+                        'xanchor': 'center',
+                        'font': {'size':16, 'family':'Arial'}
+                    },
+                    xaxis=dict(
+                    title="Semana del año",
+                    # Las etiquetas "S.n" las genera el navegador, no una lista por semana
+                    tickprefix="S.",
+                    dtick=1 if len(week_sales) <= 53 else None,
+                    range=[week_sales["week"].min(), week_sales["week"].max()],
+                    showgrid=True,
+                    tickfont=dict(size=9)
+                    ),
+                    yaxis=dict(
+                        title="Ventas medias",
+                        range=[0, None],              
+                        tickformat=',',
+                        showgrid=True,
+                        gridwidth=1,
+                        gridcolor='rgba(0,0,0,0.1)'
+                    ),
+                    margin=dict(t=80, b=60),
+                    height=500
+                )
+                return fig
+
+            mostrar_figura("ventas_semana", figura_ventas_semana)
+
+        with coll:
+
+            def figura_ventas_dia_semana():
+                # day_of_week es una categoría ordenada: ya sale de lunes a domingo
+                weekday_sales = media(estacional["dia_semana"]).rename("sales").reset_index()
+
+                # Gráfico de barras interactivo
+                fig = px.bar(
+                    weekday_sales,
+                    x="day_of_week",
+                    y="sales",
+                    text="sales",
+                    color_discrete_sequence=["#F4A6C1"] 
+                )
+
+                # Personalizar valores
+                fig.update_traces(
+                    texttemplate='%{y:,.0f}',  # media sin decimales + separador miles
+                    textposition='outside',
+                    textfont_size=14
+                )
+
+                # Layout
+                fig.update_layout(
+                    title={
+                        'text': "Ventas medias por día de la semana",
+                        'x': 0.5,
+                        'xanchor': 'center',
+                        'font': {'size':16, 'color':"#000000", 'family':'Arial'}
+                    },
+                    xaxis_title="Día de la semana",
+                    yaxis_title="Ventas medias",
+                    yaxis=dict(tickformat=','),
+                    margin=dict(t=80, b=80),
+                    height=500
+                )
+                return fig
+
+            mostrar_figura("ventas_dia_semana", figura_ventas_dia_semana)
+
+        def figura_ventas_mes():
+            # Igual que el día de la semana, month_name ya viene de enero a diciembre
+            month_sales = media(estacional["mes"]).rename("sales").reset_index()
+
+            fig = px.line(
+                month_sales,
+                x="month_name",
+                y="sales",
+                markers=True,                # puntitos sobre la línea
+                color_discrete_sequence=["#2471A3"]  # color arena
+            )
+
+            fig.update_traces(
+                marker=dict(size=8),
+                line=dict(width=3)
+            )
+
+            fig.update_layout(
+                title={
+                    'text': "Ventas medias por mes",
+                    'x': 0.5,
+                    'xanchor': 'center',
+                    'font': {'size':16, 'family':'Arial'}
+                },
+                xaxis_title="Mes",
+                yaxis_title="Ventas medias",
+                xaxis=dict(
+                    showgrid=True
+                ),
+                yaxis=dict(
+                    range=[0, None],
+                    tickformat=',',
+                    showgrid=True,
+                    gridcolor='rgba(0,0,0,0.1)'
+                ),
+                margin=dict(t=80, b=80, l=175, r=175),
+                height=500
+            )
+            return fig
+
+        mostrar_figura("ventas_mes", figura_ventas_mes)
+
+    mostrar_secciones([
+        (None, "🗺️ Estados y meses", "global_estados_meses", dibujar_estados_meses),
+        (cabecera_ranking, "Ver ranking y distribución", "global_ranking", dibujar_ranking),
+        (cabecera_estacionalidad, "Ver estacionalidad", "global_estacionalidad", dibujar_estacionalidad),
+    ])
 
 elif pagina == "📋​ Análisis por tienda":
 
@@ -699,49 +957,54 @@ elif pagina == "📋​ Análisis por tienda":
     with col2:
         store = st.selectbox(
             "",
-            sorted(df["store_nbr"].unique())  
+            list(cubo["tiendas"]["store_nbr"])
         )
     st.markdown(" ")
     st.markdown(" ")
 
-    df_store = df[df["store_nbr"] == store]
+    with diag.seccion("vista_tienda") as registro:
+        fallos = fallos_cache("load_vista_tienda")
+        vista = load_vista_tienda(version, store, cubo)
+        registro["cache"] = "fallo" if fallos_cache("load_vista_tienda") > fallos else "acierto"
 
-    sales_year = df_store.groupby("year")["sales"].sum().reset_index()
+    def figura_ventas_year():
+        sales_year = vista["ventas_year"]
 
-    # Gráfico de barras interactivo estilo Plotly
-    fig = px.bar(
-        sales_year,
-        x="year",
-        y="sales",
-        text="sales",  # mostrar valores sobre las barras
-        color_discrete_sequence=["#FFA65B"]  # naranja intenso
-    )
+        # Gráfico de barras interactivo estilo Plotly
+        fig = px.bar(
+            sales_year,
+            x="year",
+            y="sales",
+            text="sales",  # mostrar valores sobre las barras
+            color_discrete_sequence=["#FFA65B"]  # naranja intenso
+        )
 
-    # Personalizar los valores sobre las barras
-    fig.update_traces(
-        texttemplate='%{y:.}',  # separador de miles
-        textposition='outside',
-        textfont_size=14
-    )
+        # Personalizar los valores sobre las barras
+        fig.update_traces(
+            texttemplate='%{y:.}',  # separador de miles
+            textposition='outside',
+            textfont_size=14
+        )
 
-    # Layout del gráfico
-    fig.update_layout(
-        title={
-            'text': '<b>Ventas por año</b>',
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size':20, 'family':'Arial', 'color':'#000000'}
-        },
-        xaxis_title="Año",
-        yaxis_title="Ventas",
-        yaxis=dict(tickformat=',', showgrid=True, gridcolor='rgba(0,0,0,0.1)'),
-        xaxis_tickangle=-45,
-        margin=dict(t=80, b=100),
-        height=700
-    )
+        # Layout del gráfico
+        fig.update_layout(
+            title={
+                'text': '<b>Ventas por año</b>',
+                'x': 0.5,
+                'xanchor': 'center',
+                'font': {'size':20, 'family':'Arial', 'color':'#000000'}
+            },
+            xaxis_title="Año",
+            yaxis_title="Ventas",
+            yaxis=dict(tickformat=',', showgrid=True, gridcolor='rgba(0,0,0,0.1)'),
+            xaxis_tickangle=-45,
+            margin=dict(t=80, b=100),
+            height=700
+        )
+
+        return fig
 
-    # Mostrar en Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_figura("ventas_year", figura_ventas_year, store)
 
     st.markdown(" ")
     st.markdown(" ")
@@ -749,17 +1012,17 @@ elif pagina == "📋​ Análisis por tienda":
     cola, colb = st.columns(2)
 
     with cola:
-        total_ventas = int(df_store["sales"].sum())
+        total_ventas = vista["ventas"]
         kpi_card_shop(
             "Productos vendidos",
-            f"{total_ventas:,}".replace(",", " ")  # convierte la coma en espacio
+            miles(total_ventas)
         )
 
     with colb:
-        promo_products = df_store[df_store["onpromotion"] > 0].shape[0]
+        promo_products = vista["promo"]
         kpi_card_shop(
             "Productos en promoción",
-            f"{promo_products:,}".replace(",", " ")  # idem
+            miles(promo_products)
         )
 
 
@@ -812,7 +1075,7 @@ elif pagina == "🌐​ Análisis por Estado":
     with col2:
         state = st.selectbox(
             "",
-            sorted(df["state"].unique())  
+            list(cubo["estados"].index)
         )
     st.markdown(" ")
     st.markdown(" ")
@@ -837,161 +1100,153 @@ elif pagina == "🌐​ Análisis por Estado":
         "Tungurahua": (-1.2500, -78.5000)
     }
 
-    df_map = pd.DataFrame([{
-        "state": state,
-        "lat": state_coords[state][0],
-        "lon": state_coords[state][1]
-    }])
-
-    # Creamos el mapa
-    fig_map = px.scatter_mapbox(
-        df_map,
-        lat="lat",
-        lon="lon",
-        hover_name="state",
-        size=[30],  # tamaño grande para marcar
-        color_discrete_sequence=["#C0392B"],  # color destacado
-    )
+    def figura_mapa():
+        df_map = pd.DataFrame([{
+            "state": state,
+            "lat": state_coords[state][0],
+            "lon": state_coords[state][1]
+        }])
+
+        # Creamos el mapa
+        fig_map = px.scatter_mapbox(
+            df_map,
+            lat="lat",
+            lon="lon",
+            hover_name="state",
+            size=[30],  # tamaño grande para marcar
+            color_discrete_sequence=["#C0392B"],  # color destacado
+        )
 
-    # Personalizamos el layout
-    fig_map.update_layout(
-        mapbox=dict(
-            style="open-street-map",  # base gris minimalista
-            center={"lat": -1.7, "lon": -80.5},  # centrado en Ecuador
-            zoom=5.7,
-        ),
-        margin=dict(t=0, b=0, l=10, r=0),
-        height=500,
-        showlegend=False
-    )
+        # Personalizamos el layout
+        fig_map.update_layout(
+            mapbox=dict(
+                style="open-street-map",  # base gris minimalista
+                center={"lat": -1.7, "lon": -80.5},  # centrado en Ecuador
+                zoom=5.7,
+            ),
+            margin=dict(t=0, b=0, l=10, r=0),
+            height=500,
+            showlegend=False
+        )
 
-    # Añadimos etiqueta de texto del estado directamente sobre el punto
-    fig_map.add_scattermapbox(
-        lat=[state_coords[state][0]],
-        lon=[state_coords[state][1]],
-        mode="text",
-        text=[state],
-        textposition="top center",
-        textfont=dict(size=16, color="#C0392B", family="Arial Black")
-    )
+        # Añadimos etiqueta de texto del estado directamente sobre el punto
+        fig_map.add_scattermapbox(
+            lat=[state_coords[state][0]],
+            lon=[state_coords[state][1]],
+            mode="text",
+            text=[state],
+            textposition="top center",
+            textfont=dict(size=16, color="#C0392B", family="Arial Black")
+        )
+
+        return fig_map
 
-    # Mostrar en Streamlit
-    st.plotly_chart(fig_map, use_container_width=True)
+    mostrar_figura("mapa", figura_mapa, state)
     st.markdown(" ")
     st.markdown(" ")
 
 
-    df_state = df[df["state"]==state]
+    with diag.seccion("vista_estado") as registro:
+        fallos = fallos_cache("load_vista_estado")
+        vista = load_vista_estado(version, state, cubo)
+        registro["cache"] = "fallo" if fallos_cache("load_vista_estado") > fallos else "acierto"
 
     col3, col4 = st.columns(2)
 
     with col4:
     # Transacciones por año
-        transactions = df_state.groupby("year")["transactions"].sum().reset_index()
-
-        # Gráfico de línea interactivo
-        fig = px.line(
-            transactions,
-            x="year",
-            y="transactions",
-            markers=True,  # puntitos sobre la línea
-            color_discrete_sequence=["#FF8FD6"]  # naranja intenso
-        )
-
-        # Añadir valores sobre los puntos
-        fig.update_traces(
-            texttemplate='<b>%{y:.}</b>',
-            textposition='top center',
-            textfont=dict(size=14, family='Arial', color='#000000'),
-            line=dict(width=3)
-        )
-
-        # Layout del gráfico
-        fig.update_layout(
-            title={
-                'text': f"<b>Transacciones por año </b>",
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size':16, 'family':'Arial', 'color':'#000000'}
-            },
-            xaxis_title="Año",
-            yaxis_title="Número de transacciones",
-            yaxis=dict(tickformat=',', showgrid=True, gridcolor='rgba(0,0,0,0.1)'),
-            xaxis=dict(dtick=1,showgrid=True),  # mostrar cada año
-            margin=dict(t=80, b=100, l=60, r=40),
-            height=550
-        )
-
-        # Mostrar en Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+        def figura_transacciones():
+            transactions = vista["transacciones"]
+
+            # Gráfico de línea interactivo
+            fig = px.line(
+                transactions,
+                x="year",
+                y="transactions",
+                markers=True,  # puntitos sobre la línea
+                color_discrete_sequence=["#FF8FD6"]  # naranja intenso
+            )
+
+            # Añadir valores sobre los puntos
+            fig.update_traces(
+                texttemplate='<b>%{y:.}</b>',
+                textposition='top center',
+                textfont=dict(size=14, family='Arial', color='#000000'),
+                line=dict(width=3)
+            )
+
+            # Layout del gráfico
+            fig.update_layout(
+                title={
+                    'text': f"<b>Transacciones por año </b>",
+                    'x': 0.5,
+                    'xanchor': 'center',
+                    'font': {'size':16, 'family':'Arial', 'color':'#000000'}
+                },
+                xaxis_title="Año",
+                yaxis_title="Número de transacciones",
+                yaxis=dict(tickformat=',', showgrid=True, gridcolor='rgba(0,0,0,0.1)'),
+                xaxis=dict(dtick=1,showgrid=True),  # mostrar cada año
+                margin=dict(t=80, b=100, l=60, r=40),
+                height=550
+            )
+
+            return fig
+
+        mostrar_figura("transacciones", figura_transacciones, state)
 
     with col3:
-        ventas_tienda_estado = (
-            df_state.groupby("store_nbr")["sales"]
-            .sum()
-            .sort_values(ascending=False)
-            .head(10)
-            .reset_index()
-        )
-
-        # Etiquetas bonitas para el eje Y
-        ventas_tienda_estado["store_label"] = ventas_tienda_estado["store_nbr"].apply(
-            lambda x: f"Tienda {x}"
-        )
-
-        # Gráfico de barras horizontal interactivo
-        fig = px.bar(
-            ventas_tienda_estado,
-            y="store_label",
-            x="sales",
-            orientation="h",
-            text="sales",
-            color_discrete_sequence=["#50C878"]  # morado elegante
-        )
-
-        # Personalización de los valores
-        fig.update_traces(
-            texttemplate="<b>%{x:.}</b>",
-            textposition="outside",
-            textfont=dict(size=14)
-        )
-
-        # Layout coherente con el resto del dashboard
-        fig.update_layout(
-            title={
-                "text": f"<b>Ranking tiendas con más ventas</b>",
-                "x": 0.5,
-                "xanchor": "center",
-                "font": {"size": 15, "family": "Arial"}
-            },
-            xaxis_title="Ventas",
-            yaxis_title="",
-            yaxis=dict(autorange="reversed"),  # mayor venta arriba
-            xaxis=dict(tickformat=",", showgrid=True, gridcolor="rgba(0,0,0,0.1)"),
-            margin=dict(t=80, b=50, l=0, r=40),
-            height=520
-        )
-
-        # Mostrar gráfico
-        st.plotly_chart(fig, use_container_width=True)
+        def figura_ranking_tiendas():
+            # El ranking de cada estado ya viene calculado en el cubo; las
+            # etiquetas bonitas del eje Y (store_nombre) también
+            ventas_tienda_estado = vista["ranking_tiendas"]
+
+            # Gráfico de barras horizontal interactivo
+            fig = px.bar(
+                ventas_tienda_estado,
+                y="store_label",
+                x="sales",
+                orientation="h",
+                text="sales",
+                color_discrete_sequence=["#50C878"]  # morado elegante
+            )
+
+            # Personalización de los valores
+            fig.update_traces(
+                texttemplate="<b>%{x:.}</b>",
+                textposition="outside",
+                textfont=dict(size=14)
+            )
+
+            # Layout coherente con el resto del dashboard
+            fig.update_layout(
+                title={
+                    "text": f"<b>Ranking tiendas con más ventas</b>",
+                    "x": 0.5,
+                    "xanchor": "center",
+                    "font": {"size": 15, "family": "Arial"}
+                },
+                xaxis_title="Ventas",
+                yaxis_title="",
+                yaxis=dict(autorange="reversed"),  # mayor venta arriba
+                xaxis=dict(tickformat=",", showgrid=True, gridcolor="rgba(0,0,0,0.1)"),
+                margin=dict(t=80, b=50, l=0, r=40),
+                height=520
+            )
+
+            return fig
+
+        mostrar_figura("ranking_tiendas", figura_ranking_tiendas, state)
 
     #Producto más vendido
-    producto_top_estado = (
-        df_state.groupby("family")["sales"]
-        .sum()
-        .sort_values(ascending=False)
-        .reset_index()
-        .iloc[0]
-    )
-
-    producto_nombre = producto_top_estado["family"]
-    producto_ventas = int(producto_top_estado["sales"])
+    producto_nombre = vista["producto"]
+    producto_ventas = vista["producto_ventas"]
 
     st.markdown(" ")
 
     kpi_card_product(
     "Producto más vendido",
-    value=f"{producto_nombre} ({producto_ventas:,} ventas)".replace(",", " ")
+    value=f"{producto_nombre} ({miles(producto_ventas)} ventas)"
     )
 
 elif pagina == "📇​ Evolución Temporal":
@@ -1020,37 +1275,29 @@ elif pagina == "📇​ Evolución Temporal":
     st.markdown(" ")
 
 
-    # Ventas por año ordenado de más antiguo a menos
-    ventas_year = df.groupby("year")["sales"].sum().sort_index()
+    # Todos los números de la página salen de una sola llamada sobre el cubo
+    with diag.seccion("metricas_temporales") as registro:
+        fallos = fallos_cache("load_metricas_temporales")
+        metricas = load_metricas_temporales(version)
+        registro["cache"] = "fallo" if fallos_cache("load_metricas_temporales") > fallos else "acierto"
 
     #Calculamos el crecimiento a lo largo de los años
-    crecimiento_pct = (
-        (ventas_year.iloc[-1] - ventas_year.iloc[-2]) / ventas_year.iloc[-2] * 100
-    )
+    crecimiento_pct = metricas["crecimiento_pct"]
 
     #Cuánto de nuestro negocio depende de promociones
-    pct_promo = df[df["onpromotion"] > 0]["sales"].sum() / df["sales"].sum() * 100
-
-    #Cuánto hemos crecido en cada estado
-    crecimiento_estado = (
-        df.groupby(["state", "year"])["sales"].sum()
-        .reset_index()
-        .pivot(index="state", columns="year", values="sales")
-        .dropna()
-    )
-
-    crecimiento_estado["crecimiento"] = (
-        crecimiento_estado.iloc[:, -1] - crecimiento_estado.iloc[:, -2]
-    ) / crecimiento_estado.iloc[:, -2] * 100
-
+    pct_promo = metricas["pct_promo"]
 
     #Mejor y peor estado encuanto a ventas
-    estado_top = crecimiento_estado["crecimiento"].idxmax()
-    estado_peor = crecimiento_estado["crecimiento"].idxmin()
+    estado_top = metricas["estado_top"]
+    estado_peor = metricas["estado_peor"]
 
     col1, col2, col3, col4 = st.columns(4)
 
-    if crecimiento_pct < 0:
+    if pd.isna(crecimiento_pct):
+        # Con un solo año en el filtro no hay crecimiento que calcular
+        crecimiento_text = "—"
+        color_text_crecimiento = "#4A2C2A"
+    elif crecimiento_pct < 0:
         crecimiento_text = f"⬇ {crecimiento_pct:.1f} %"
         color_text_crecimiento= "#DC1929"
     else:
@@ -1117,71 +1364,165 @@ elif pagina == "📇​ Evolución Temporal":
 
     st.markdown(" ")
 
-    promo_state = (
-        df.groupby("state")
-        .agg(
-            ventas=("sales", "sum"),
-            promo=("onpromotion", lambda x: (x > 0).mean() * 100),
-            transacciones=("transactions", "sum")
+    def figura_promo_estado():
+        promo_state = metricas["promo_estado"]
+
+        # Crear gráfico de dispersión mejorado
+        colores = [
+        "#FFA65B",  # naranja intenso
+        "#6CA0DC",  # azul pastel más oscuro
+        "#C0392B",  # rojo intenso
+        "#7A3EBF",  # morado elegante más oscuro
+        "#4FB286",  # verde esmeralda oscuro
+        "#E6A75A",  # amarillo-anaranjado oscuro
+        "#5DA8B6",  # cyan oscuro
+        "#D77FA1"   # rosa oscuro
+    ]
+        fig = px.scatter(
+            promo_state,
+            x="promo",
+            y="ventas",
+            size="transacciones",
+            size_max=40,  # limitar tamaño de los puntos
+            color="ventas",  # color según ventas totales
+            color_discrete_sequence=colores,  # escala de color más elegante
+            hover_data={
+                "state": True,
+                "ventas": ":,.0f",  # formato con separador de miles
+                "promo": ":.1f",
+                "transacciones": ":,.0f"
+            },
+            labels={
+                "promo": "% productos en promoción",
+                "ventas": "Ventas totales",
+                "transacciones": "Transacciones"
+            }
+        )
+        fig.update_traces(
+            marker=dict(
+                line=dict(color="black", width=1.5)  # borde negro para remarcar
+            )
         )
-        .reset_index()
-    )
 
-    # Crear gráfico de dispersión mejorado
-    colores = [
-    "#FFA65B",  # naranja intenso
-    "#6CA0DC",  # azul pastel más oscuro
-    "#C0392B",  # rojo intenso
-    "#7A3EBF",  # morado elegante más oscuro
-    "#4FB286",  # verde esmeralda oscuro
-    "#E6A75A",  # amarillo-anaranjado oscuro
-    "#5DA8B6",  # cyan oscuro
-    "#D77FA1"   # rosa oscuro
-]
-    fig = px.scatter(
-        promo_state,
-        x="promo",
-        y="ventas",
-        size="transacciones",
-        size_max=40,  # limitar tamaño de los puntos
-        color="ventas",  # color según ventas totales
-        color_discrete_sequence=colores,  # escala de color más elegante
-        hover_data={
-            "state": True,
-            "ventas": ":,.0f",  # formato con separador de miles
-            "promo": ":.1f",
-            "transacciones": ":,.0f"
-        },
-        labels={
-            "promo": "% productos en promoción",
-            "ventas": "Ventas totales",
-            "transacciones": "Transacciones"
-        }
-    )
-    fig.update_traces(
-        marker=dict(
-            line=dict(color="black", width=1.5)  # borde negro para remarcar
+
+        # Layout más limpio
+        fig.update_layout(
+            height=550,
+            title={
+                "text": "<b>Promociones y ventas</b>",
+                "x": 0.5,
+                "xanchor": "center",
+                "font": {"size":18}
+            },
+            xaxis=dict(showgrid=True, title="% productos en promoción"),
+            yaxis=dict(showgrid=True, title="Ventas totales", tickformat=","),
+            coloraxis_colorbar=dict(title="Ventas"),
+            template="plotly_white"
         )
+
+        return fig
+
+    mostrar_figura("promo_estado", figura_promo_estado)
+    st.markdown(" ")
+
+    st.caption(
+        "Uplift: ventas extra de las filas en promoción frente a las filas sin promoción "
+        "de la misma tienda, familia y día de la semana. Las barras de error son el "
+        "intervalo de confianza del 95 %."
     )
 
+    def figura_uplift(tabla, eje, etiqueta, titulo):
+        # Barras horizontales con su intervalo de confianza, en rojo si no incluye el 0
+        tabla = tabla.dropna(subset=["uplift"]).sort_values("uplift")
+        tabla = tabla.assign(
+            mas=tabla["ic_sup"] - tabla["uplift"],
+            menos=tabla["uplift"] - tabla["ic_inf"],
+            resultado=np.where(tabla["significativo"], "Significativo", "No significativo"),
+        )
+        fig = px.bar(
+            tabla,
+            x="uplift",
+            y=eje,
+            orientation="h",
+            error_x="mas",
+            error_x_minus="menos",
+            color="resultado",
+            color_discrete_map={"Significativo": "#C21807", "No significativo": "#FFA65B"},
+            hover_data={"ic_inf": ":.1f", "ic_sup": ":.1f", "celdas": True, "mas": False, "menos": False},
+            labels={
+                "uplift": "Uplift de la promoción (%)",
+                eje: etiqueta,
+                "resultado": "",
+                "ic_inf": "IC 95 % inferior",
+                "ic_sup": "IC 95 % superior",
+                "celdas": "Celdas comparadas"
+            }
+        )
+        fig.add_vline(x=0, line_color="black", line_width=1)
+        fig.update_yaxes(categoryorder="array", categoryarray=list(tabla[eje]))
+        fig.update_layout(
+            title={"text": f"<b>{titulo}</b>", "x": 0.5, "xanchor": "center", "font": {"size": 18}},
+            height=max(400, 28 * len(tabla)),
+            template="plotly_white"
+        )
+        return fig
+
+    mostrar_figura(
+        "uplift_estado",
+        partial(
+            figura_uplift, metricas["uplift_estados"], "state", "Estado",
+            "Uplift de las promociones por estado"
+        )
+    )
 
-    # Layout más limpio
-    fig.update_layout(
-        height=550,
-        title={
-            "text": "<b>Promociones y ventas</b>",
-            "x": 0.5,
-            "xanchor": "center",
-            "font": {"size":18}
-        },
-        xaxis=dict(showgrid=True, title="% productos en promoción"),
-        yaxis=dict(showgrid=True, title="Ventas totales", tickformat=","),
-        coloraxis_colorbar=dict(title="Ventas"),
-        template="plotly_white"
+    # Desglose: familias de todo el país, de un estado o de una tienda, y
+    # tiendas de un estado. Son cortes de tablas ya calculadas en el cubo
+    col1, col2 = st.columns(2)
+    with col1:
+        estado_uplift = st.selectbox(
+            "Estado", ["Todos"] + list(metricas["uplift_estados"]["state"].sort_values()),
+            key="estado_uplift"
+        )
+    tiendas_uplift = (
+        particion(cubo, "uplift_tiendas", estado_uplift) if estado_uplift != "Todos" else None
     )
+    with col2:
+        tienda_uplift = st.selectbox(
+            "Tienda",
+            ["Todas"] + ([] if tiendas_uplift is None else list(tiendas_uplift["store_nbr"])),
+            key="tienda_uplift"
+        )
+
+    if estado_uplift == "Todos":
+        familias_uplift, ambito = cubo["uplift_familias"], "todas las tiendas"
+    elif tienda_uplift == "Todas":
+        familias_uplift = particion(cubo, "uplift_estado_familia", estado_uplift)
+        ambito = estado_uplift
+    else:
+        familias_uplift = particion(cubo, "uplift_tienda_familia", tienda_uplift)
+        ambito = f"Tienda {tienda_uplift}"
 
-    # Mostrar en Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        mostrar_figura(
+            "uplift_familias",
+            partial(
+                figura_uplift, familias_uplift, "family", "Familia",
+                f"Uplift por familia ({ambito})"
+            ),
+            (estado_uplift, tienda_uplift)
+        )
+    if tiendas_uplift is not None and tienda_uplift == "Todas":
+        with col2:
+            mostrar_figura(
+                "uplift_tiendas",
+                partial(
+                    figura_uplift,
+                    tiendas_uplift.assign(tienda="Tienda " + tiendas_uplift["store_nbr"].astype(str)),
+                    "tienda", "Tienda", f"Uplift por tienda ({estado_uplift})"
+                ),
+                estado_uplift
+            )
     st.markdown(" ")
     st.markdown(" ")
     st.divider()
@@ -1207,40 +1548,33 @@ elif pagina == "📇​ Evolución Temporal":
 
     st.markdown(" ")
 
-    eficiencia = (
-        df.groupby("store_type")
-        .agg(
-            ventas_totales=("sales", "sum"),
-            tiendas=("store_nbr", "nunique")
-        )
-        .reset_index()
-    )
+    def figura_eficiencia():
+        eficiencia = metricas["eficiencia"].reset_index()
 
-    eficiencia["ventas_por_tienda"] = eficiencia["ventas_totales"] / eficiencia["tiendas"]
-
-    fig = px.bar(
-        eficiencia,
-        x="store_type",
-        y="ventas_por_tienda",
-        text="ventas_por_tienda",
-        color_discrete_sequence=["#FF9288"]
-    )
+        fig = px.bar(
+            eficiencia,
+            x="store_type",
+            y="ventas_por_tienda",
+            text="ventas_por_tienda",
+            color_discrete_sequence=["#FF9288"]
+        )
 
-    fig.update_traces(
-        texttemplate="<b>%{y:,.0f}</b>",
-        textposition="outside"
-    )
+        fig.update_traces(
+            texttemplate="<b>%{y:,.0f}</b>",
+            textposition="outside"
+        )
 
-    fig.update_layout(
-        height=450,
-        yaxis=dict(tickformat=","),
-        title={
-            "text":"<b>Ventas medias por tienda</b>",
-            "x": 0.5
-        }
-    )
+        fig.update_layout(
+            height=450,
+            yaxis=dict(tickformat=","),
+            title={
+                "text":"<b>Ventas medias por tienda</b>",
+                "x": 0.5
+            }
+        )
+        return fig
 
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_figura("eficiencia", figura_eficiencia)
 
     st.markdown(" ")
     st.markdown(" ")
@@ -1264,69 +1598,106 @@ elif pagina == "📇​ Evolución Temporal":
 
     st.markdown(" ")
 
-    festivos = df.copy()
-    festivos["es_festivo"] = festivos["holiday_type"].notna()
-
-    ventas_festivos = (
-        festivos.groupby("es_festivo")["sales"]
-        .mean()
-        .reset_index()
-    )
-
-    ventas_festivos["es_festivo"] = ventas_festivos["es_festivo"].map({
-        True: "Festivos",
-        False: "No festivos"
-    })
+    festivo_dia = metricas["festivo_dia"]
 
     col1, col2 = st.columns(2)
     with col1:
-        fig = px.bar(
-            ventas_festivos,
-            x="es_festivo",
-            y="sales",
-            text="sales", # clave
-            color_discrete_sequence =["#C77DFF"]
-        )
-
-        fig.update_traces(
-            texttemplate="<b>%{y:,.0f}</b>",
-            textposition="outside"
-        )
-
-        fig.update_layout(
-            height=450,
-            title={
-                "text":"<b>Ventas medias días festivos y laborables</b>",
-                "x": 0.3
-            },
-            yaxis=dict(tickformat=",")
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
+        def figura_festivos():
+            ventas_festivos = (
+                metricas["festivos"]
+                .rename("sales")
+                .reset_index()
+            )
+
+            ventas_festivos["es_festivo"] = ventas_festivos["es_festivo"].map({
+                True: "Festivos",
+                False: "No festivos"
+            })
+
+            fig = px.bar(
+                ventas_festivos,
+                x="es_festivo",
+                y="sales",
+                text="sales", # clave
+                color_discrete_sequence =["#C77DFF"]
+            )
+
+            fig.update_traces(
+                texttemplate="<b>%{y:,.0f}</b>",
+                textposition="outside"
+            )
+
+            fig.update_layout(
+                height=450,
+                title={
+                    "text":"<b>Ventas medias días festivos y laborables</b>",
+                    "x": 0.3
+                },
+                yaxis=dict(tickformat=",")
+            )
+            return fig
+
+        mostrar_figura("festivos", figura_festivos)
 
     with col2:
-    # Filtrar solo los días festivos
-        df_holiday = df[df["holiday_type"].notnull()]
-
-        # Agrupar por día de la semana del festivo y calcular ventas medias
-        ventas_por_dia_festivo = (
-            df_holiday.groupby("day_of_week")["sales"]
-            .mean()
-            .reindex(["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"])
-            .reset_index()
+        def figura_festivos_dia_semana():
+            # Ventas medias de los festivos según el día de la semana
+            ventas_por_dia_festivo = (
+                metricas["festivos_dia_semana"].rename("sales").reset_index()
+            )
+
+            # Gráfico de barras con colores agradables
+            fig = px.bar(
+                ventas_por_dia_festivo,
+                x="day_of_week",
+                y="sales",
+                text="sales",
+                color="sales",
+                color_continuous_scale="Tealgrn",
+                labels={"day_of_week":"Día de la semana", "sales":"Ventas medias"}
+            )
+
+            fig.update_traces(
+                texttemplate="%{y:,.0f}",
+                textposition="outside"
+            )
+
+            fig.update_layout(
+                title={
+                    "text": "<b>Ventas medias en festivos según el día de la semana</b>",
+                    "x": 0.2
+                },
+                yaxis=dict(tickformat=","),
+                xaxis_tickangle=-45,
+                height=500
+            )
+            return fig
+
+        mostrar_figura("festivos_dia_semana", figura_festivos_dia_semana)
+
+    # Ventas según día de la semana y tipo de festivo
+    def figura_ventas_dia_festivo():
+        ventas_dia_festivo = (
+            festivo_dia[["day_of_week", "holiday_type", "sales"]]
+            .sort_values(["day_of_week", "holiday_type"])
+            .rename(columns={"sales": "ventas"})
         )
 
-        # Gráfico de barras con colores agradables
+        # Gráfico de barras agrupadas
         fig = px.bar(
-            ventas_por_dia_festivo,
+            ventas_dia_festivo,
             x="day_of_week",
-            y="sales",
-            text="sales",
-            color="sales",
-            color_continuous_scale="Tealgrn",
-            labels={"day_of_week":"Día de la semana", "sales":"Ventas medias"}
-        )
+            y="ventas",
+            color="holiday_type",
+            barmode="group",
+            text="ventas",
+            labels={"ventas": "Ventas totales", "day_of_week": "Día de la semana", "holiday_type": "Tipo de festivo"},
+            color_discrete_sequence=["#2E8B57","#66CDAA","#A3C586","#4CAF50", "#8FBC8F", "#CFE8D2"],
+            category_orders={"day_of_week": DIAS_SEMANA}
+            )  
+
 
+        # Personalización del layout
         fig.update_traces(
             texttemplate="%{y:,.0f}",
             textposition="outside"
@@ -1334,60 +1705,234 @@ elif pagina == "📇​ Evolución Temporal":
 
         fig.update_layout(
             title={
-                "text": "<b>Ventas medias en festivos según el día de la semana</b>",
-                "x": 0.2
+                "text": "<b>Ventas según día de la semana y tipo de festivo</b>",
+                "x": 0.4
             },
-            yaxis=dict(tickformat=","),
-            xaxis_tickangle=-45,
-            height=500
+            yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', tickformat=','),
+            xaxis=dict(showgrid=False),
+            separators=". "  # separar miles con espacio
         )
 
-        st.plotly_chart(fig, use_container_width=True)
+        return fig
 
-    # Ventas según día de la semana y tipo de festivo
-    ventas_dia_festivo = (
-        df.groupby(["day_of_week", "holiday_type"])
-        .agg(ventas=("sales", "sum"))
-        .reset_index()
-    )
-    orden_dias = [
-    "Monday", "Tuesday", "Wednesday",
-    "Thursday", "Friday", "Saturday", "Sunday"
-    ]
+    mostrar_figura("ventas_dia_festivo", figura_ventas_dia_festivo)
 
-    # Gráfico de barras agrupadas
-    fig = px.bar(
-        ventas_dia_festivo,
-        x="day_of_week",
-        y="ventas",
-        color="holiday_type",
-        barmode="group",
-        text="ventas",
-        labels={"ventas": "Ventas totales", "day_of_week": "Día de la semana", "holiday_type": "Tipo de festivo"},
-        color_discrete_sequence=["#2E8B57","#66CDAA","#A3C586","#4CAF50", "#8FBC8F", "#CFE8D2"],
-        category_orders={ "day_of_week": orden_dias}
-        )  
-    
 
-    # Personalización del layout
-    fig.update_traces(
-        texttemplate="%{y:,.0f}".replace(",", " "),  # separar miles con espacio
-        textposition="outside"
-    )
+elif pagina == "🔮​ Pronóstico":
 
-    fig.update_layout(
-        title={
-            "text": "<b>Ventas según día de la semana y tipo de festivo</b>",
-            "x": 0.4
-        },
-        yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', tickformat=','),
-        xaxis=dict(showgrid=False)
+    # Título centrado
+    col1, col2, col3 = st.columns([1.1, 2, 1])
+    with col2:
+        st.markdown(
+            """
+            <h1 style="
+                color: #E69118;           /* rojo anaranjado */
+                font-family: 'Times New Roman', serif; /* letra elegante */
+                font-weight: bold;
+                text-align: center;
+                text-shadow: 1px 1px 2px rgba(0,0,0,0.3);
+                margin-bottom: 20px;
+                font-size: 45px;
+            ">
+                PRONÓSTICO
+            </h1>
+            """,
+            unsafe_allow_html=True
+        )
+    st.divider()
+    st.caption(
+        "Ventas semanales previstas por tienda y familia. El pronóstico usa todo "
+        "el histórico: no aplica los filtros de la barra lateral."
     )
 
-    # Mostrar en Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    version_base = version_datos(firma)
+    with diag.seccion("series") as registro:
+        fallos = fallos_cache("load_series")
+        try:
+            series = load_series(version_base)
+        except (OSError, RuntimeError) as error:
+            st.warning(f"No se han podido cargar las ventas para el pronóstico: {error}")
+            st.stop()
+        registro["cache"] = "fallo" if fallos_cache("load_series") > fallos else "acierto"
+        registro["filas"] = int(series["ventas"].size)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        semanas = st.slider("Semanas", 1, 16, SEMANAS)
+    with col2:
+        tienda = st.selectbox("Tienda", ["Todas"] + list(np.unique(series["tiendas"])))
+    with col3:
+        familia = st.selectbox("Familia", ["Todas"] + list(np.unique(series["familias"])))
+    with col4:
+        st.markdown(" ")
+        modo_backtest = st.toggle(
+            "Backtest",
+            help="Pronostica las últimas semanas conocidas con el resto del histórico "
+                 "y las compara con las ventas reales"
+        )
+    modo = "backtest" if modo_backtest else "pronostico"
+
+    with diag.seccion("pronostico") as registro:
+        fallos = fallos_cache("load_pronostico")
+        try:
+            resultado = load_pronostico(version_base, semanas, modo)
+        except ValueError as error:
+            st.warning(str(error))
+            st.stop()
+        registro["cache"] = "fallo" if fallos_cache("load_pronostico") > fallos else "acierto"
+
+    # Series de la tienda y familia elegidas; se suman en una sola curva
+    seleccion = np.ones(len(series["tiendas"]), dtype=bool)
+    if tienda != "Todas":
+        seleccion &= series["tiendas"] == tienda
+    if familia != "Todas":
+        seleccion &= series["familias"] == familia
+    if not seleccion.any():
+        st.warning("Esa tienda no vende esa familia.")
+        st.stop()
+    previsto = resultado["previsto"][seleccion].sum(axis=0)
+
+    st.markdown(" ")
+    col1, col2, col3, col4 = st.columns(4)
+    if modo_backtest:
+        metricas = resultado["metricas"]
+        with col1:
+            kpi_card_resumen("Error (WAPE)", f"{metricas['wape']:.1f} %", "#4A2C2A", line_height=2.7)
+        with col2:
+            kpi_card_resumen(
+                "Error repitiendo la última semana", f"{metricas['wape_ingenuo']:.1f} %", "#4A2C2A"
+            )
+        with col3:
+            kpi_card_resumen(
+                "Sesgo", f"{metricas['sesgo_pct']:+.1f} %",
+                "#05A129" if abs(metricas["sesgo_pct"]) < 5 else "#DC1929", line_height=2.7
+            )
+        with col4:
+            kpi_card_resumen(
+                "Tiempo de ajuste", f"{metricas['segundos_ajuste']:.2f} s", "#4A2C2A", line_height=2.7
+            )
+    else:
+        with col1:
+            kpi_card_resumen("Ventas previstas", miles(int(previsto.sum())), "#05A129", line_height=2.7)
+        with col2:
+            kpi_card_resumen(
+                "Semana con más ventas",
+                resultado["fechas"][previsto.argmax()].strftime("%d/%m/%Y"), "#4A2C2A"
+            )
+        with col3:
+            kpi_card_resumen("Series ajustadas", miles(len(resultado["previsto"])), "#4A2C2A", line_height=2.7)
+        with col4:
+            kpi_card_resumen(
+                "Tiempo de ajuste", f"{resultado['segundos_ajuste']:.2f} s", "#4A2C2A", line_height=2.7
+            )
+    st.markdown(" ")
+    st.divider()
+
+    def figura_pronostico():
+        # Últimas semanas reales (en backtest, hasta el final de las reservadas)
+        # seguidas de las previstas
+        n_semanas = series["ventas"].shape[1] // 7
+        reservadas = semanas if modo_backtest else 0
+        historico, fechas = semanales(series, min(n_semanas, 26 + reservadas))
+        curvas = pd.concat([
+            pd.DataFrame({
+                "semana": fechas,
+                "sales": np.nansum(historico[seleccion], axis=0),
+                "tipo": "Real",
+            }),
+            pd.DataFrame({"semana": resultado["fechas"], "sales": previsto, "tipo": "Pronóstico"}),
+        ])
+
+        fig = px.line(
+            curvas,
+            x="semana",
+            y="sales",
+            color="tipo",
+            markers=True,
+            color_discrete_map={"Real": "#1E90FF", "Pronóstico": "#E69118"},
+            labels={"semana": "Semana que empieza el", "sales": "Ventas", "tipo": ""}
+        )
+        fig.update_layout(
+            title={
+                "text": "<b>Ventas semanales reales y previstas</b>",
+                "x": 0.5,
+                "xanchor": "center"
+            },
+            yaxis=dict(tickformat=",", showgrid=True, gridcolor="rgba(0,0,0,0.1)"),
+            separators=". ",
+            height=550
+        )
+        return fig
+
+    mostrar_figura("pronostico", figura_pronostico, (tienda, familia, semanas, modo))
+
+    if modo_backtest:
+        def figura_error_familia():
+            error_familia = (
+                resultado["wape_familia"].dropna().sort_values().reset_index()
+            )
+            fig = px.bar(
+                error_familia,
+                x="wape",
+                y="family",
+                orientation="h",
+                color="wape",
+                color_continuous_scale="OrRd",
+                labels={"wape": "WAPE (%)", "family": "Familia"}
+            )
+            fig.update_layout(
+                title={"text": "<b>Error del backtest por familia</b>", "x": 0.4},
+                height=max(400, 22 * len(error_familia)),
+                coloraxis_showscale=False
+            )
+            return fig
+
+        mostrar_figura("error_familia", figura_error_familia, semanas)
+    else:
+        # Pronóstico de todas las series para descargar
+        tabla = pd.DataFrame(
+            resultado["previsto"].round(2),
+            columns=[f.strftime("%Y-%m-%d") for f in resultado["fechas"]]
+        )
+        tabla.insert(0, "family", series["familias"])
+        tabla.insert(0, "store_nbr", series["tiendas"])
+        st.download_button(
+            "⬇️ Descargar pronóstico (CSV)",
+            tabla.to_csv(index=False).encode("utf-8"),
+            file_name=f"pronostico_{semanas}_semanas.csv",
+            mime="text/csv"
+        )
 
 
+#########################
+## DIAGNÓSTICO
+#########################
+if mostrar_diagnostico:
+    with panel_diagnostico.container():
+        st.subheader("🩺 Diagnóstico")
+        secciones = diag.tabla()
+        st.caption(f"{pagina}: {secciones['segundos'].sum():.3f} s en {len(secciones)} secciones")
+        st.dataframe(
+            secciones,
+            hide_index=True,
+            column_config={
+                "segundos": st.column_config.NumberColumn(format="%.4f"),
+                "pico_mb": st.column_config.NumberColumn("pico MB (proceso)", format="%.2f"),
+                "cache": st.column_config.TextColumn("caché (proceso)"),
+            }
+        )
+        st.caption(
+            "El pico de memoria y los fallos de caché son del proceso: incluyen lo que "
+            "hagan a la vez otras sesiones y el precálculo."
+        )
+        figuras = load_cache_figuras()
+        st.caption(
+            f"Caché de figuras: {figuras.aciertos} aciertos, {figuras.fallos} fallos, "
+            f"{len(figuras)} figuras ({figuras.bytes / 1024 ** 2:.1f} MB)"
+        )
+        st.caption("Funciones cacheadas (contadores del proceso)")
+        st.dataframe(estadisticas_caches(), hide_index=True)
+
 st.divider()
 st.caption("© 2025 - Cecilia Díaz Álvaro")
 
@@ -0,0 +1,135 @@
+"""Caché de figuras Plotly compartida por todas las sesiones del dashboard.
+
+Cada figura se guarda por (página, gráfico, selección, versión de datos):
+mientras no cambie ninguna de esas cosas, las recargas provocadas por otros
+controles (filtros de la barra lateral, etc.) reutilizan la figura ya
+construida en lugar de volver a ejecutar px.*, update_traces y update_layout.
+La caché es LRU y está limitada por el tamaño de las figuras serializadas.
+
+Para que las figuras no crezcan con el número de tiendas o de días, por
+encima de unos umbrales (configurables por variables de entorno) las series
+temporales se reducen con LTTB, los rankings se quedan en los N primeros más
+una barra "otras", y las líneas pasan a WebGL. Los datos completos se pueden
+descargar desde la página.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from ranking import posiciones_top, top_k
+
+
+# Límite de la caché: tamaño total de las figuras en JSON
+MAX_BYTES_FIGURAS = 64 * 1024 ** 2
+
+# Puntos máximos de una serie temporal antes de reducirla con LTTB
+MAX_PUNTOS_SERIE = int(os.environ.get("VENTAS_MAX_PUNTOS_SERIE", 2000))
+# Barras máximas de un ranking; el resto se agrupa en una barra "otras"
+MAX_BARRAS = int(os.environ.get("VENTAS_MAX_BARRAS", 60))
+# A partir de cuántos puntos se dibujan las líneas con WebGL en lugar de SVG
+UMBRAL_WEBGL = int(os.environ.get("VENTAS_UMBRAL_WEBGL", 1000))
+
+
+class CacheFiguras:
+    """LRU de figuras con límite de memoria, segura entre hilos."""
+
+    def __init__(self, max_bytes=MAX_BYTES_FIGURAS):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._figuras = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, construir):
+        """Figura guardada para clave; si no está, la construye y la guarda."""
+        with self._lock:
+            if clave in self._figuras:
+                self._figuras.move_to_end(clave)
+                self.aciertos += 1
+                return self._figuras[clave][0]
+            self.fallos += 1
+
+        fig = construir()
+        tamano = len(pio.to_json(fig, validate=False))
+        if tamano > self.max_bytes:
+            return fig  # no cabe: se devuelve sin guardar
+
+        with self._lock:
+            if clave not in self._figuras:
+                self._figuras[clave] = (fig, tamano)
+                self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                _, (_, liberado) = self._figuras.popitem(last=False)
+                self.bytes -= liberado
+        return fig
+
+    def __len__(self):
+        return len(self._figuras)
+
+
+def render_mode(puntos):
+    """render_mode de px.line/px.scatter según el número de puntos."""
+    return "webgl" if puntos > UMBRAL_WEBGL else "svg"
+
+
+def lttb(x, y, n):
+    """Posiciones de los n puntos que conserva Largest-Triangle-Three-Buckets.
+
+    Se quedan siempre el primer y el último punto; de cada tramo intermedio,
+    el que forma el triángulo mayor con el elegido antes y la media del tramo
+    siguiente. Si ya hay n puntos o menos se devuelven todos.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    total = len(x)
+    if n >= total or n < 3:
+        return np.arange(total)
+
+    bordes = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    bordes = np.append(bordes, total)
+    posiciones = np.empty(n, dtype=np.int64)
+    posiciones[0], posiciones[-1] = 0, total - 1
+    a = 0
+    for i in range(n - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        siguiente = slice(bordes[i + 1], bordes[i + 2])
+        mx, my = x[siguiente].mean(), y[siguiente].mean()
+        area = np.abs(
+            (x[a] - mx) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (my - y[a])
+        )
+        a = inicio + int(np.argmax(area))
+        posiciones[i + 1] = a
+    return posiciones
+
+
+def reducir_serie(tabla, x, y, n=None):
+    """La tabla con como mucho n filas (MAX_PUNTOS_SERIE) elegidas con LTTB."""
+    n = MAX_PUNTOS_SERIE if n is None else n
+    if len(tabla) <= n:
+        return tabla
+    return tabla.iloc[lttb(tabla[x], tabla[y], n)]
+
+
+def top_n_otros(serie, n=None, etiqueta="Otras"):
+    """Los n-1 valores mayores de la serie y la suma del resto en una sola entrada.
+
+    Si la serie tiene n valores o menos solo se ordena. Los n-1 primeros se
+    eligen sin ordenar el resto (ver ranking.py).
+    """
+    n = MAX_BARRAS if n is None else n
+    if len(serie) <= n:
+        return top_k(serie, n)
+    posiciones = posiciones_top(serie.to_numpy(), n - 1)
+    resto = np.ones(len(serie), dtype=bool)
+    resto[posiciones] = False
+    otras = pd.Series(
+        [serie[resto].sum()], index=[f"{etiqueta} ({int(resto.sum())})"]
+    )
+    top = serie.iloc[posiciones]
+    top.index = top.index.astype(str)
+    return pd.concat([top, otras]).rename_axis(serie.index.name).rename(serie.name)
@@ -0,0 +1,117 @@
+"""Filtros globales del dashboard (fechas, tiendas, estados y familias).
+
+Las filas de ventas se guardan una vez ordenadas por fecha: un rango de
+fechas es una búsqueda binaria que da un corte contiguo de filas, y la
+pertenencia a un conjunto de tiendas, estados o familias se resuelve con un
+mapa de bits indexado por el código de la categoría (o por el número de
+tienda), sin comparar textos. El coste de filtrar es proporcional al rango de
+fechas elegido, no al total de filas. Con las filas filtradas se construye un
+cubo igual que el completo, así que todas las páginas respetan el filtro.
+
+Las filas suelen ser la tabla Arrow mapeada en memoria de tabla_compartida:
+los índices son vistas de sus columnas (o, si la tabla tiene varios lotes,
+copias solo de las columnas de fecha, tienda y códigos) y solo las filas que
+pasan el filtro se convierten a pandas.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from datos import pa
+
+# Selección de la barra lateral. Las tuplas vacías significan "todos"
+Filtro = namedtuple("Filtro", ["desde", "hasta", "tiendas", "estados", "familias"])
+
+
+def filtro_activo(filtro, desde, hasta):
+    """True si el filtro deja fuera algo respecto al rango completo [desde, hasta]."""
+    return (
+        filtro.desde > desde or filtro.hasta < hasta
+        or bool(filtro.tiendas or filtro.estados or filtro.familias)
+    )
+
+
+def _numpy(trozos):
+    """Arrays de Arrow como un solo array de numpy (sin copia si es uno sin nulos)."""
+    partes = [trozo.to_numpy(zero_copy_only=False) for trozo in trozos]
+    return partes[0] if len(partes) == 1 else np.concatenate(partes)
+
+
+def _columna(tabla, col):
+    """Columna de la tabla como array de numpy."""
+    return _numpy(tabla.column(col).chunks)
+
+
+class IndiceVentas:
+    """Filas de ventas ordenadas por fecha con índices para filtrarlas.
+
+    Las filas pueden ser una tabla Arrow o un DataFrame.
+    """
+
+    def __init__(self, filas):
+        self.arrow = pa is not None and isinstance(filas, pa.Table)
+        if self.arrow:
+            if filas.column("date").num_chunks == 0:  # tabla vacía sin lotes
+                filas = filas.combine_chunks()
+            self.fechas = _columna(filas, "date")
+            if np.any(self.fechas[1:] < self.fechas[:-1]):
+                filas = filas.sort_by("date")
+                self.fechas = _columna(filas, "date")
+            self.tiendas = _columna(filas, "store_nbr")
+            self.categorias, self.codigos = {}, {}
+            for col in ["state", "family"]:
+                # En tabla_compartida todos los lotes comparten diccionario; si no,
+                # se unifican (con copia de los índices)
+                trozos = filas.column(col).chunks
+                if any(not t.dictionary.equals(trozos[0].dictionary) for t in trozos[1:]):
+                    trozos = filas.column(col).unify_dictionaries().chunks
+                self.categorias[col] = pd.Index(trozos[0].dictionary.to_pylist())
+                self.codigos[col] = _numpy(trozo.indices.fill_null(-1) for trozo in trozos)
+        else:
+            if not filas["date"].is_monotonic_increasing:
+                filas = filas.sort_values("date", kind="stable", ignore_index=True)
+            self.fechas = filas["date"].to_numpy()
+            self.tiendas = filas["store_nbr"].to_numpy()
+            self.categorias = {col: filas[col].cat.categories for col in ["state", "family"]}
+            self.codigos = {col: filas[col].cat.codes.to_numpy() for col in ["state", "family"]}
+        self.filas = filas
+        self.max_tienda = int(self.tiendas.max(initial=0))
+
+    def _mapa_categorias(self, col, valores):
+        # Una posición de más al final para el código -1 (valor ausente)
+        categorias = self.categorias[col]
+        mapa = np.zeros(len(categorias) + 1, dtype=bool)
+        codigos = categorias.get_indexer(list(valores))
+        mapa[codigos[codigos >= 0]] = True
+        return mapa
+
+    def _mapa_tiendas(self, tiendas):
+        mapa = np.zeros(self.max_tienda + 1, dtype=bool)
+        tiendas = np.asarray(tiendas, dtype=np.int64)
+        mapa[tiendas[(tiendas >= 0) & (tiendas < len(mapa))]] = True
+        return mapa
+
+    def filtrar(self, filtro):
+        """Filas dentro del rango de fechas (ambos extremos incluidos) y de los conjuntos."""
+        desde = np.datetime64(filtro.desde).astype(self.fechas.dtype)
+        hasta = np.datetime64(filtro.hasta).astype(self.fechas.dtype)
+        inicio = np.searchsorted(self.fechas, desde, side="left")
+        fin = np.searchsorted(self.fechas, hasta, side="right")
+        corte = slice(inicio, fin)
+
+        seleccion = None
+        if filtro.tiendas:
+            seleccion = self._mapa_tiendas(filtro.tiendas)[self.tiendas[corte]]
+        for col, valores in [("state", filtro.estados), ("family", filtro.familias)]:
+            if valores:
+                dentro = self._mapa_categorias(col, valores)[self.codigos[col][corte]]
+                seleccion = dentro if seleccion is None else seleccion & dentro
+
+        if self.arrow:
+            filas = self.filas.slice(inicio, fin - inicio)
+            if seleccion is not None:
+                filas = filas.filter(pa.array(seleccion))
+            return filas.to_pandas()
+        filas = self.filas.iloc[corte]
+        return filas if seleccion is None else filas[seleccion]
@@ -0,0 +1,108 @@
+"""Precálculo en segundo plano de las vistas de detalle (tiendas y estados).
+
+Las páginas "Análisis por tienda" y "Análisis por Estado" solo calculaban la
+selección actual al elegirla. Al terminar de cargar el cubo, fichero.py lanza
+un Calentador que, en un pool de hilos y sin bloquear la página, calcula la
+vista de cada tienda y de cada estado a través de las funciones cacheadas de
+la app: después, cualquier selección es un acierto de caché. Con el servicio
+de agregados (servicio.py) las vistas salen de peticiones HTTP, que es
+justo lo que mejor solapa un pool de hilos.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agregados import particion
+
+logger = logging.getLogger(__name__)
+
+# Hilos del precálculo; pocos para no quitar CPU a las sesiones
+HILOS = int(os.environ.get("VENTAS_HILOS_PRECALCULO", min(4, os.cpu_count() or 1)))
+PREFIJO_HILOS = "precalculo"
+
+
+class _SinAvisoContexto(logging.Filter):
+    # Las funciones cacheadas avisan de que el hilo no es de una sesión, lo
+    # que en los hilos del precálculo es lo esperado
+    def filter(self, registro):
+        return not threading.current_thread().name.startswith(PREFIJO_HILOS)
+
+
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+    _SinAvisoContexto()
+)
+
+
+def vista_tienda(cubo, store):
+    """Ventas por año y KPI de una tienda."""
+    datos = particion(cubo, "tiendas", store).iloc[0]
+    return {
+        "ventas_year": particion(cubo, "tienda_year", store)[["year", "sales"]],
+        "ventas": int(datos["sales"]),
+        "promo": int(datos["n_promo"]),
+    }
+
+
+def vista_estado(cubo, state):
+    """Transacciones por año, ranking de tiendas y producto más vendido de un estado."""
+    producto = particion(cubo, "ranking_familias_estado", state).iloc[0]
+    return {
+        "transacciones": particion(cubo, "estado_year", state)[["year", "transactions"]],
+        "ranking_tiendas": (
+            particion(cubo, "ranking_tiendas_estado", state)[["store_nombre", "sales"]]
+            .rename(columns={"store_nombre": "store_label"})
+        ),
+        "producto": producto["family"],
+        "producto_ventas": int(producto["sales"]),
+    }
+
+
+class Calentador:
+    """Ejecuta una lista de tareas en segundo plano y cuenta su progreso."""
+
+    def __init__(self, tareas, hilos=HILOS):
+        self.total = len(tareas)
+        self.hechas = 0
+        self.errores = 0
+        self.segundos = None
+        self.cancelado = False
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._pool = ThreadPoolExecutor(hilos, thread_name_prefix=PREFIJO_HILOS)
+        futuros = [self._pool.submit(self._ejecutar, tarea) for tarea in tareas]
+        if not futuros:
+            self.segundos = 0.0
+        # El pool se cierra solo cuando terminan las tareas
+        self._pool.shutdown(wait=False)
+
+    def _ejecutar(self, tarea):
+        try:
+            tarea()
+        except Exception:
+            logger.exception("Error en el precálculo")
+            with self._lock:
+                self.errores += 1
+        with self._lock:
+            self.hechas += 1
+            if self.hechas == self.total:
+                self.segundos = time.perf_counter() - self._inicio
+                logger.info(
+                    "Precálculo: %d vistas en %.1f s (%d errores)",
+                    self.total, self.segundos, self.errores
+                )
+
+    def cancelar(self):
+        """Descarta las tareas que aún no han empezado (p. ej. al salir de la caché)."""
+        self.cancelado = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def terminado(self):
+        # Uno cancelado ya no avanza: quien lo muestre deja de esperarlo
+        return self.cancelado or self.hechas == self.total
+
+    def progreso(self):
+        """Fracción hecha, entre 0 y 1."""
+        return self.hechas / self.total if self.total else 1.0
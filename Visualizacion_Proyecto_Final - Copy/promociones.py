@@ -0,0 +1,173 @@
+"""Efecto de las promociones (uplift) con intervalos de confianza.
+
+Comparar las ventas totales con y sin promoción mezcla el efecto de la
+promoción con el de qué se promociona: se promocionan más unas familias, unas
+tiendas o unos días que otros. Aquí se comparan celdas emparejadas tienda x
+familia x día de la semana: en cada celda, la venta media de las filas en
+promoción frente a la de las filas sin promoción.
+
+Para un grupo de celdas (un estado, una tienda, una familia...) el uplift es
+
+    sum(n_con * (media_con - media_sin)) / sum(n_con * media_sin)
+
+es decir, las ventas extra de las filas en promoción respecto a lo que habrían
+vendido sin ella. Es un cociente de dos sumas que dependen de las mismas
+medias, así que su intervalo de confianza (aproximación normal, celdas
+independientes) usa el método delta con las varianzas del numerador y del
+denominador y su covarianza. python promociones.py comprueba con datos
+simulados que el intervalo del 95 % cubre el uplift real un 95 % de las veces.
+
+Todo sale del nivel base "promo_celdas" del cubo: conteos, sumas y sumas de
+cuadrados por celda y promoción, que se suman entre bloques y partes como el
+resto de medidas. Las tablas de uplift de todos los estados, tiendas y
+familias se calculan a la vez con agrupaciones por columnas y el cubo las
+guarda particionadas para los desgloses.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Celda de comparación y claves del nivel base
+CLAVES_CELDA = ["store_nbr", "family", "day_of_week"]
+CLAVES_PROMO = CLAVES_CELDA + ["en_promo"]
+MEDIDAS_PROMO = ["n_ventas", "sales", "sales2"]
+
+# Filas mínimas con y sin promoción para usar una celda (hace falta la varianza)
+MIN_VENTAS = 2
+
+# Cuantil de la normal para intervalos del 95 %
+Z_95 = 1.959964
+
+# Tablas de uplift del cubo: claves de agrupación de cada una
+TABLAS_UPLIFT = {
+    "uplift_estados": ["state"],
+    "uplift_tiendas": ["state", "store_nbr"],
+    "uplift_familias": ["family"],
+    "uplift_estado_familia": ["state", "family"],
+    "uplift_tienda_familia": ["store_nbr", "family"],
+}
+
+
+def celdas_emparejadas(promo_celdas, tiendas):
+    """Celdas con filas con y sin promoción, con su efecto y su varianza.
+
+    - "efecto": ventas extra de las filas en promoción, n_con x (media_con - media_sin).
+    - "base": lo que habrían vendido sin promoción, n_con x media_sin.
+    - "varianza", "varianza_base", "covarianza": varianzas del efecto y de la
+      base y su covarianza (las dos dependen de media_sin).
+    """
+    en_promo = promo_celdas["en_promo"].astype(bool)
+    celdas = promo_celdas[~en_promo].merge(
+        promo_celdas[en_promo], on=CLAVES_CELDA, suffixes=("_sin", "_con")
+    )
+    celdas = celdas[
+        (celdas["n_ventas_sin"] >= MIN_VENTAS) & (celdas["n_ventas_con"] >= MIN_VENTAS)
+    ]
+    n_con = celdas["n_ventas_con"].to_numpy("float64")
+    n_sin = celdas["n_ventas_sin"].to_numpy("float64")
+    media_con = celdas["sales_con"].to_numpy() / n_con
+    media_sin = celdas["sales_sin"].to_numpy() / n_sin
+    # Varianzas muestrales a partir de sumas y sumas de cuadrados
+    var_con = np.maximum(celdas["sales2_con"].to_numpy() - n_con * media_con ** 2, 0) / (n_con - 1)
+    var_sin = np.maximum(celdas["sales2_sin"].to_numpy() - n_sin * media_sin ** 2, 0) / (n_sin - 1)
+
+    resultado = celdas[CLAVES_CELDA].assign(
+        n_con=n_con,
+        n_sin=n_sin,
+        efecto=n_con * (media_con - media_sin),
+        base=n_con * media_sin,
+        varianza=n_con ** 2 * (var_con / n_con + var_sin / n_sin),
+        varianza_base=n_con ** 2 * var_sin / n_sin,
+        covarianza=-(n_con ** 2) * var_sin / n_sin,
+    )
+    return resultado.merge(tiendas[["store_nbr", "state"]], on="store_nbr")
+
+
+def uplift_por(celdas, claves):
+    """Uplift (%) e intervalo de confianza del 95 % de cada grupo de celdas.
+
+    Varianza del cociente efecto / base por el método delta:
+    (var_efecto - 2 x cociente x cov + cociente² x var_base) / base².
+    """
+    suma = celdas.groupby(claves, observed=True).agg(
+        efecto=("efecto", "sum"),
+        base=("base", "sum"),
+        varianza=("varianza", "sum"),
+        varianza_base=("varianza_base", "sum"),
+        covarianza=("covarianza", "sum"),
+        n_promo=("n_con", "sum"),
+        celdas=("efecto", "size"),
+    )
+    base = suma["base"].where(suma["base"] > 0)
+    cociente = suma["efecto"] / base
+    varianza = (
+        suma["varianza"] - 2 * cociente * suma["covarianza"]
+        + cociente ** 2 * suma["varianza_base"]
+    ) / base ** 2
+    uplift = cociente * 100
+    margen = Z_95 * np.sqrt(np.maximum(varianza, 0)) * 100
+    tabla = suma[["celdas", "n_promo"]].assign(
+        uplift=uplift,
+        ic_inf=uplift - margen,
+        ic_sup=uplift + margen,
+        significativo=(uplift - margen > 0) | (uplift + margen < 0),
+    )
+    return tabla.reset_index()
+
+
+def tablas_uplift(promo_celdas, tiendas):
+    """Todas las tablas de TABLAS_UPLIFT a partir del nivel base de promociones."""
+    celdas = celdas_emparejadas(promo_celdas, tiendas)
+    return {nombre: uplift_por(celdas, claves) for nombre, claves in TABLAS_UPLIFT.items()}
+
+
+def simular_celdas(rng, n_celdas, uplift):
+    """Nivel base de promociones simulado con un uplift real conocido.
+
+    En cada celda la promoción multiplica la venta media por 1 + uplift. Las
+    medias y el número de filas con y sin promoción varían entre celdas; las
+    ventas siguen una gamma (asimétrica, como las reales).
+    """
+    media_sin = rng.gamma(2.0, 50.0, n_celdas)
+    forma = 1.5
+    partes = []
+    for en_promo, factor, n_filas in (
+        (False, 1.0, rng.integers(MIN_VENTAS, 40, n_celdas)),
+        (True, 1.0 + uplift, rng.integers(MIN_VENTAS, 12, n_celdas)),
+    ):
+        celda = np.repeat(np.arange(n_celdas), n_filas)
+        ventas = rng.gamma(forma, (media_sin * factor)[celda] / forma)
+        partes.append(pd.DataFrame({
+            "store_nbr": np.arange(n_celdas),
+            "family": "SIMULADA",
+            "day_of_week": "Lunes",
+            "en_promo": en_promo,
+            "n_ventas": n_filas,
+            "sales": np.bincount(celda, weights=ventas, minlength=n_celdas),
+            "sales2": np.bincount(celda, weights=ventas ** 2, minlength=n_celdas),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+def cobertura(simulaciones=1000, n_celdas=100, uplift=0.3, semilla=0):
+    """Fracción de simulaciones en que el intervalo del 95 % contiene el uplift real.
+
+    Todas las simulaciones se calculan a la vez: cada una es un "estado" con
+    sus n_celdas tiendas.
+    """
+    rng = np.random.default_rng(semilla)
+    promo_celdas = simular_celdas(rng, simulaciones * n_celdas, uplift)
+    tiendas = pd.DataFrame({"store_nbr": np.arange(simulaciones * n_celdas)})
+    tiendas["state"] = tiendas["store_nbr"] // n_celdas
+    tabla = uplift_por(celdas_emparejadas(promo_celdas, tiendas), ["state"])
+    return float(((tabla["ic_inf"] <= uplift * 100) & (uplift * 100 <= tabla["ic_sup"])).mean())
+
+
+if __name__ == "__main__":
+    # python promociones.py [simulaciones]: cobertura del intervalo del 95 %
+    simulaciones = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    resultado = cobertura(simulaciones)
+    print(f"Cobertura del IC 95 % en {simulaciones} simulaciones: {resultado:.1%}")
+    # Con 1000 simulaciones el error estándar de la cobertura es ~0.7 puntos
+    sys.exit(0 if 0.93 <= resultado <= 0.97 else 1)
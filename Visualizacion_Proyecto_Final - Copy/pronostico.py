@@ -0,0 +1,356 @@
+"""Pronóstico semanal de ventas por tienda y familia.
+
+Cada serie (una tienda x familia) se pronostica con una línea base estacional
+multiplicativa:
+
+    ventas del día = nivel x f_dia_semana x f_semana_del_año x f_festivo
+
+- f_dia_semana: perfil semanal de la serie en sus últimos DIAS_PERFIL días.
+- f_semana_del_año: estacionalidad anual de la familia (todas sus tiendas),
+  media del cociente entre sus ventas y su media móvil de un año en cada
+  semana ISO. Con menos de un año de histórico vale 1.
+- f_festivo: efecto de cada tipo de festivo (holiday_type), común a todas las
+  series. Los festivos futuros se suponen iguales a los de 52 semanas antes.
+- nivel: media de los últimos DIAS_NIVEL días de la serie sin esos factores.
+
+Todas las series se ajustan a la vez: las ventas se guardan en una matriz
+series x días (que se llena lote a lote, sin pasar todas las filas a pandas)
+y cada factor sale de productos de matrices y medias por ejes,
+sin un bucle de Python por serie. backtest() reserva las últimas semanas, las
+pronostica con el resto y da el error (WAPE, MAE, sesgo) junto al de un
+pronóstico ingenuo (repetir la última semana) y el tiempo de ajuste.
+
+Con el servicio de agregados (servicio.py) las series las construye el
+servicio y llegan en formato Arrow (series_a_arrow / series_de_arrow).
+
+    python pronostico.py [semanas]: backtest sobre los CSV del directorio actual
+"""
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from datos import FILAS_BLOQUE, pa, tabla_compartida
+
+logger = logging.getLogger(__name__)
+
+# Semanas que se pronostican por defecto
+SEMANAS = 8
+# Días recientes para el nivel y para el perfil de día de la semana
+DIAS_NIVEL = 28
+DIAS_PERFIL = 56
+# Ventana de la media móvil anual y desfase para los festivos futuros
+DIAS_AÑO = 364
+# Efecto máximo que se admite para un tipo de festivo
+LIMITES_FESTIVO = (0.5, 2.0)
+
+COLUMNAS = ["date", "store_nbr", "family", "sales", "holiday_type"]
+
+
+def _cociente(suma, cuenta):
+    """suma / cuenta con NaN donde no hay datos."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cuenta > 0, suma / np.where(cuenta > 0, cuenta, 1), np.nan)
+
+
+def _normalizar(medias):
+    """Factores por fila (media 1); 1 donde no se pueden calcular."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factores = medias / np.nanmean(medias, axis=1, keepdims=True)
+    return np.where(np.isfinite(factores) & (factores > 0), factores, 1.0)
+
+
+def _media_movil(matriz, ventana):
+    """Media móvil centrada por filas (NaN donde la ventana no cabe)."""
+    filas, n = matriz.shape
+    media = np.full((filas, n), np.nan)
+    if n < ventana:
+        return media
+    acumulada = np.concatenate([np.zeros((filas, 1)), np.cumsum(matriz, axis=1)], axis=1)
+    inicio = ventana // 2
+    media[:, inicio:inicio + n - ventana + 1] = (
+        acumulada[:, ventana:] - acumulada[:, :-ventana]
+    ) / ventana
+    return media
+
+
+def _calendario(fechas):
+    """Día de la semana (0-6) y semana ISO (0-52) de cada fecha."""
+    return fechas.dayofweek.to_numpy(), fechas.isocalendar().week.to_numpy(np.int64) - 1
+
+
+def _lotes(filas, filas_lote=FILAS_BLOQUE):
+    """DataFrames con COLUMNAS de filas_lote filas como mucho.
+
+    De una tabla Arrow solo se pasa a pandas un lote cada vez.
+    """
+    if pa is not None and isinstance(filas, pa.Table):
+        for lote in filas.select(COLUMNAS).to_batches(max_chunksize=filas_lote):
+            yield lote.to_pandas()
+    else:
+        for inicio in range(0, len(filas), filas_lote):
+            yield filas.iloc[inicio:inicio + filas_lote]
+
+
+def _valores(columna):
+    """Valores distintos (sin nulos) de una columna, categórica o no."""
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        return set(columna.cat.categories[np.unique(columna.cat.codes[columna.cat.codes >= 0])])
+    return set(columna.dropna().unique())
+
+
+def _codigos(columna, valores):
+    """Posición de cada valor de la columna en valores (-1 si es nulo)."""
+    columna = columna.astype("category")
+    codigos = pd.Index(valores).get_indexer(columna.cat.categories)
+    return np.where(columna.cat.codes >= 0, codigos[columna.cat.codes], -1)
+
+
+def series_diarias(filas, filas_lote=FILAS_BLOQUE):
+    """Matriz series x días con las ventas de cada tienda x familia.
+
+    filas es una tabla Arrow (tabla_compartida) o un DataFrame con COLUMNAS.
+    Se recorre dos veces por lotes: una para las fechas, tiendas, familias y
+    festivos que hay y otra para sumar las ventas de cada lote en la matriz,
+    así que la memoria depende del tamaño de la matriz y no de las filas.
+    Devuelve un dict con "ventas" (NaN donde no hay dato), la tienda y la
+    familia de cada serie, las fechas y el código del festivo de cada serie
+    y día (-1 si no hay) con sus "tipos".
+    """
+    inicio, fin = None, None
+    tiendas, familias, tipos = set(), set(), set()
+    for lote in _lotes(filas, filas_lote):
+        fechas = lote["date"].dropna()
+        if len(fechas):
+            inicio = fechas.min() if inicio is None else min(inicio, fechas.min())
+            fin = fechas.max() if fin is None else max(fin, fechas.max())
+        tiendas |= _valores(lote["store_nbr"])
+        familias |= _valores(lote["family"])
+        tipos |= _valores(lote["holiday_type"])
+    if inicio is None:
+        raise ValueError("No hay ventas con fecha para el pronóstico")
+    inicio = np.datetime64(inicio, "D")
+    n_dias = int((np.datetime64(fin, "D") - inicio).astype(np.int64)) + 1
+    tiendas, familias, tipos = sorted(tiendas), sorted(familias), sorted(tipos)
+    n_familias = len(familias)
+
+    # Cada fila cae en una celda (serie, día); las sumas de cada lote se hacen
+    # con bincount y se acumulan
+    tamano = len(tiendas) * n_familias * n_dias
+    suma = np.zeros(tamano)
+    cuenta = np.zeros(tamano, dtype=np.int64)
+    festivos_tienda = np.full((len(tiendas), n_dias), -1, dtype=np.int8)
+    for lote in _lotes(filas, filas_lote):
+        fechas = lote["date"].to_numpy("datetime64[D]")
+        cod_tienda = _codigos(lote["store_nbr"], tiendas)
+        cod_familia = _codigos(lote["family"], familias)
+        validas = ~np.isnat(fechas) & (cod_tienda >= 0) & (cod_familia >= 0)
+        dias = (fechas - inicio).astype(np.int64)
+        celda = (cod_tienda * n_familias + cod_familia) * n_dias + dias
+        ventas = lote["sales"].to_numpy("float64")
+        con_dato = validas & ~np.isnan(ventas)
+        suma += np.bincount(celda[con_dato], weights=ventas[con_dato], minlength=tamano)
+        cuenta += np.bincount(celda[con_dato], minlength=tamano)
+        festivos_tienda[cod_tienda[validas], dias[validas]] = (
+            _codigos(lote["holiday_type"], tipos)[validas]
+        )
+    matriz = np.where(cuenta > 0, suma, np.nan).reshape(-1, n_dias)
+
+    # Solo las combinaciones tienda x familia que tienen algún dato
+    activas = np.flatnonzero(cuenta.reshape(-1, n_dias).any(axis=1))
+    return {
+        "ventas": matriz[activas],
+        "tiendas": np.asarray(tiendas)[activas // n_familias],
+        "familias": np.asarray(familias, dtype=object)[activas % n_familias],
+        "codigo_familia": activas % n_familias,
+        "n_familias": n_familias,
+        "fechas": pd.date_range(pd.Timestamp(inicio), periods=n_dias, freq="D"),
+        "festivos": festivos_tienda[activas // n_familias],
+        "tipos": tipos,
+    }
+
+
+def series_a_arrow(series):
+    """Series como tabla Arrow: una fila por serie y los días en listas de tamaño fijo."""
+    n_dias = series["ventas"].shape[1]
+    tabla = pa.table({
+        "store_nbr": series["tiendas"],
+        "family": series["familias"],
+        "codigo_familia": series["codigo_familia"],
+        "ventas": pa.FixedSizeListArray.from_arrays(pa.array(series["ventas"].ravel()), n_dias),
+        "festivos": pa.FixedSizeListArray.from_arrays(
+            pa.array(series["festivos"].ravel()), n_dias
+        ),
+    })
+    return tabla.replace_schema_metadata({
+        "inicio": series["fechas"][0].isoformat(),
+        "n_familias": str(series["n_familias"]),
+        "tipos": json.dumps(series["tipos"]),
+    })
+
+
+def series_de_arrow(tabla):
+    """Inverso de series_a_arrow."""
+    metadatos = tabla.schema.metadata
+    n_dias = tabla.schema.field("ventas").type.list_size
+
+    def matriz(col):
+        valores = tabla.column(col).combine_chunks().flatten()
+        return valores.to_numpy(zero_copy_only=False).reshape(tabla.num_rows, n_dias)
+
+    return {
+        "ventas": matriz("ventas"),
+        "tiendas": tabla.column("store_nbr").to_numpy(),
+        "familias": tabla.column("family").to_numpy(zero_copy_only=False),
+        "codigo_familia": tabla.column("codigo_familia").to_numpy(),
+        "n_familias": int(metadatos[b"n_familias"]),
+        "fechas": pd.date_range(
+            pd.Timestamp(metadatos[b"inicio"].decode()), periods=n_dias, freq="D"
+        ),
+        "festivos": matriz("festivos"),
+        "tipos": json.loads(metadatos[b"tipos"]),
+    }
+
+
+def ajustar(series, hasta=None):
+    """Factores y nivel de todas las series con los días anteriores a hasta."""
+    ventas = series["ventas"][:, :hasta]
+    festivos = series["festivos"][:, :hasta]
+    n_dias = ventas.shape[1]
+    dia_semana, semana = _calendario(series["fechas"][:n_dias])
+    hay = ~np.isnan(ventas)
+    y = np.where(hay, ventas, 0.0)
+
+    # Perfil de día de la semana de cada serie (series x 7)
+    reciente = slice(max(0, n_dias - DIAS_PERFIL), n_dias)
+    uno_dia = np.eye(7)[dia_semana[reciente]]
+    f_dia = _normalizar(_cociente(y[:, reciente] @ uno_dia, hay[:, reciente] @ uno_dia))
+
+    # Estacionalidad anual de cada familia (familias x 53)
+    familia = series["codigo_familia"]
+    pertenece = np.eye(series["n_familias"])[familia].T
+    total = pertenece @ y
+    ratio = _cociente(total, _media_movil(total, DIAS_AÑO))
+    valido = np.isfinite(ratio) & ((pertenece @ hay) > 0)
+    uno_semana = np.eye(53)[semana]
+    f_semana = _cociente(np.where(valido, ratio, 0.0) @ uno_semana, valido @ uno_semana)
+    f_semana = np.where(np.isfinite(f_semana) & (f_semana > 0), f_semana, 1.0)
+
+    # Efecto de cada tipo de festivo frente a los días normales de la misma serie.
+    # La última posición (código -1, sin festivo) vale 1
+    normal = hay & (festivos < 0)
+    media_normal = _cociente((y * normal).sum(axis=1), normal.sum(axis=1))
+    f_festivo = np.ones(len(series["tipos"]) + 1)
+    for codigo in range(len(series["tipos"])):
+        en_festivo = hay & (festivos == codigo)
+        esperado = np.nansum(en_festivo.sum(axis=1) * media_normal)
+        if esperado > 0:
+            f_festivo[codigo] = np.clip(y[en_festivo].sum() / esperado, *LIMITES_FESTIVO)
+
+    # Nivel: media reciente de las ventas sin los factores
+    ultimos = slice(max(0, n_dias - DIAS_NIVEL), n_dias)
+    factor = (
+        f_dia[:, dia_semana[ultimos]]
+        * f_semana[familia][:, semana[ultimos]]
+        * f_festivo[festivos[:, ultimos]]
+    )
+    nivel = _cociente(np.where(hay[:, ultimos], y[:, ultimos] / factor, 0.0).sum(axis=1),
+                      hay[:, ultimos].sum(axis=1))
+    return {
+        "nivel": np.nan_to_num(nivel),
+        "f_dia": f_dia,
+        "f_semana": f_semana,
+        "f_festivo": f_festivo,
+        "familia": familia,
+        "festivos": festivos,
+        "fechas": series["fechas"][:n_dias],
+    }
+
+
+def predecir(modelo, semanas=SEMANAS):
+    """Ventas semanales previstas (series x semanas) y fecha de inicio de cada semana."""
+    n_dias = len(modelo["fechas"])
+    fechas = pd.date_range(modelo["fechas"][-1] + pd.Timedelta(days=1), periods=7 * semanas)
+    dia_semana, semana = _calendario(fechas)
+    atras = np.arange(n_dias, n_dias + 7 * semanas) - DIAS_AÑO
+    festivos = np.where(atras >= 0, modelo["festivos"][:, np.clip(atras, 0, None)], -1)
+    diario = (
+        modelo["nivel"][:, None]
+        * modelo["f_dia"][:, dia_semana]
+        * modelo["f_semana"][modelo["familia"]][:, semana]
+        * modelo["f_festivo"][festivos]
+    )
+    return diario.reshape(len(diario), semanas, 7).sum(axis=2), fechas[::7]
+
+
+def pronosticar(series, semanas=SEMANAS):
+    """Pronóstico de las próximas semanas con todo el histórico."""
+    inicio = time.perf_counter()
+    previsto, fechas = predecir(ajustar(series), semanas)
+    return {"previsto": previsto, "fechas": fechas, "segundos_ajuste": time.perf_counter() - inicio}
+
+
+def semanales(series, semanas, hasta=None):
+    """Ventas reales de las semanas que terminan en hasta (series x semanas).
+
+    Las semanas sin ningún dato de la serie son NaN.
+    """
+    hasta = series["ventas"].shape[1] if hasta is None else hasta
+    desde = hasta - 7 * semanas
+    bloque = series["ventas"][:, desde:hasta].reshape(len(series["ventas"]), semanas, 7)
+    hay = ~np.isnan(bloque)
+    reales = np.where(hay.any(axis=2), np.where(hay, bloque, 0.0).sum(axis=2), np.nan)
+    return reales, series["fechas"][desde:hasta:7]
+
+
+def _wape(real, previsto):
+    hay = ~np.isnan(real)
+    return np.abs(previsto[hay] - real[hay]).sum() / np.abs(real[hay]).sum() * 100
+
+
+def backtest(series, semanas=SEMANAS):
+    """Pronostica las últimas semanas con el resto del histórico y mide el error."""
+    corte = series["ventas"].shape[1] - 7 * semanas
+    if corte < 14:
+        raise ValueError("No hay histórico suficiente para el backtest")
+    inicio = time.perf_counter()
+    previsto, fechas = predecir(ajustar(series, corte), semanas)
+    segundos = time.perf_counter() - inicio
+
+    real, _ = semanales(series, semanas)
+    ultima, _ = semanales(series, 1, corte)
+    ingenuo = np.repeat(np.nan_to_num(ultima), semanas, axis=1)
+    hay = ~np.isnan(real)
+    errores = pd.DataFrame({
+        "family": series["familias"],
+        "error": np.where(hay, np.abs(previsto - np.nan_to_num(real)), 0.0).sum(axis=1),
+        "real": np.nansum(real, axis=1),
+    }).groupby("family", observed=True).sum()
+    return {
+        "metricas": {
+            "wape": float(_wape(real, previsto)),
+            "wape_ingenuo": float(_wape(real, ingenuo)),
+            "mae": float(np.abs(previsto[hay] - real[hay]).mean()),
+            "sesgo_pct": float((previsto[hay].sum() - real[hay].sum()) / real[hay].sum() * 100),
+            "segundos_ajuste": segundos,
+            "series": len(previsto),
+            "semanas": semanas,
+        },
+        "real": real,
+        "previsto": previsto,
+        "fechas": fechas,
+        "wape_familia": (errores["error"] / errores["real"] * 100).rename("wape"),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    semanas = int(sys.argv[1]) if len(sys.argv) > 1 else SEMANAS
+    inicio = time.perf_counter()
+    series = series_diarias(tabla_compartida())
+    logger.info("%d series x %d días en %.1f s", *series["ventas"].shape,
+                time.perf_counter() - inicio)
+    print(json.dumps(backtest(series, semanas)["metricas"], indent=2))
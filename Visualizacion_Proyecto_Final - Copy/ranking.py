@@ -0,0 +1,67 @@
+"""Rankings (top-K) sobre tablas ya agregadas.
+
+Los rankings de las páginas solo muestran los K primeros, así que no hace
+falta ordenar la tabla entera: np.argpartition separa los K mayores en tiempo
+lineal y solo esos K se ordenan. top_k_por_grupo hace el ranking de todos los
+grupos a la vez (p. ej. las familias más vendidas de cada estado) con una
+sola ordenación vectorizada de la tabla agregada, sin un bucle por grupo; con
+ello el cubo guarda precalculados los rankings de cada estado.
+
+Los empates conservan el orden de la tabla y los NaN van al final, como en
+sort_values(ascending=False).
+"""
+import numpy as np
+import pandas as pd
+
+# Posiciones de los rankings de las páginas
+TOP_K = 10
+
+
+def _claves(valores):
+    """Claves ascendentes equivalentes a ordenar los valores de mayor a menor."""
+    claves = -np.asarray(valores, dtype="float64")
+    claves[np.isnan(claves)] = np.inf
+    return claves
+
+
+def posiciones_top(valores, k=TOP_K):
+    """Posiciones de los k valores mayores, de mayor a menor."""
+    claves = _claves(valores)
+    k = max(0, min(k, len(claves)))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(claves):
+        # Los k menores de claves, sin ordenar el resto; al reordenarlos por
+        # posición los empates quedan en el orden de la tabla
+        seleccion = np.sort(np.argpartition(claves, k - 1)[:k])
+    else:
+        seleccion = np.arange(len(claves))
+    return seleccion[np.argsort(claves[seleccion], kind="stable")]
+
+
+def top_k(tabla, k=TOP_K, columna=None):
+    """Las k entradas mayores de una serie (o de tabla[columna]), de mayor a menor."""
+    valores = tabla if columna is None else tabla[columna]
+    return tabla.iloc[posiciones_top(valores.to_numpy(), k)]
+
+
+def top_k_por_grupo(tabla, grupo, columna, k=TOP_K):
+    """Las k filas con mayor columna de cada grupo, ordenadas por grupo y de mayor a menor.
+
+    La columna "puesto" (1, 2, ...) indica la posición dentro del grupo. Las
+    filas sin grupo se descartan.
+    """
+    codigos, _ = pd.factorize(tabla[grupo], sort=True)
+    orden = np.lexsort((_claves(tabla[columna].to_numpy()), codigos))
+    orden = orden[codigos[orden] >= 0]
+    codigos = codigos[orden]
+    # Posición de cada fila dentro de su grupo: índice menos el inicio del grupo
+    cambios = np.flatnonzero(codigos[1:] != codigos[:-1]) + 1
+    inicios = np.r_[0, cambios]
+    longitudes = np.diff(np.r_[inicios, len(orden)])
+    puesto = np.arange(len(orden)) - np.repeat(inicios, longitudes)
+
+    dentro = puesto < k
+    resultado = tabla.iloc[orden[dentro]].reset_index(drop=True)
+    resultado["puesto"] = (puesto[dentro] + 1).astype("int16")
+    return resultado
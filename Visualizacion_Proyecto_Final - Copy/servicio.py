@@ -0,0 +1,351 @@
+"""Servicio local de agregados para servir el dashboard con varios procesos.
+
+Streamlit ejecuta las recargas de todas las sesiones en un único proceso de
+Python, así que con muchos usuarios compiten por el GIL. En este modo el cubo
+lo construye y lo guarda un solo proceso, el servicio, y el dashboard se
+lanza en varios procesos (uno por núcleo, detrás de un proxy con sesiones
+fijas, p. ej. nginx con ip_hash) que solo le piden tablas ya agregadas:
+
+    python servicio.py [--puerto 8765] [--motor memoria]
+    VENTAS_SERVICIO=http://127.0.0.1:8765 streamlit run fichero.py --server.port 8501
+    VENTAS_SERVICIO=http://127.0.0.1:8765 streamlit run fichero.py --server.port 8502
+
+o todo a la vez con python servicio.py --dashboards 4 (puertos 8501 a 8504).
+
+Rutas (GET). Todas admiten &filtro=<json> con el filtro de la barra lateral
+y, salvo /version, &version=<versión> (409 si los datos han cambiado):
+- /version: versión de los datos y filas que pasan el filtro. Si ha cambiado
+  alguna parte CSV el cubo se reconstruye aquí.
+- /tabla?nombre=tiendas[&valor=Pichincha]: una tabla del cubo o el corte de
+  un valor de sus particiones.
+- /series: ventas diarias de cada tienda x familia de todo el histórico (sin
+  filtro), para la página de pronóstico (pronostico.series_a_arrow).
+
+Las tablas viajan en formato Arrow IPC: llegan ya tipadas (categorías
+incluidas) y sin parsear texto. El servicio solo escucha en 127.0.0.1.
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from agregados import (
+    agregar_base, base_por_bloques, combinar_bases, completar_cubo, particion
+)
+from consultas import base_duckdb, base_polars
+from datos import (
+    actualizar_almacen, cargar_parte, firma_fuentes, pa, tabla_compartida, version_datos
+)
+from filtros import Filtro, IndiceVentas
+from pronostico import series_a_arrow, series_de_arrow, series_diarias
+
+logger = logging.getLogger(__name__)
+
+PUERTO = 8765
+
+# Cubos filtrados que guarda el servicio (los últimos usados)
+MAX_CUBOS_FILTRADOS = 32
+
+# Niveles base de una parte con cada motor (VENTAS_MODO_CARGA de fichero.py)
+MOTORES = {
+    "memoria": lambda ruta: agregar_base(cargar_parte(ruta)),
+    "bloques": base_por_bloques,
+    "duckdb": lambda ruta: base_duckdb([ruta]),
+    "polars": lambda ruta: base_polars([ruta]),
+}
+
+
+def filtro_a_json(filtro):
+    """Filtro de la barra lateral como texto para la URL (None si no hay)."""
+    if filtro is None:
+        return None
+    return json.dumps({
+        "desde": filtro.desde.isoformat(),
+        "hasta": filtro.hasta.isoformat(),
+        "tiendas": [int(tienda) for tienda in filtro.tiendas],
+        "estados": list(filtro.estados),
+        "familias": list(filtro.familias),
+    })
+
+
+def filtro_de_json(texto):
+    if not texto:
+        return None
+    datos = json.loads(texto)
+    return Filtro(
+        datetime.date.fromisoformat(datos["desde"]),
+        datetime.date.fromisoformat(datos["hasta"]),
+        tuple(datos["tiendas"]), tuple(datos["estados"]), tuple(datos["familias"])
+    )
+
+
+def a_arrow(tabla):
+    """Tabla Arrow, DataFrame o Series (con su índice) como bytes Arrow IPC."""
+    if not isinstance(tabla, pa.Table):
+        tabla = _de_pandas(tabla)
+    salida = io.BytesIO()
+    with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return salida.getvalue()
+
+
+def _de_pandas(tabla):
+    serie = isinstance(tabla, pd.Series)
+    tabla = pa.Table.from_pandas(tabla.to_frame() if serie else tabla, preserve_index=True)
+    return tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}), b"serie": b"1" if serie else b"0"
+    })
+
+
+def de_arrow(contenido):
+    """Inverso de a_arrow."""
+    tabla = pa.ipc.open_stream(contenido).read_all()
+    df = tabla.to_pandas()
+    return df.iloc[:, 0] if tabla.schema.metadata.get(b"serie") == b"1" else df
+
+
+class ServicioAgregados:
+    """Cubo (y cubos filtrados) de la versión actual de los datos."""
+
+    def __init__(self, motor="memoria"):
+        self.motor = MOTORES[motor]
+        self.usa_almacen = motor != "bloques"
+        self.lock = threading.Lock()
+        self.firma = None
+        self.cubo = None
+        self.indice = None
+        self.series = None
+        self.filtrados = OrderedDict()
+
+    def actualizar(self):
+        """Versión actual; reconstruye el cubo si ha cambiado alguna parte."""
+        firma = firma_fuentes()
+        with self.lock:
+            if firma != self.firma:
+                rutas = [ruta for ruta, _, _ in firma]
+                if self.usa_almacen:
+                    actualizar_almacen(rutas)
+                self.cubo = completar_cubo(*combinar_bases([self.motor(ruta) for ruta in rutas]))
+                self.firma = firma
+                self.indice = None
+                self.series = None
+                self.filtrados.clear()
+                logger.info("Cubo de la versión %s listo", version_datos(firma))
+            return version_datos(self.firma)
+
+    def cubo_de(self, filtro):
+        """Cubo completo o filtrado (None si ninguna fila pasa el filtro)."""
+        if filtro is None:
+            return self.cubo
+        with self.lock:
+            if filtro in self.filtrados:
+                self.filtrados.move_to_end(filtro)
+                return self.filtrados[filtro]
+            if self.indice is None:
+                self.indice = IndiceVentas(tabla_compartida([ruta for ruta, _, _ in self.firma]))
+            indice = self.indice
+        filas = indice.filtrar(filtro)
+        cubo = None if filas.empty else completar_cubo(*agregar_base(filas))
+        with self.lock:
+            self.filtrados[filtro] = cubo
+            while len(self.filtrados) > MAX_CUBOS_FILTRADOS:
+                self.filtrados.popitem(last=False)
+        return cubo
+
+    def series_pronostico(self):
+        """Series del pronóstico de la versión actual, en Arrow (se calculan una vez)."""
+        with self.lock:
+            if self.series is None:
+                rutas = [ruta for ruta, _, _ in self.firma]
+                self.series = series_a_arrow(series_diarias(tabla_compartida(rutas)))
+            return self.series
+
+    def tabla(self, cubo, nombre, valor=None):
+        # Solo las tablas: "particiones" o "carga" no son tablas que enviar
+        if not isinstance(cubo[nombre], (pd.DataFrame, pd.Series)):
+            raise KeyError(nombre)
+        if valor is None:
+            return cubo[nombre]
+        # Las claves de las particiones pueden ser números (tiendas) o textos
+        clave = next((k for k in cubo["particiones"][nombre] if str(k) == valor), valor)
+        return particion(cubo, nombre, clave)
+
+
+class ErrorServicio(Exception):
+    """Fallo del propio servicio (p. ej. al releer los datos), no de la petición."""
+
+
+def _requerido(parametros, nombre):
+    """Parámetro obligatorio de la petición (ValueError, respuesta 400, si falta)."""
+    if nombre not in parametros:
+        raise ValueError(f"Falta el parámetro {nombre}")
+    return parametros[nombre]
+
+
+def _del_servicio(funcion, *args):
+    """Llama a funcion convirtiendo cualquier error en ErrorServicio (respuesta 500)."""
+    try:
+        return funcion(*args)
+    except Exception as e:
+        raise ErrorServicio(str(e)) from e
+
+
+class Manejador(BaseHTTPRequestHandler):
+    servicio = None
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        parametros = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            filtro = filtro_de_json(parametros.pop("filtro", None))
+            # Una parte CSV a medio copiar puede hacer fallar la reconstrucción
+            version = _del_servicio(self.servicio.actualizar)
+            if url.path == "/version":
+                cubo = _del_servicio(self.servicio.cubo_de, filtro)
+                filas = 0 if cubo is None else int(cubo["year"]["n_filas"].sum())
+                contenido = json.dumps({"version": version, "filas": filas}).encode()
+                return self._responder(200, contenido, "application/json")
+            if parametros.pop("version", version) != version:
+                return self._responder(409, b"Los datos han cambiado", "text/plain")
+            if url.path == "/series":
+                contenido = a_arrow(_del_servicio(self.servicio.series_pronostico))
+                return self._responder(200, contenido, "application/vnd.apache.arrow.stream")
+            cubo = _del_servicio(self.servicio.cubo_de, filtro)
+            if cubo is None:
+                return self._responder(404, b"Ninguna fila pasa el filtro", "text/plain")
+            if url.path == "/tabla":
+                nombre = _requerido(parametros, "nombre")
+                tabla = self.servicio.tabla(cubo, nombre, parametros.get("valor"))
+            else:
+                return self._responder(404, b"Ruta desconocida", "text/plain")
+            contenido = a_arrow(tabla)
+        except ErrorServicio as e:
+            logger.exception("Error atendiendo %s", self.path)
+            return self._responder(500, f"Error del servicio: {e}".encode(), "text/plain")
+        except KeyError as e:
+            return self._responder(404, f"No existe: {e}".encode(), "text/plain")
+        except (ValueError, TypeError) as e:
+            return self._responder(400, str(e).encode(), "text/plain")
+        except Exception as e:
+            # Cualquier otro fallo se responde en lugar de cortar la conexión
+            logger.exception("Error atendiendo %s", self.path)
+            return self._responder(500, f"Error del servicio: {e}".encode(), "text/plain")
+        self._responder(200, contenido, "application/vnd.apache.arrow.stream")
+
+    def _responder(self, estado, contenido, tipo):
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *args):
+        logger.debug(formato, *args)
+
+
+def _descargar(url, ruta, parametros):
+    """Cuerpo de una respuesta del servicio (RuntimeError si los datos han cambiado)."""
+    try:
+        consulta = urllib.parse.urlencode(parametros)
+        with urllib.request.urlopen(f"{url}{ruta}?{consulta}") as r:
+            return r.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 409:
+            raise RuntimeError("Los datos han cambiado: vuelve a cargar la página") from e
+        raise
+
+
+def consultar_series(url, version):
+    """Series del pronóstico de una versión de los datos, calculadas por el servicio."""
+    contenido = _descargar(url, "/series", {"version": version})
+    return series_de_arrow(pa.ipc.open_stream(contenido).read_all())
+
+
+def consultar_version(url, filtro=None):
+    """(versión de los datos, filas que pasan el filtro) según el servicio."""
+    consulta = {"filtro": filtro_a_json(filtro)} if filtro is not None else {}
+    with urllib.request.urlopen(f"{url}/version?{urllib.parse.urlencode(consulta)}") as r:
+        respuesta = json.load(r)
+    return respuesta["version"], respuesta["filas"]
+
+
+class CuboRemoto:
+    """El cubo de una versión (y filtro) del servicio, con la interfaz de un dict.
+
+    Cada tabla o partición se pide una sola vez y se guarda en el objeto, que
+    fichero.py comparte entre las sesiones del proceso (st.cache_resource).
+    """
+
+    def __init__(self, url, version, filtro=None):
+        self.url = url
+        self.version = version
+        self.filtro = filtro
+        self.tablas = {}
+
+    def _pedir(self, ruta, **parametros):
+        parametros["version"] = self.version
+        if self.filtro is not None:
+            parametros["filtro"] = filtro_a_json(self.filtro)
+        return de_arrow(_descargar(self.url, ruta, parametros))
+
+    def __getitem__(self, nombre):
+        if nombre not in self.tablas:
+            self.tablas[nombre] = self._pedir("/tabla", nombre=nombre)
+        return self.tablas[nombre]
+
+    def particion(self, nombre, valor):
+        clave = (nombre, valor)
+        if clave not in self.tablas:
+            self.tablas[clave] = self._pedir("/tabla", nombre=nombre, valor=valor)
+        return self.tablas[clave]
+
+
+def lanzar_dashboards(n, url, puerto=8501):
+    """Arranca n procesos de Streamlit que usan el servicio (puertos consecutivos)."""
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fichero.py")
+    entorno = {**os.environ, "VENTAS_SERVICIO": url}
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", app,
+             "--server.port", str(puerto + i), "--server.headless", "true"],
+            env=entorno
+        )
+        for i in range(n)
+    ]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Servicio de agregados del dashboard")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--motor", default=os.environ.get("VENTAS_MODO_CARGA", "memoria"),
+                        choices=sorted(MOTORES))
+    parser.add_argument("--dashboards", type=int, default=0,
+                        help="procesos de Streamlit que se lanzan detrás del servicio")
+    args = parser.parse_args()
+    if pa is None:
+        raise ImportError("El servicio necesita el paquete pyarrow (pip install pyarrow)")
+
+    Manejador.servicio = ServicioAgregados(args.motor)
+    Manejador.servicio.actualizar()
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.puerto), Manejador)
+    url = f"http://127.0.0.1:{args.puerto}"
+    procesos = lanzar_dashboards(args.dashboards, url) if args.dashboards else []
+    logger.info("Servicio de agregados en %s", url)
+    try:
+        servidor.serve_forever()
+    finally:
+        for proceso in procesos:
+            proceso.terminate()